@@ -0,0 +1,187 @@
+"""
+责任链结果缓存 - 按请求内容寻址的两级缓存（进程内 LRU + Redis）
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from handlers import BaseHandler, ProcessingRequest, json_default
+
+logger = logging.getLogger(__name__)
+
+# 缓存配置
+CHAIN_RESULT_CACHE = os.getenv("CHAIN_RESULT_CACHE", "off")  # off / local / redis
+CHAIN_RESULT_CACHE_REDIS_URL = os.getenv("CHAIN_RESULT_CACHE_REDIS_URL", "redis://redis:6379/1")
+CHAIN_RESULT_CACHE_TTL = int(os.getenv("CHAIN_RESULT_CACHE_TTL", "3600"))
+CHAIN_RESULT_CACHE_LOCAL_ENTRIES = int(os.getenv("CHAIN_RESULT_CACHE_LOCAL_ENTRIES", "1024"))
+CHAIN_RESULT_CACHE_LOCAL_BYTES = int(os.getenv("CHAIN_RESULT_CACHE_LOCAL_BYTES", str(64 * 1024 * 1024)))
+CHAIN_RESULT_CACHE_REDIS_ENTRIES = int(os.getenv("CHAIN_RESULT_CACHE_REDIS_ENTRIES", "100000"))
+CHAIN_RESULT_CACHE_MAX_ENTRY_BYTES = int(os.getenv("CHAIN_RESULT_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+
+
+def make_cache_key(request: ProcessingRequest, namespace: str,
+                   handlers: Iterable[BaseHandler]) -> str:
+    """根据请求类型、数据、链类型和处理器版本计算稳定的缓存键"""
+    content = json.dumps({
+        'request_type': request.request_type.value,
+        'data': request.data,
+        'chain': namespace,
+        'handlers': [[handler.name, handler.version] for handler in handlers]
+    }, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=json_default)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class LocalLRUCache:
+    """进程内 LRU 缓存，同时限制条目数和总字节数"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, str]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = value
+            self._bytes += len(value)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisResultCache:
+    """Redis 缓存层：条目带 TTL，并通过有序集合索引限制条目总数"""
+
+    def __init__(self, url: str, ttl: int, max_entries: int, prefix: str = "chain_result:"):
+        self.url = url
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self.index_key = prefix + "index"
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.url)
+        return self._client
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, value, ex=self.ttl)
+        pipe.zadd(self.index_key, {key: now})
+        pipe.zremrangebyscore(self.index_key, 0, now - self.ttl)
+        pipe.zcard(self.index_key)
+        size = pipe.execute()[-1]
+
+        # 超出容量时淘汰最早写入的条目
+        if size > self.max_entries:
+            oldest = self.client.zrange(self.index_key, 0, size - self.max_entries - 1)
+            if oldest:
+                pipe = self.client.pipeline()
+                pipe.delete(*[self.prefix + k.decode('utf-8') for k in oldest])
+                pipe.zrem(self.index_key, *oldest)
+                pipe.execute()
+
+
+class ChainResultCache:
+    """责任链结果缓存：先查进程内 LRU，再查 Redis，Redis 命中时回填本地"""
+
+    def __init__(self, local: Optional[LocalLRUCache] = None,
+                 remote: Optional[RedisResultCache] = None,
+                 max_entry_bytes: int = CHAIN_RESULT_CACHE_MAX_ENTRY_BYTES):
+        self.local = local
+        self.remote = remote
+        self.max_entry_bytes = max_entry_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """获取缓存的处理结果"""
+        value = self.local.get(key) if self.local is not None else None
+        if value is None and self.remote is not None:
+            try:
+                value = self.remote.get(key)
+            except Exception as e:
+                logger.warning(f"读取 Redis 结果缓存失败: {e}")
+            if value is not None and self.local is not None:
+                self.local.set(key, value)
+
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, result: Dict[str, Any]):
+        """缓存处理结果，超过单条大小限制的结果不缓存"""
+        value = json.dumps(result, ensure_ascii=False, default=json_default)
+        if len(value) > self.max_entry_bytes:
+            return
+        if self.local is not None:
+            self.local.set(key, value)
+        if self.remote is not None:
+            try:
+                self.remote.set(key, value)
+            except Exception as e:
+                logger.warning(f"写入 Redis 结果缓存失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'local_entries': len(self.local) if self.local is not None else 0
+        }
+
+
+_result_cache: Optional[ChainResultCache] = None
+
+
+def get_result_cache() -> Optional[ChainResultCache]:
+    """按环境变量配置获取进程内共享的结果缓存，未启用时返回 None"""
+    global _result_cache
+    if CHAIN_RESULT_CACHE == "off":
+        return None
+    if _result_cache is None:
+        remote = None
+        if CHAIN_RESULT_CACHE == "redis":
+            remote = RedisResultCache(CHAIN_RESULT_CACHE_REDIS_URL, CHAIN_RESULT_CACHE_TTL,
+                                      CHAIN_RESULT_CACHE_REDIS_ENTRIES)
+        _result_cache = ChainResultCache(
+            local=LocalLRUCache(CHAIN_RESULT_CACHE_LOCAL_ENTRIES, CHAIN_RESULT_CACHE_LOCAL_BYTES),
+            remote=remote
+        )
+    return _result_cache
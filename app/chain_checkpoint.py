@@ -0,0 +1,163 @@
+"""
+责任链检查点 - 每完成一个阶段保存一次请求状态，任务重试或重新投递时从断点继续
+"""
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from handlers import BaseHandler, ProcessingRequest, json_default
+
+logger = logging.getLogger(__name__)
+
+# 检查点配置
+CHAIN_CHECKPOINT = os.getenv("CHAIN_CHECKPOINT", "off")  # off / memory / redis
+CHAIN_CHECKPOINT_REDIS_URL = os.getenv("CHAIN_CHECKPOINT_REDIS_URL", "redis://redis:6379/2")
+CHAIN_CHECKPOINT_TTL = int(os.getenv("CHAIN_CHECKPOINT_TTL", "86400"))
+
+
+class InMemoryCheckpointStore:
+    """进程内检查点存储（用于测试和单进程部署）"""
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._entries[key]
+                return None
+            return entry[0]
+
+    def set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisCheckpointStore:
+    """Redis 检查点存储，worker 被杀死后其他 worker 仍能读取"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.url)
+        return self._client
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key: str, value: str, ttl: int):
+        self.client.set(key, value, ex=ttl)
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+
+def stage_signature(stages: Sequence[Sequence[BaseHandler]]) -> List[List[List[str]]]:
+    """执行计划的签名（各阶段处理器名称和版本），计划变化后旧检查点失效"""
+    return [[[handler.name, handler.version] for handler in stage] for stage in stages]
+
+
+class ChainCheckpoint:
+    """单次链执行的检查点
+
+    链每完成一个阶段调用 ``save`` 保存已完成的阶段数和请求状态；重新执行时
+    ``restore`` 返回已完成的阶段数和恢复后的请求，链跳过这些阶段。执行计划
+    （处理器名称、版本）或请求类型与检查点不一致时，检查点被忽略。
+    存储读写失败只记录日志，不影响链的执行。
+    """
+
+    def __init__(self, store, key: str, ttl: int = CHAIN_CHECKPOINT_TTL):
+        self.store = store
+        self.key = key
+        self.ttl = ttl
+
+    def restore(self, request: ProcessingRequest,
+                stages: Sequence[Sequence[BaseHandler]]) -> Tuple[int, ProcessingRequest]:
+        """读取检查点，返回 (已完成的阶段数, 请求)"""
+        try:
+            value = self.store.get(self.key)
+        except Exception as e:
+            logger.warning(f"读取检查点失败 {self.key}: {e}")
+            return 0, request
+        if value is None:
+            return 0, request
+
+        checkpoint = json.loads(value)
+        state = checkpoint['request']
+        if (checkpoint['signature'] != stage_signature(stages) or
+                state['request_type'] != request.request_type.value):
+            logger.info(f"执行计划已变化，忽略检查点 {self.key}")
+            return 0, request
+
+        completed = checkpoint['completed']
+        restored = ProcessingRequest.from_state(state)
+        restored.deadline = request.deadline
+        restored.quality_profile = request.quality_profile
+        restored.cross_record_state = request.cross_record_state
+        restored.metadata['resumed_from_stage'] = completed
+        logger.info(f"从检查点恢复 {self.key}，跳过 {completed} 个已完成阶段")
+        return completed, restored
+
+    def save(self, completed: int, request: ProcessingRequest,
+             stages: Sequence[Sequence[BaseHandler]]):
+        """保存已完成的阶段数和请求状态"""
+        value = json.dumps({
+            'signature': stage_signature(stages),
+            'completed': completed,
+            'request': request.to_state()
+        }, ensure_ascii=False, default=json_default)
+        try:
+            self.store.set(self.key, value, self.ttl)
+        except Exception as e:
+            logger.warning(f"保存检查点失败 {self.key}: {e}")
+
+    def clear(self):
+        """链执行结束后删除检查点"""
+        try:
+            self.store.delete(self.key)
+        except Exception as e:
+            logger.warning(f"删除检查点失败 {self.key}: {e}")
+
+
+_checkpoint_store = None
+
+
+def get_checkpoint_store():
+    """按环境变量配置获取进程内共享的检查点存储，未启用时返回 None"""
+    global _checkpoint_store
+    if CHAIN_CHECKPOINT == "off":
+        return None
+    if _checkpoint_store is None:
+        if CHAIN_CHECKPOINT == "redis":
+            _checkpoint_store = RedisCheckpointStore(CHAIN_CHECKPOINT_REDIS_URL)
+        else:
+            _checkpoint_store = InMemoryCheckpointStore()
+    return _checkpoint_store
+
+
+def get_checkpoint(task_id: Optional[str]) -> Optional[ChainCheckpoint]:
+    """获取 Celery 任务的检查点（按任务 ID，重新投递时 ID 不变），未启用时返回 None"""
+    store = get_checkpoint_store()
+    if store is None or not task_id:
+        return None
+    return ChainCheckpoint(store, f"chain_checkpoint:{task_id}")
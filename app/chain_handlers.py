@@ -1,15 +1,22 @@
 """
 责任链设计模式实现 - 用于处理不同类型的数据处理任务
 """
+import os
 import time
+import asyncio
 import logging
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Union
 
 # 导入基础类
-from handlers import BaseHandler, ProcessingRequest, RequestType
+from handlers import BaseHandler, ProcessingRequest, RequestType, materialize, run_coroutine
+from chain_cache import ChainResultCache, make_cache_key
+from chain_checkpoint import ChainCheckpoint
 
 # 导入新的模块化处理器
 from handlers.validation_handler import DataValidationHandler
+from handlers.validation_schema import get_validator
 from handlers.transformation_handler import DataTransformationHandler
 from handlers.enrichment_handler import DataEnrichmentHandler
 from handlers.export_handler import DataExportHandler, ReportExportHandler
@@ -20,6 +27,238 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _has_cross_record_rules(request: ProcessingRequest) -> bool:
+    """验证请求是否包含跨记录规则（唯一性、引用），规则无法解析时同样视为包含"""
+    if request.request_type != RequestType.DATA_VALIDATION:
+        return False
+    validation_rules = request.data.get('validation_rules')
+    if not validation_rules:
+        return False
+    try:
+        return bool(get_validator(validation_rules).cross_record_rules())
+    except Exception:
+        return True
+
+
+class CompiledChain:
+    """预编译的责任链
+
+    按 RequestType 预先计算出每种请求实际可能命中的处理器列表（执行计划），
+    运行时直接按计划循环执行，不再递归遍历整条链，也不会调用不匹配的处理器。
+    """
+    
+    def __init__(self, handlers: List[BaseHandler]):
+        if not handlers:
+            raise ValueError("处理器列表不能为空")
+        self.handlers: Tuple[BaseHandler, ...] = tuple(handlers)
+        self._plans: Dict[RequestType, Tuple[BaseHandler, ...]] = {
+            request_type: tuple(
+                handler for handler in self.handlers
+                if handler.request_types is None or request_type in handler.request_types
+            )
+            for request_type in RequestType
+        }
+    
+    @classmethod
+    def from_chain(cls, chain: Union[BaseHandler, 'CompiledChain']) -> 'CompiledChain':
+        """将链头处理器（或已编译的链）转换为编译后的链"""
+        if isinstance(chain, CompiledChain):
+            return chain
+        return cls(list(chain.iter_chain()))
+    
+    def plan_for(self, request_type: RequestType) -> Tuple[BaseHandler, ...]:
+        """获取指定请求类型的执行计划"""
+        return self._plans[request_type]
+    
+    def requires_event_loop(self, request_type: RequestType) -> bool:
+        """执行计划中是否包含异步处理器"""
+        return any(handler.is_async for handler in self._plans[request_type])
+    
+    def stages_for(self, request_type: RequestType) -> Tuple[Tuple[BaseHandler, ...], ...]:
+        """获取检查点使用的阶段划分（每个处理器一个阶段）"""
+        return tuple((handler,) for handler in self._plans[request_type])
+    
+    def handle(self, request: ProcessingRequest,
+               checkpoint: Optional[ChainCheckpoint] = None) -> ProcessingRequest:
+        """按执行计划处理请求，提供检查点时跳过已完成的阶段并在每个阶段后保存"""
+        plan = self._plans[request.request_type]
+        start = 0
+        if checkpoint is not None:
+            stages = self.stages_for(request.request_type)
+            start, request = checkpoint.restore(request, stages)
+        
+        for position in range(start, len(plan)):
+            handler = plan[position]
+            # 条件型处理器（如 ReportExportHandler）仍需要检查请求内容
+            if handler.can_handle(request):
+                request = handler._run(request)
+                if checkpoint is not None:
+                    checkpoint.save(position + 1, request, stages)
+        return request
+    
+    async def ahandle(self, request: ProcessingRequest,
+                      checkpoint: Optional[ChainCheckpoint] = None) -> ProcessingRequest:
+        """在事件循环中按执行计划处理请求，同步处理器在线程中执行"""
+        plan = self._plans[request.request_type]
+        start = 0
+        if checkpoint is not None:
+            stages = self.stages_for(request.request_type)
+            start, request = checkpoint.restore(request, stages)
+        
+        for position in range(start, len(plan)):
+            handler = plan[position]
+            if handler.can_handle(request):
+                request = await handler._arun(request)
+                if checkpoint is not None:
+                    checkpoint.save(position + 1, request, stages)
+        return request
+    
+    def handle_batch(self, requests: List[ProcessingRequest]) -> List[ProcessingRequest]:
+        """逐个阶段批量处理请求
+
+        每个处理器一次接收所有计划中包含它的请求，单条请求经过各处理器的顺序与
+        ``handle`` 相同。
+        """
+        for handler in self.handlers:
+            batch = [request for request in requests
+                     if handler in self._plans[request.request_type]]
+            if batch:
+                handler.handle_batch(batch)
+        return requests
+
+
+# 表示读写全部字段的通配符
+ALL_FIELDS = '*'
+
+# DAG 链并行阶段使用的线程池（每个进程一个，按需创建）
+_stage_executor: Optional[ThreadPoolExecutor] = None
+_stage_executor_lock = threading.Lock()
+
+
+def _get_stage_executor() -> ThreadPoolExecutor:
+    """获取并行阶段线程池"""
+    global _stage_executor
+    if _stage_executor is None:
+        with _stage_executor_lock:
+            if _stage_executor is None:
+                max_workers = int(os.getenv("CHAIN_STAGE_WORKERS", "4"))
+                _stage_executor = ThreadPoolExecutor(max_workers=max_workers,
+                                                     thread_name_prefix="chain-stage")
+    return _stage_executor
+
+
+class ChainStage:
+    """DAG 链中的阶段：处理器及其读取/写入的 request.data 字段
+
+    未显式声明时使用处理器类上的 ``inputs``/``outputs``，
+    两者为 None 时视为读写全部字段（与前后所有阶段都存在依赖）。
+    """
+    
+    def __init__(self, handler: BaseHandler, inputs: Optional[Tuple[str, ...]] = None,
+                 outputs: Optional[Tuple[str, ...]] = None):
+        self.handler = handler
+        inputs = inputs if inputs is not None else handler.inputs
+        outputs = outputs if outputs is not None else handler.outputs
+        self.inputs: FrozenSet[str] = frozenset(inputs if inputs is not None else (ALL_FIELDS,))
+        self.outputs: FrozenSet[str] = frozenset(outputs if outputs is not None else (ALL_FIELDS,))
+    
+    def depends_on(self, earlier: 'ChainStage') -> bool:
+        """判断当前阶段是否必须在前一个阶段之后执行（读后写、写后读、写后写）"""
+        return (_overlaps(earlier.outputs, self.inputs) or
+                _overlaps(earlier.inputs, self.outputs) or
+                _overlaps(earlier.outputs, self.outputs))
+
+
+def _overlaps(a: FrozenSet[str], b: FrozenSet[str]) -> bool:
+    if not a or not b:
+        return False
+    return ALL_FIELDS in a or ALL_FIELDS in b or not a.isdisjoint(b)
+
+
+class DagChain(CompiledChain):
+    """按阶段依赖关系并行执行的责任链
+
+    根据每个阶段声明的输入/输出，把执行计划划分为若干层；同一层内的阶段互不依赖，
+    在线程池（或事件循环）中并行执行。并行阶段使用各自的子请求记录日志，
+    结束后按链中顺序合并，保证日志顺序确定。
+    """
+    
+    def __init__(self, stages: List[Union[BaseHandler, ChainStage]]):
+        stages = [stage if isinstance(stage, ChainStage) else ChainStage(stage) for stage in stages]
+        super().__init__([stage.handler for stage in stages])
+        self.stages: Tuple[ChainStage, ...] = tuple(stages)
+        self._levels: Dict[RequestType, Tuple[Tuple[BaseHandler, ...], ...]] = {
+            request_type: self._compile_levels(request_type) for request_type in RequestType
+        }
+    
+    def _compile_levels(self, request_type: RequestType) -> Tuple[Tuple[BaseHandler, ...], ...]:
+        """把执行计划划分为可并行的层"""
+        planned = [stage for stage in self.stages if stage.handler in self._plans[request_type]]
+        stage_levels: List[int] = []
+        for i, stage in enumerate(planned):
+            level = 0
+            for j in range(i):
+                if stage.depends_on(planned[j]):
+                    level = max(level, stage_levels[j] + 1)
+            stage_levels.append(level)
+        
+        levels: List[List[BaseHandler]] = [[] for _ in range(max(stage_levels, default=-1) + 1)]
+        for stage, level in zip(planned, stage_levels):
+            levels[level].append(stage.handler)
+        return tuple(tuple(level) for level in levels)
+    
+    def levels_for(self, request_type: RequestType) -> Tuple[Tuple[BaseHandler, ...], ...]:
+        """获取指定请求类型的分层执行计划"""
+        return self._levels[request_type]
+    
+    def stages_for(self, request_type: RequestType) -> Tuple[Tuple[BaseHandler, ...], ...]:
+        """获取检查点使用的阶段划分（每层一个阶段）"""
+        return self._levels[request_type]
+    
+    def handle(self, request: ProcessingRequest,
+               checkpoint: Optional[ChainCheckpoint] = None) -> ProcessingRequest:
+        """按层处理请求，同一层内的阶段在线程池中并行执行"""
+        levels = self._levels[request.request_type]
+        start = 0
+        if checkpoint is not None:
+            start, request = checkpoint.restore(request, levels)
+        
+        for position in range(start, len(levels)):
+            handlers = [handler for handler in levels[position] if handler.can_handle(request)]
+            if len(handlers) == 1:
+                request = handlers[0]._run(request)
+            elif handlers:
+                forks = [request.fork() for _ in handlers]
+                executor = _get_stage_executor()
+                list(executor.map(lambda pair: pair[0]._run(pair[1]), zip(handlers, forks)))
+                for fork in forks:
+                    request.merge(fork)
+            if handlers and checkpoint is not None:
+                checkpoint.save(position + 1, request, levels)
+        return request
+    
+    async def ahandle(self, request: ProcessingRequest,
+                      checkpoint: Optional[ChainCheckpoint] = None) -> ProcessingRequest:
+        """在事件循环中按层处理请求，同一层内的阶段并发执行"""
+        levels = self._levels[request.request_type]
+        start = 0
+        if checkpoint is not None:
+            start, request = checkpoint.restore(request, levels)
+        
+        for position in range(start, len(levels)):
+            handlers = [handler for handler in levels[position] if handler.can_handle(request)]
+            if len(handlers) == 1:
+                request = await handlers[0]._arun(request)
+            elif handlers:
+                forks = [request.fork() for _ in handlers]
+                await asyncio.gather(*(handler._arun(fork) for handler, fork in zip(handlers, forks)))
+                for fork in forks:
+                    request.merge(fork)
+            if handlers and checkpoint is not None:
+                checkpoint.save(position + 1, request, levels)
+        return request
+
+
 class ChainBuilder:
     """责任链构建器"""
     
@@ -41,54 +280,257 @@ class ChainBuilder:
             self.handlers[i].set_next(self.handlers[i + 1])
         
         return self.handlers[0]  # 返回第一个处理器
+    
+    def compile(self) -> CompiledChain:
+        """构建并编译责任链"""
+        return CompiledChain.from_chain(self.build())
+    
+    def build_dag(self) -> DagChain:
+        """构建按阶段依赖并行执行的责任链"""
+        return DagChain(self.handlers)
+    
+    @staticmethod
+    def build_standard_chain() -> BaseHandler:
+        """构建标准数据处理链"""
+        return (ChainBuilder()
+                .add_handler(DataValidationHandler())
+                .add_handler(DataTransformationHandler())
+                .add_handler(DataEnrichmentHandler())
+                .add_handler(DataExportHandler())
+                .add_handler(NotificationHandler())
+                .build())
+    
+    @staticmethod
+    def build_custom_chain(handlers: List[BaseHandler]) -> BaseHandler:
+        """构建自定义处理链"""
+        if not handlers:
+            raise ValueError("处理器列表不能为空")
+        
+        builder = ChainBuilder()
+        for handler in handlers:
+            builder.add_handler(handler)
+        return builder.build()
 
 
 class ChainProcessor:
     """责任链处理器"""
     
-    def __init__(self):
-        self.default_chain = None
-        self.custom_chains = {}
+    def __init__(self, chain: Optional[Union[BaseHandler, CompiledChain]] = None,
+                 result_cache: Optional[ChainResultCache] = None,
+                 cache_namespace: str = "default"):
+        """
+        Args:
+            chain: 默认责任链
+            result_cache: 可选的结果缓存
+            cache_namespace: 默认链在缓存键中的名称（通常为链类型）
+        """
+        self.default_chain: Optional[CompiledChain] = None
+        self.custom_chains: Dict[str, CompiledChain] = {}
+        self.result_cache = result_cache
+        self.cache_namespace = cache_namespace
+        if chain is not None:
+            self.set_default_chain(chain)
     
-    def set_default_chain(self, chain: BaseHandler):
+    def set_default_chain(self, chain: Union[BaseHandler, CompiledChain]):
         """设置默认责任链"""
-        self.default_chain = chain
+        self.default_chain = CompiledChain.from_chain(chain)
     
-    def add_custom_chain(self, name: str, chain: BaseHandler):
+    def add_custom_chain(self, name: str, chain: Union[BaseHandler, CompiledChain]):
         """添加自定义责任链"""
-        self.custom_chains[name] = chain
+        self.custom_chains[name] = CompiledChain.from_chain(chain)
     
-    def process(self, request: ProcessingRequest, chain_name: Optional[str] = None) -> ProcessingRequest:
-        """处理请求"""
-        # 选择责任链
+    def _select_chain(self, chain_name: Optional[str] = None) -> Optional[CompiledChain]:
+        """选择责任链"""
         if chain_name and chain_name in self.custom_chains:
-            chain = self.custom_chains[chain_name]
-        elif self.default_chain:
-            chain = self.default_chain
-        else:
+            return self.custom_chains[chain_name]
+        return self.default_chain
+    
+    def _cache_lookup(self, request: ProcessingRequest,
+                      chain_name: Optional[str] = None) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """查找缓存结果，返回 (缓存键, 缓存结果)
+
+        未启用缓存、请求设置了 no_cache、请求需要计入数据质量草图、请求的验证规则包含跨记录规则
+        （结果取决于批次中的其他记录和数据库状态）、或执行计划中有不可缓存（有副作用）的处理器时，
+        缓存键为 None。
+        """
+        chain = self._select_chain(chain_name)
+        if (self.result_cache is None or chain is None or request.metadata.get('no_cache') or
+                request.quality_profile is not None or _has_cross_record_rules(request)):
+            return None, None
+        
+        plan = chain.plan_for(request.request_type)
+        if not all(handler.cacheable for handler in plan):
+            return None, None
+        
+        namespace = chain_name if chain_name in self.custom_chains else self.cache_namespace
+        cache_key = make_cache_key(request, namespace, plan)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            cached['request_id'] = id(request)
+            cached['metadata'] = dict(request.metadata, cache_hit=True)
+        return cache_key, cached
+    
+    def _cache_store(self, cache_key: Optional[str], result: Dict[str, Any]):
+        """缓存成功且完整（没有跳过阶段）的处理结果"""
+        if cache_key is not None and result['success'] and not result['skipped_stages']:
+            self.result_cache.set(cache_key, result)
+    
+    def process(self, request: ProcessingRequest, chain_name: Optional[str] = None,
+                checkpoint: Optional[ChainCheckpoint] = None) -> ProcessingRequest:
+        """处理请求
+
+        提供检查点时，每完成一个阶段保存一次状态，重新执行时跳过已完成的阶段；
+        整条链执行结束后删除检查点。
+        """
+        # 选择责任链
+        chain = self._select_chain(chain_name)
+        if chain is None:
             request.add_error("ChainProcessor", "未找到可用的责任链")
             return request
         
         # 执行处理
         start_time = time.time()
-        result = chain.handle(request)
+        request.start_budget()
+        result = chain.handle(request, checkpoint)
         processing_time = time.time() - start_time
+        if checkpoint is not None:
+            checkpoint.clear()
         
         # 添加处理时间到元数据
         result.metadata['processing_time'] = processing_time
-        result.metadata['total_handlers'] = len(result.processing_log)
+        result.metadata['total_handlers'] = result.log_count
+        if result.deadline is not None:
+            result.metadata['budget_remaining_ms'] = result.remaining_budget_ms()
+        
+        return result
+    
+    async def aprocess(self, request: ProcessingRequest, chain_name: Optional[str] = None,
+                       checkpoint: Optional[ChainCheckpoint] = None) -> ProcessingRequest:
+        """在事件循环中处理请求"""
+        chain = self._select_chain(chain_name)
+        if chain is None:
+            request.add_error("ChainProcessor", "未找到可用的责任链")
+            return request
+        
+        start_time = time.time()
+        request.start_budget()
+        result = await chain.ahandle(request, checkpoint)
+        processing_time = time.time() - start_time
+        if checkpoint is not None:
+            checkpoint.clear()
+        
+        result.metadata['processing_time'] = processing_time
+        result.metadata['total_handlers'] = result.log_count
+        if result.deadline is not None:
+            result.metadata['budget_remaining_ms'] = result.remaining_budget_ms()
+        
+        return result
+    
+    def process_batch(self, requests: List[ProcessingRequest],
+                      chain_name: Optional[str] = None) -> List[ProcessingRequest]:
+        """按阶段批量处理请求"""
+        chain = self._select_chain(chain_name)
+        if chain is None:
+            for request in requests:
+                request.add_error("ChainProcessor", "未找到可用的责任链")
+            return requests
         
+        start_time = time.time()
+        for request in requests:
+            request.start_budget()
+        chain.handle_batch(requests)
+        processing_time = time.time() - start_time
+        
+        # 批次耗时均摊到每个请求
+        for request in requests:
+            request.metadata['processing_time'] = processing_time / len(requests)
+            request.metadata['batch_processing_time'] = processing_time
+            request.metadata['total_handlers'] = request.log_count
+            if request.deadline is not None:
+                request.metadata['budget_remaining_ms'] = request.remaining_budget_ms()
+        
+        return requests
+    
+    def process_request(self, request: ProcessingRequest, chain_name: Optional[str] = None,
+                        checkpoint: Optional[ChainCheckpoint] = None) -> Dict[str, Any]:
+        """处理请求并返回详细结果
+
+        执行计划中包含异步处理器时，整条链在事件循环中执行，
+        这样 I/O 等待期间不会阻塞同步处理器所在的线程。
+        """
+        cache_key, cached = self._cache_lookup(request, chain_name)
+        if cached is not None:
+            return cached
+        
+        chain = self._select_chain(chain_name)
+        if chain is not None and chain.requires_event_loop(request.request_type):
+            result = self.build_result(run_coroutine(self.aprocess(request, chain_name, checkpoint)))
+        else:
+            result = self.build_result(self.process(request, chain_name, checkpoint))
+        
+        self._cache_store(cache_key, result)
         return result
     
+    async def aprocess_request(self, request: ProcessingRequest, chain_name: Optional[str] = None) -> Dict[str, Any]:
+        """在事件循环中处理请求并返回详细结果"""
+        cache_key, cached = self._cache_lookup(request, chain_name)
+        if cached is not None:
+            return cached
+        
+        result = self.build_result(await self.aprocess(request, chain_name))
+        self._cache_store(cache_key, result)
+        return result
+    
+    def process_batch_requests(self, requests: List[ProcessingRequest],
+                               chain_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """批量处理请求并返回详细结果列表（缓存命中的请求不进入处理链）"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+        pending: List[int] = []
+        cache_keys: List[Optional[str]] = []
+        for i, request in enumerate(requests):
+            cache_key, cached = self._cache_lookup(request, chain_name)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+                cache_keys.append(cache_key)
+        
+        if pending:
+            processed = self.process_batch([requests[i] for i in pending], chain_name)
+            for i, cache_key, request in zip(pending, cache_keys, processed):
+                results[i] = self.build_result(request)
+                self._cache_store(cache_key, results[i])
+        
+        return results
+    
+    @staticmethod
+    def build_result(request: ProcessingRequest) -> Dict[str, Any]:
+        """构建处理结果（写时复制的负载视图在这里转换为普通字典）"""
+        return {
+            'request_id': id(request),
+            'request_type': request.request_type.value,
+            'processing_duration': request.metadata.get('processing_time', 0),
+            'total_handlers': request.log_count,
+            'success': request.error_count == 0,
+            'errors': request.errors,
+            'warnings': request.warnings,
+            'skipped_stages': request.metadata.get('skipped_stages', []),
+            'processing_log': request.processing_log,
+            'original_data': materialize(request.data),
+            'processed_data': {
+                'transformed_payload': materialize(request.data.get('transformed_payload')),
+                'enriched_payload': materialize(request.data.get('enriched_payload')),
+                'validation_report': request.data.get('validation_report'),
+                'data_quality': request.data.get('data_quality'),
+                'export_result': request.data.get('export_result'),
+                'notification_result': request.data.get('notification_result')
+            },
+            'metadata': request.metadata
+        }
+    
     def build_standard_chain(self) -> BaseHandler:
         """构建标准数据处理链"""
-        return (ChainBuilder()
-                .add_handler(DataValidationHandler())
-                .add_handler(DataTransformationHandler())
-                .add_handler(DataEnrichmentHandler())
-                .add_handler(DataExportHandler())
-                .add_handler(NotificationHandler())
-                .build())
+        return ChainBuilder.build_standard_chain()
     
     def build_validation_chain(self) -> BaseHandler:
         """构建验证链"""
@@ -0,0 +1,149 @@
+"""
+责任链性能指标 - 每个 worker 进程内按处理器和请求类型统计耗时分布，以及记忆化函数的命中率
+"""
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class LatencyHistogram:
+    """HDR 风格的对数-线性直方图
+
+    以微秒为单位记录耗时，每个 2 的幂区间再细分为 32 个子桶，相对误差约 3%。
+    桶以稀疏字典保存，内存只与出现过的量级有关，与记录次数无关。
+    """
+
+    SUB_BUCKET_BITS = 5
+
+    def __init__(self):
+        self._counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max: Optional[int] = None
+
+    @classmethod
+    def _bucket_floor(cls, value: int) -> int:
+        """值所在桶的下界"""
+        shift = value.bit_length() - (cls.SUB_BUCKET_BITS + 1)
+        if shift <= 0:
+            return value
+        return (value >> shift) << shift
+
+    @classmethod
+    def _bucket_ceiling(cls, floor: int) -> int:
+        """桶内的最大值"""
+        shift = floor.bit_length() - (cls.SUB_BUCKET_BITS + 1)
+        if shift <= 0:
+            return floor
+        return floor + (1 << shift) - 1
+
+    def record(self, seconds: float):
+        """记录一次耗时（秒）"""
+        value = max(0, int(seconds * 1_000_000))
+        floor = self._bucket_floor(value)
+        self._counts[floor] = self._counts.get(floor, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float) -> float:
+        """获取百分位耗时（秒）"""
+        if not self.count:
+            return 0.0
+        target = max(1, int(round(self.count * percent / 100.0)))
+        seen = 0
+        for floor in sorted(self._counts):
+            seen += self._counts[floor]
+            if seen >= target:
+                return min(self._bucket_ceiling(floor), self.max) / 1_000_000
+        return self.max / 1_000_000
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出统计摘要（毫秒）"""
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'min_ms': self.min / 1000,
+            'mean_ms': self.total / self.count / 1000,
+            'p50_ms': self.percentile(50) * 1000,
+            'p90_ms': self.percentile(90) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'p999_ms': self.percentile(99.9) * 1000,
+            'max_ms': self.max / 1000
+        }
+
+
+class ChainProfiler:
+    """按 (处理器, 请求类型) 统计墙钟时间和 CPU 时间，并导出记忆化函数的命中统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, str], Tuple[LatencyHistogram, LatencyHistogram]] = {}
+        self._memoized: Dict[str, Callable] = {}
+        # reset 时的命中/未命中次数，导出的统计从该基线开始计算
+        self._memo_baselines: Dict[str, Tuple[int, int]] = {}
+
+    def memoize(self, name: str, max_size: int) -> Callable[[Callable], Callable]:
+        """有界 LRU 记忆化装饰器（用于纯函数），命中统计以 ``name`` 导出
+
+        缓存在进程内共享（所有处理器实例共用），``max_size`` 为 0 时不缓存。
+        """
+        def decorator(function: Callable) -> Callable:
+            cached = lru_cache(maxsize=max_size)(function)
+            with self._lock:
+                self._memoized[name] = cached
+            return cached
+        return decorator
+
+    def _memo_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for name, cached in sorted(self._memoized.items()):
+            info = cached.cache_info()
+            base_hits, base_misses = self._memo_baselines.get(name, (0, 0))
+            hits, misses = info.hits - base_hits, info.misses - base_misses
+            result[name] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+                'size': info.currsize,
+                'max_size': info.maxsize
+            }
+        return result
+
+    def record(self, handler_name: str, request_type: str, wall_time: float, cpu_time: float):
+        """记录一次处理器调用"""
+        key = (handler_name, request_type)
+        with self._lock:
+            histograms = self._histograms.get(key)
+            if histograms is None:
+                histograms = self._histograms[key] = (LatencyHistogram(), LatencyHistogram())
+            histograms[0].record(wall_time)
+            histograms[1].record(cpu_time)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出所有处理器的耗时分布"""
+        with self._lock:
+            handlers: Dict[str, Dict[str, Any]] = {}
+            for (handler_name, request_type), (wall, cpu) in sorted(self._histograms.items()):
+                handlers.setdefault(handler_name, {})[request_type] = {
+                    'wall': wall.snapshot(),
+                    'cpu': cpu.snapshot()
+                }
+            return {'handlers': handlers, 'memoized': self._memo_snapshot()}
+
+    def reset(self):
+        """清空统计数据（记忆化函数保留缓存的结果，只重新开始计数）"""
+        with self._lock:
+            self._histograms.clear()
+            for name, cached in self._memoized.items():
+                info = cached.cache_info()
+                self._memo_baselines[name] = (info.hits, info.misses)
+
+
+# 每个进程各自统计（prefork 子进程之间互不共享）
+profiler = ChainProfiler()
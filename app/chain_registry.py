@@ -0,0 +1,374 @@
+"""
+责任链注册表 - 在每个 worker 进程内缓存已构建的责任链和处理器实例
+
+链类型由声明式的链定义（JSON/YAML 文件或 Python 字典）描述，worker 启动时统一
+校验并编译；定义文件修改后自动重新加载，无需重启 worker。
+"""
+import os
+import json
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from handlers import BaseHandler
+from handlers.validation_handler import DataValidationHandler
+from handlers.transformation_handler import DataTransformationHandler
+from handlers.enrichment_handler import DataEnrichmentHandler
+from handlers.export_handler import DataExportHandler, ReportExportHandler
+from handlers.notification_handler import NotificationHandler, AlertHandler
+from chain_handlers import ChainStage, CompiledChain, DagChain
+
+logger = logging.getLogger(__name__)
+
+# 处理器名称到处理器类的映射（链定义和 handler_sequence 中使用的名称）
+HANDLER_CLASSES = {
+    'validation': DataValidationHandler,
+    'transformation': DataTransformationHandler,
+    'enrichment': DataEnrichmentHandler,
+    'export': DataExportHandler,
+    'report_export': ReportExportHandler,
+    'notification': NotificationHandler,
+    'alert': AlertHandler
+}
+
+# 链定义文件（.json，或安装了 PyYAML 时使用 .yaml/.yml）
+CHAIN_DEFINITIONS_PATH = os.getenv(
+    "CHAIN_DEFINITIONS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "chain_definitions.json")
+)
+# 检查定义文件是否修改的最小间隔（秒），0 表示每次获取链时都检查
+CHAIN_DEFINITIONS_RELOAD_INTERVAL = float(os.getenv("CHAIN_DEFINITIONS_RELOAD_INTERVAL", "5"))
+# 按处理器序列（由客户端指定）缓存的链最多保留的条数，超出时淘汰最久未使用的
+CHAIN_SEQUENCE_CACHE_SIZE = int(os.getenv("CHAIN_SEQUENCE_CACHE_SIZE", "128"))
+
+# 链的执行方式：顺序执行，或按阶段依赖并行执行
+CHAIN_MODES = ('sequential', 'dag')
+
+
+class StageDefinition(NamedTuple):
+    """DAG 链中一个阶段的定义，inputs/outputs 为 None 时使用处理器类上的声明"""
+    handler: str
+    inputs: Optional[Tuple[str, ...]] = None
+    outputs: Optional[Tuple[str, ...]] = None
+
+
+class ChainDefinition(NamedTuple):
+    """一个链类型的定义"""
+    name: str
+    handlers: Tuple[str, ...]
+    mode: str = 'sequential'
+    stages: Tuple[StageDefinition, ...] = ()
+
+
+def read_chain_definitions(path: str) -> Dict[str, Any]:
+    """读取链定义文件"""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def _parse_stage(chain: str, stage_spec: Any, errors: List[str]) -> Optional[StageDefinition]:
+    """解析 handlers 中的一项：处理器名称，或带 inputs/outputs 的阶段对象"""
+    if isinstance(stage_spec, str):
+        return StageDefinition(stage_spec)
+    if not isinstance(stage_spec, dict) or not isinstance(stage_spec.get('handler'), str):
+        errors.append(f"{chain}: 阶段必须是处理器名称或包含 handler 的对象: {stage_spec}")
+        return None
+    
+    unknown_keys = set(stage_spec) - {'handler', 'inputs', 'outputs'}
+    if unknown_keys:
+        errors.append(f"{chain}: 阶段 {stage_spec['handler']} 包含未知的字段 {', '.join(sorted(unknown_keys))}")
+    fields: Dict[str, Optional[Tuple[str, ...]]] = {}
+    for key in ('inputs', 'outputs'):
+        value = stage_spec.get(key)
+        if value is not None and (not isinstance(value, list) or
+                                  not all(isinstance(field, str) for field in value)):
+            errors.append(f"{chain}: 阶段 {stage_spec['handler']} 的 {key} 必须是字段名列表")
+            value = None
+        fields[key] = tuple(value) if value is not None else None
+    return StageDefinition(stage_spec['handler'], fields['inputs'], fields['outputs'])
+
+
+def parse_chain_definitions(spec: Dict[str, Any]) -> Tuple[Dict[str, ChainDefinition], str]:
+    """校验链定义，返回 (链类型到定义的映射, 默认链类型)
+
+    格式::
+
+        {"default": "standard",
+         "chains": {"standard": {"handlers": ["validation", ...], "mode": "sequential"},
+                    "validation_only": ["validation"],
+                    "notify_parallel": {"handlers": ["notification",
+                                                     {"handler": "alert",
+                                                      "inputs": ["notification_config"],
+                                                      "outputs": ["alerts"]}],
+                                        "mode": "dag"}}}
+
+    dag 模式的阶段可以用对象声明读取/写入的 request.data 字段（inputs/outputs），
+    覆盖处理器类上的声明。所有问题汇总在一个 ValueError 中抛出。
+    """
+    chains = spec.get('chains') if isinstance(spec, dict) else None
+    if not isinstance(chains, dict) or not chains:
+        raise ValueError("链定义必须包含非空的 chains")
+    
+    errors: List[str] = []
+    definitions: Dict[str, ChainDefinition] = {}
+    for name, chain_spec in chains.items():
+        if isinstance(chain_spec, list):
+            chain_spec = {'handlers': chain_spec}
+        if not isinstance(chain_spec, dict):
+            errors.append(f"{name}: 定义必须是对象或处理器列表")
+            continue
+        
+        handlers = chain_spec.get('handlers')
+        mode = chain_spec.get('mode', 'sequential')
+        if not isinstance(handlers, list) or not handlers:
+            errors.append(f"{name}: handlers 必须是非空列表")
+            continue
+        stages = [_parse_stage(name, stage_spec, errors) for stage_spec in handlers]
+        stages = [stage for stage in stages if stage is not None]
+        unknown = [stage.handler for stage in stages if stage.handler not in HANDLER_CLASSES]
+        if unknown:
+            errors.append(f"{name}: 未知的处理器 {', '.join(unknown)}")
+        if mode not in CHAIN_MODES:
+            errors.append(f"{name}: 未知的执行方式 {mode}")
+        elif mode != 'dag' and any(stage.inputs is not None or stage.outputs is not None for stage in stages):
+            errors.append(f"{name}: 只有 dag 模式的阶段可以声明 inputs/outputs")
+        definitions[name] = ChainDefinition(name, tuple(stage.handler for stage in stages), mode, tuple(stages))
+    
+    default = spec.get('default', 'standard')
+    if default not in chains:
+        errors.append(f"默认链类型 {default} 未定义")
+    
+    if errors:
+        raise ValueError("链定义无效: " + "; ".join(errors))
+    return definitions, default
+
+
+def _describe_stage(stage: StageDefinition) -> Union[str, Dict[str, Any]]:
+    """导出阶段定义（未声明 inputs/outputs 的阶段只导出处理器名称）"""
+    if stage.inputs is None and stage.outputs is None:
+        return stage.handler
+    described: Dict[str, Any] = {'handler': stage.handler}
+    if stage.inputs is not None:
+        described['inputs'] = list(stage.inputs)
+    if stage.outputs is not None:
+        described['outputs'] = list(stage.outputs)
+    return described
+
+
+class ChainRegistry:
+    """进程内的责任链缓存
+
+    处理器实例按名称只创建一次，并在所有链之间共享；编译后的链按链类型或
+    处理器序列缓存。编译后的链不依赖处理器之间的链接关系，因此共享处理器实例是安全的。
+    处理器序列由客户端指定，按序列缓存的链使用 LRU，最多保留 ``CHAIN_SEQUENCE_CACHE_SIZE`` 条。
+    """
+
+    def __init__(self, definitions: Union[str, Dict[str, Any], None] = None):
+        """
+        Args:
+            definitions: 链定义文件路径或链定义字典，默认使用 CHAIN_DEFINITIONS_PATH
+        """
+        self._lock = threading.RLock()
+        self._handlers: Dict[str, BaseHandler] = {}
+        self._chains: Dict[Hashable, CompiledChain] = {}
+        self._sequence_chains: 'OrderedDict[Hashable, CompiledChain]' = OrderedDict()
+        self._source = CHAIN_DEFINITIONS_PATH if definitions is None else definitions
+        self._definitions: Optional[Dict[str, ChainDefinition]] = None
+        self.default_chain_type: Optional[str] = None
+        self._mtime: Optional[float] = None
+        self._next_check = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def load(self, definitions: Union[str, Dict[str, Any], None] = None):
+        """加载并校验链定义，清空已编译的链；定义无效时抛出 ValueError 并保留原有定义"""
+        with self._lock:
+            source = self._source if definitions is None else definitions
+            mtime = None
+            if isinstance(source, str):
+                mtime = os.stat(source).st_mtime
+                spec = read_chain_definitions(source)
+            else:
+                spec = source
+            parsed, default = parse_chain_definitions(spec)
+            
+            self._source = source
+            self._definitions = parsed
+            self.default_chain_type = default
+            self._mtime = mtime
+            self._chains.clear()
+            logger.info(f"加载链定义: {', '.join(parsed)}")
+
+    def compile_all(self):
+        """编译所有已定义的链（worker 启动时调用）"""
+        with self._lock:
+            for chain_type in self._get_definitions():
+                self.get_chain(chain_type)
+
+    def reload_if_changed(self):
+        """定义文件修改后重新加载并编译；新定义无效时记录错误并继续使用原有定义"""
+        if not isinstance(self._source, str) or self._mtime is None:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + CHAIN_DEFINITIONS_RELOAD_INTERVAL
+        try:
+            changed = os.stat(self._source).st_mtime != self._mtime
+        except OSError as e:
+            logger.error(f"检查链定义文件失败: {e}")
+            return
+        if not changed:
+            return
+        
+        with self._lock:
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"重新加载链定义失败，继续使用原有定义: {e}")
+                return
+            self.reloads += 1
+            self.compile_all()
+
+    def _get_definitions(self) -> Dict[str, ChainDefinition]:
+        """获取当前的链定义（首次使用时加载）"""
+        if self._definitions is None:
+            self.load()
+        else:
+            self.reload_if_changed()
+        return self._definitions
+
+    def chain_types(self) -> List[str]:
+        """获取所有已定义的链类型"""
+        return list(self._get_definitions())
+
+    def has_chain(self, chain_type: str) -> bool:
+        """链类型是否已定义"""
+        return chain_type in self._get_definitions()
+
+    def describe(self) -> Dict[str, Any]:
+        """导出当前的链定义"""
+        definitions = self._get_definitions()
+        return {
+            'default': self.default_chain_type,
+            'chains': {
+                name: {'handlers': [_describe_stage(stage) for stage in definition.stages],
+                       'mode': definition.mode}
+                for name, definition in definitions.items()
+            }
+        }
+
+    @staticmethod
+    def validate_sequence(handler_sequence: Sequence[str]):
+        """校验处理器序列，存在未知处理器或序列为空时抛出 ValueError"""
+        if not handler_sequence:
+            raise ValueError("处理器序列不能为空")
+        unknown = [name for name in handler_sequence if name not in HANDLER_CLASSES]
+        if unknown:
+            raise ValueError(f"未知的处理器: {', '.join(unknown)}")
+
+    def get_handler(self, name: str) -> BaseHandler:
+        """获取（必要时创建）共享的处理器实例"""
+        handler = self._handlers.get(name)
+        if handler is None:
+            with self._lock:
+                handler = self._handlers.get(name)
+                if handler is None:
+                    if name not in HANDLER_CLASSES:
+                        raise ValueError(f"未知的处理器: {name}")
+                    handler = HANDLER_CLASSES[name]()
+                    self._handlers[name] = handler
+        return handler
+
+    def get_chain(self, chain_type: str) -> CompiledChain:
+        """按链类型获取编译后的链
+
+        未知类型（如定义修改前已入队的任务）回退到默认链类型。
+        """
+        definitions = self._get_definitions()
+        definition = definitions.get(chain_type)
+        if definition is None:
+            logger.warning(f"未知的链类型 {chain_type}，使用默认链 {self.default_chain_type}")
+            definition = definitions[self.default_chain_type]
+        return self._get_or_build(('chain_type', definition.name), definition.stages,
+                                  dag=definition.mode == 'dag')
+
+    def get_sequence_chain(self, handler_sequence: Sequence[str]) -> CompiledChain:
+        """按处理器序列获取编译后的链，忽略未知的处理器名称"""
+        sequence = tuple(name for name in handler_sequence if name in HANDLER_CLASSES)
+        if not sequence:
+            raise ValueError("没有有效的处理器序列")
+        key = ('sequence',) + sequence
+        with self._lock:
+            chain = self._sequence_chains.get(key)
+            if chain is not None:
+                self._sequence_chains.move_to_end(key)
+                self.hits += 1
+                return chain
+            chain = self._get_or_build(key, [StageDefinition(name) for name in sequence],
+                                       cache=self._sequence_chains)
+            while len(self._sequence_chains) > CHAIN_SEQUENCE_CACHE_SIZE:
+                self._sequence_chains.popitem(last=False)
+            return chain
+
+    def _get_or_build(self, key: Hashable, stages: Sequence[StageDefinition], dag: bool = False,
+                      cache: Optional[Dict[Hashable, CompiledChain]] = None) -> CompiledChain:
+        """从缓存获取链，未命中时构建并缓存（默认缓存在按链类型的缓存中）"""
+        cache = self._chains if cache is None else cache
+        with self._lock:
+            chain = cache.get(key)
+            if chain is not None:
+                self.hits += 1
+                return chain
+
+            self.misses += 1
+            if dag:
+                chain = DagChain([ChainStage(self.get_handler(stage.handler), stage.inputs, stage.outputs)
+                                  for stage in stages])
+            else:
+                chain = CompiledChain([self.get_handler(stage.handler) for stage in stages])
+            cache[key] = chain
+            logger.info(f"构建并缓存责任链: {key}")
+            return chain
+
+    def invalidate(self, key: Optional[Hashable] = None, handlers: bool = False):
+        """使缓存失效
+
+        Args:
+            key: 要失效的链缓存键，为 None 时清空所有链
+            handlers: 是否同时丢弃共享的处理器实例
+        """
+        with self._lock:
+            if key is None:
+                self._chains.clear()
+                self._sequence_chains.clear()
+            else:
+                self._chains.pop(key, None)
+                self._sequence_chains.pop(key, None)
+            if handlers:
+                self._handlers.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'cached_chains': len(self._chains) + len(self._sequence_chains),
+                'cached_sequence_chains': len(self._sequence_chains),
+                'cached_handlers': len(self._handlers),
+                'chain_types': len(self._definitions or {}),
+                'reloads': self.reloads,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+# 每个 worker 进程各自持有一份注册表（prefork 子进程之间互不共享）
+chain_registry = ChainRegistry()
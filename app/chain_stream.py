@@ -0,0 +1,207 @@
+"""
+责任链流式处理 - 逐行读取 NDJSON 记录，按块送入处理链，结果逐行写入 NDJSON 文件
+
+内存占用只与块大小有关，与记录总数无关。
+
+通过 API / Celery 任务提交时，输入和输出文件必须位于 ``STREAM_DATA_DIR`` 目录内（worker 容器中的路径）。
+
+命令行用法:
+    python chain_stream.py input.ndjson output.ndjson --chain-type standard --chunk-size 500
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from itertools import islice
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+from handlers import ProcessingRequest, RequestType, json_default
+from chain_handlers import ChainProcessor
+from chain_registry import chain_registry
+from chain_cache import get_result_cache
+from data_sketches import DataQualityProfile
+from handlers.cross_record_validation import CrossRecordState
+
+DEFAULT_STREAM_CHUNK_SIZE = 100
+DEFAULT_PROGRESS_EVERY = 1000
+
+# 流式任务允许读写的数据目录
+STREAM_DATA_DIR = os.getenv("STREAM_DATA_DIR", "/data/stream")
+
+
+def resolve_data_path(path: str) -> str:
+    """把流式任务的文件路径限制在 STREAM_DATA_DIR 内，返回解析符号链接后的绝对路径
+
+    拒绝相对路径、包含 ``..`` 的路径，以及解析后位于数据目录之外的路径（包括指向目录外的符号链接）。
+    """
+    if not isinstance(path, str) or not path:
+        raise ValueError("文件路径不能为空")
+    if not os.path.isabs(path):
+        raise ValueError(f"文件路径必须是 {STREAM_DATA_DIR} 下的绝对路径: {path}")
+    if '..' in path.replace('\\', '/').split('/'):
+        raise ValueError(f"文件路径不能包含 '..': {path}")
+
+    data_dir = os.path.realpath(STREAM_DATA_DIR)
+    resolved = os.path.realpath(path)
+    if resolved == data_dir or os.path.commonpath([data_dir, resolved]) != data_dir:
+        raise ValueError(f"文件路径必须位于 {STREAM_DATA_DIR} 目录内: {path}")
+    return resolved
+
+
+def request_from_record(record: Dict[str, Any]) -> ProcessingRequest:
+    """把一条记录（格式与 batch_requests 的元素相同）转换为处理请求"""
+    return ProcessingRequest(
+        request_type=RequestType(record.get('request_type', 'data_validation')),
+        data=record.get('data', {}),
+        metadata=record.get('metadata', {})
+    )
+
+
+def read_ndjson(stream: IO[str]) -> Iterator[Tuple[int, Any]]:
+    """逐行读取 NDJSON，返回 (记录序号, 记录)；无法解析的行返回异常对象，空行跳过"""
+    index = 0
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("记录必须是 JSON 对象")
+        except ValueError as e:
+            record = e
+        yield index, record
+        index += 1
+
+
+def process_records(processor: ChainProcessor, records: Iterable[Tuple[int, Any]],
+                    chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE,
+                    quality_profile: Optional[DataQualityProfile] = None) -> Iterator[Dict[str, Any]]:
+    """按块处理记录，按输入顺序逐条产出结果（包含 record_index）
+
+    设置 quality_profile 时验证请求的负载计入该数据质量草图。唯一性规则在整个流内检查。
+    """
+    records = iter(records)
+    cross_record_state = CrossRecordState()
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(chunk)
+        requests: List[ProcessingRequest] = []
+        positions: List[int] = []
+        for position, (index, record) in enumerate(chunk):
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                request = request_from_record(record)
+                request.quality_profile = quality_profile
+                request.cross_record_state = cross_record_state
+                requests.append(request)
+                positions.append(position)
+            except Exception as e:
+                results[position] = {'error': str(e), 'success': False}
+
+        if requests:
+            try:
+                chunk_results = processor.process_batch_requests(requests)
+            except Exception as e:
+                chunk_results = [{'error': str(e), 'success': False} for _ in requests]
+            for position, result in zip(positions, chunk_results):
+                results[position] = result
+
+        for (index, _), result in zip(chunk, results):
+            result['record_index'] = index
+            yield result
+
+
+def process_ndjson_file(input_path: str, output_path: str, chain_type: str = 'standard',
+                        chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE,
+                        progress: Optional[Callable[[int], None]] = None,
+                        progress_every: int = DEFAULT_PROGRESS_EVERY,
+                        processor: Optional[ChainProcessor] = None,
+                        data_quality: bool = False) -> Dict[str, Any]:
+    """流式处理 NDJSON 文件
+
+    结果先写入临时文件，全部完成后再替换为 output_path。
+
+    Args:
+        progress: 进度回调，参数为已处理的记录数，每 progress_every 条记录调用一次
+        processor: 使用的处理器，默认按 chain_type 从注册表获取处理链
+        data_quality: 是否在验证过程中统计数据质量草图（附加到摘要的 data_quality）
+
+    Returns:
+        处理摘要（记录数、成功/失败数、错误/警告总数、耗时）
+    """
+    if processor is None:
+        processor = ChainProcessor(chain_registry.get_chain(chain_type),
+                                   result_cache=get_result_cache(), cache_namespace=chain_type)
+
+    summary = {
+        'total_records': 0,
+        'successful_records': 0,
+        'failed_records': 0,
+        'total_errors': 0,
+        'total_warnings': 0
+    }
+    quality_profile = DataQualityProfile() if data_quality else None
+    start_time = time.time()
+    temp_path = f"{output_path}.part"
+    try:
+        with open(input_path, encoding='utf-8') as source, open(temp_path, 'w', encoding='utf-8') as sink:
+            for result in process_records(processor, read_ndjson(source), chunk_size, quality_profile):
+                sink.write(json.dumps(result, ensure_ascii=False, default=json_default))
+                sink.write('\n')
+
+                summary['total_records'] += 1
+                if result.get('success'):
+                    summary['successful_records'] += 1
+                else:
+                    summary['failed_records'] += 1
+                summary['total_errors'] += len(result.get('errors', ()))
+                summary['total_warnings'] += len(result.get('warnings', ()))
+                if progress is not None and summary['total_records'] % progress_every == 0:
+                    progress(summary['total_records'])
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    summary['processing_time'] = time.time() - start_time
+    summary['output_path'] = output_path
+    if quality_profile is not None:
+        summary['data_quality'] = quality_profile.to_dict()
+    if progress is not None:
+        progress(summary['total_records'])
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="流式处理 NDJSON 记录")
+    parser.add_argument('input', help="输入 NDJSON 文件")
+    parser.add_argument('output', help="输出 NDJSON 文件")
+    parser.add_argument('--chain-type', default='standard', help="链类型")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_STREAM_CHUNK_SIZE, help="每块记录数")
+    parser.add_argument('--progress-every', type=int, default=DEFAULT_PROGRESS_EVERY, help="进度输出间隔（记录数）")
+    parser.add_argument('--data-quality', action='store_true', help="统计数据质量草图")
+    args = parser.parse_args(argv)
+
+    if not chain_registry.has_chain(args.chain_type):
+        print(f"未知的链类型: {args.chain_type}", file=sys.stderr)
+        return 2
+
+    summary = process_ndjson_file(
+        args.input, args.output, args.chain_type, args.chunk_size,
+        progress=lambda count: print(f"已处理 {count} 条记录", file=sys.stderr),
+        progress_every=args.progress_every,
+        data_quality=args.data_quality
+    )
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,338 @@
+"""
+数据质量草图 - 在验证过程中以固定内存统计每个字段的基数、分位数、空值率和高频值
+
+所有草图都可以合并，内存只与配置（精度、压缩参数、top-k 容量、字段数上限）有关，
+与记录数无关。
+"""
+import json
+import math
+import hashlib
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+DEFAULT_QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.9, 0.99)
+
+
+def _canonical(value: Any) -> Any:
+    """可哈希、可 JSON 序列化的取值（列表、对象转为规范化 JSON 字符串）"""
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class HyperLogLog:
+    """HyperLogLog 基数估计，2^precision 个寄存器，标准误差约 1.04 / sqrt(2^precision)
+
+    取值按类型和内容计算 64 位哈希（与进程的哈希随机化无关），不同 worker 的草图可以合并。
+    """
+
+    def __init__(self, precision: int = 12):
+        if not 4 <= precision <= 16:
+            raise ValueError(f"HyperLogLog 精度必须在 4 到 16 之间: {precision}")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @staticmethod
+    def _hash(value: Any) -> int:
+        data = f"{type(value).__name__}:{value}".encode('utf-8')
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+    def add(self, value: Any):
+        hashed = self._hash(value)
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog'):
+        if other.precision != self.precision:
+            raise ValueError("只能合并精度相同的 HyperLogLog")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # 小基数时使用线性计数
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class TDigest:
+    """合并式 t-digest 分位数草图
+
+    值先写入缓冲区，缓冲区满时与已有质心一起排序合并；质心大小受 k1 尺度函数限制，
+    两端的质心更小，尾部分位数更精确。质心数不超过约 ``compression`` 个。
+    """
+
+    def __init__(self, compression: float = 100, buffer_size: int = 500):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.centroids: List[Tuple[float, float]] = []
+        self._buffer: List[float] = []
+        self.count = 0.0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        self._buffer.append(value)
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self._buffer) >= self.buffer_size:
+            self._compress()
+
+    def merge(self, other: 'TDigest'):
+        other._compress()
+        if not other.count:
+            return
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(other.centroids)
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _q(self, k: float) -> float:
+        angle = min(max(2 * math.pi * k / self.compression, -math.pi / 2), math.pi / 2)
+        return (math.sin(angle) + 1) / 2
+
+    def _compress(self, extra: Sequence[Tuple[float, float]] = ()):
+        if not self._buffer and not extra:
+            return
+        points = sorted(self.centroids + [(value, 1.0) for value in self._buffer] + list(extra))
+        self._buffer = []
+        total = sum(weight for _, weight in points)
+
+        merged: List[Tuple[float, float]] = []
+        mean, weight = points[0]
+        cumulative = 0.0
+        limit = total * self._q(self._k(0.0) + 1)
+        for point_mean, point_weight in points[1:]:
+            if cumulative + weight + point_weight <= limit:
+                weight += point_weight
+                mean += (point_mean - mean) * point_weight / weight
+            else:
+                merged.append((mean, weight))
+                cumulative += weight
+                limit = total * self._q(self._k(cumulative / total) + 1)
+                mean, weight = point_mean, point_weight
+        merged.append((mean, weight))
+        self.centroids = merged
+
+    def quantile(self, q: float) -> Optional[float]:
+        """估计分位数 q（0 到 1）"""
+        self._compress()
+        if not self.count:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+        target = q * self.count
+        # 质心的中心位置，两端用最小值/最大值
+        cumulative = 0.0
+        previous_position, previous_mean = 0.0, self.min
+        for mean, weight in self.centroids:
+            position = cumulative + weight / 2
+            if target <= position:
+                if position == previous_position:
+                    return mean
+                fraction = (target - previous_position) / (position - previous_position)
+                return previous_mean + (mean - previous_mean) * fraction
+            previous_position, previous_mean = position, mean
+            cumulative += weight
+        if self.count == previous_position:
+            return self.max
+        fraction = (target - previous_position) / (self.count - previous_position)
+        return previous_mean + (self.max - previous_mean) * min(fraction, 1.0)
+
+
+class TopK:
+    """高频值统计（Space-Saving 的批量淘汰变体）
+
+    跟踪的取值超过 ``2 * capacity`` 个时只保留计数最大的 ``capacity`` 个，淘汰的最大计数
+    记为下限 ``floor``，之后新出现的取值以该下限为初始计数。报告的计数是上界，
+    ``error`` 为可能多计的次数。
+    """
+
+    def __init__(self, k: int = 10, capacity: Optional[int] = None):
+        self.k = k
+        self.capacity = capacity or max(k * 10, 50)
+        self.floor = 0
+        self.counters: Dict[Any, List[int]] = {}
+
+    def add(self, value: Any, count: int = 1):
+        counter = self.counters.get(value)
+        if counter is not None:
+            counter[0] += count
+            return
+        self.counters[value] = [self.floor + count, self.floor]
+        if len(self.counters) > 2 * self.capacity:
+            self._prune()
+
+    def _prune(self):
+        ranked = sorted(self.counters.items(), key=lambda item: item[1][0], reverse=True)
+        self.floor = max(self.floor, ranked[self.capacity][1][0])
+        self.counters = dict(ranked[:self.capacity])
+
+    def merge(self, other: 'TopK'):
+        floor = self.floor
+        for value, counter in self.counters.items():
+            if value not in other.counters:
+                # 可能在另一方被淘汰过，按其下限计入上界
+                counter[0] += other.floor
+                counter[1] += other.floor
+        for value, (count, error) in other.counters.items():
+            counter = self.counters.get(value)
+            if counter is not None:
+                counter[0] += count
+                counter[1] += error
+            else:
+                self.counters[value] = [floor + count, floor + error]
+        self.floor += other.floor
+        if len(self.counters) > 2 * self.capacity:
+            self._prune()
+
+    def top(self) -> List[Dict[str, Any]]:
+        """计数最大的 k 个取值；不能确定出现过两次以上的取值（高基数字段中的噪声）不报告"""
+        ranked = sorted(((value, counter) for value, counter in self.counters.items()
+                         if counter[1] == 0 or counter[0] - counter[1] > 1),
+                        key=lambda item: item[1][0], reverse=True)[:self.k]
+        return [{'value': value, 'count': count, 'error': error} for value, (count, error) in ranked]
+
+
+class FieldSketch:
+    """单个字段的草图：非空计数、基数、数值分位数、高频值"""
+
+    def __init__(self, precision: int, compression: float, top_k: int):
+        self.non_null = 0
+        self.distinct = HyperLogLog(precision)
+        self.numeric = TDigest(compression)
+        self.top_values = TopK(top_k)
+
+    def add(self, value: Any):
+        self.non_null += 1
+        value = _canonical(value)
+        self.distinct.add(value)
+        self.top_values.add(value)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and not math.isnan(value):
+            self.numeric.add(float(value))
+
+    def merge(self, other: 'FieldSketch'):
+        self.non_null += other.non_null
+        self.distinct.merge(other.distinct)
+        self.numeric.merge(other.numeric)
+        self.top_values.merge(other.top_values)
+
+    def summary(self, records: int, quantiles: Sequence[float]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            'non_null': self.non_null,
+            'null_rate': (records - self.non_null) / records if records else 0.0,
+            'distinct_estimate': self.distinct.estimate() if self.non_null else 0,
+            'top_values': self.top_values.top()
+        }
+        if self.numeric.count:
+            result['numeric'] = {
+                'count': int(self.numeric.count),
+                'min': self.numeric.min,
+                'max': self.numeric.max,
+                'mean': self.numeric.total / self.numeric.count,
+                'quantiles': {f"p{q * 100:g}": self.numeric.quantile(q) for q in quantiles}
+            }
+        return result
+
+
+class DataQualityProfile:
+    """按字段统计的数据质量草图
+
+    Args:
+        fields: 统计的字段，None 表示统计出现过的所有字段（最多 ``max_fields`` 个）
+        top_k: 报告的高频值个数
+        precision: HyperLogLog 精度
+        compression: t-digest 压缩参数
+        max_fields: 未指定字段时最多统计的字段数
+    """
+
+    def __init__(self, fields: Optional[Iterable[str]] = None, top_k: int = 10, precision: int = 12,
+                 compression: float = 100, max_fields: int = 100,
+                 quantiles: Sequence[float] = DEFAULT_QUANTILES):
+        self.fields = list(fields) if fields is not None else None
+        self.top_k = top_k
+        self.precision = precision
+        self.compression = compression
+        self.max_fields = max_fields
+        self.quantiles = tuple(quantiles)
+        self.records = 0
+        self.sketches: Dict[str, FieldSketch] = {}
+        self.dropped_values = 0
+
+    @classmethod
+    def from_config(cls, config: Any) -> 'DataQualityProfile':
+        """从请求中的配置创建（True 使用默认配置，字典可以指定构造参数）"""
+        if not isinstance(config, dict):
+            return cls()
+        options = {key: config[key] for key in ('fields', 'top_k', 'precision', 'compression', 'max_fields')
+                   if key in config}
+        return cls(**options)
+
+    def _sketch(self, field: str) -> Optional[FieldSketch]:
+        sketch = self.sketches.get(field)
+        if sketch is None:
+            if self.fields is None and len(self.sketches) >= self.max_fields:
+                self.dropped_values += 1
+                return None
+            sketch = self.sketches[field] = FieldSketch(self.precision, self.compression, self.top_k)
+        return sketch
+
+    def add_record(self, record: Mapping[str, Any]):
+        """统计一条记录，缺失或为 None 的字段计为空值"""
+        self.records += 1
+        fields = self.fields if self.fields is not None else record.keys()
+        for field in fields:
+            value = record.get(field)
+            if value is not None:
+                sketch = self._sketch(field)
+                if sketch is not None:
+                    sketch.add(value)
+
+    def add_columns(self, columns: Mapping[str, Sequence[Any]]):
+        """统计列式数据（每个字段一个数组），None 计为空值"""
+        count = len(next(iter(columns.values()), ()))
+        self.records += count
+        fields = self.fields if self.fields is not None else list(columns)
+        for field in fields:
+            values = columns.get(field)
+            if values is None:
+                continue
+            sketch = self._sketch(field)
+            if sketch is not None:
+                for value in values:
+                    if value is not None:
+                        sketch.add(value)
+
+    def merge(self, other: 'DataQualityProfile'):
+        self.records += other.records
+        for field, sketch in other.sketches.items():
+            own = self._sketch(field)
+            if own is not None:
+                own.merge(sketch)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出统计摘要"""
+        fields = self.fields if self.fields is not None else list(self.sketches)
+        empty = FieldSketch(self.precision, self.compression, self.top_k)
+        result = {
+            'records': self.records,
+            'fields': {field: self.sketches.get(field, empty).summary(self.records, self.quantiles)
+                       for field in fields}
+        }
+        if self.dropped_values:
+            result['dropped_values'] = self.dropped_values
+        return result
@@ -31,6 +31,22 @@ class User(Base):
     email = Column(String(255), unique=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+# 可用于引用验证的唯一索引列
+REFERENCE_COLUMNS = {
+    'users.email': User.email,
+    'users.username': User.username,
+}
+
+def find_existing_values(db, reference: str, values, chunk_size: int = 500) -> set:
+    """返回 values 中存在于引用列的取值（数据库中的原值），每 chunk_size 个取值执行一次 IN 查询"""
+    column = REFERENCE_COLUMNS[reference]
+    values = list(values)
+    existing = set()
+    for start in range(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size]
+        existing.update(value for (value,) in db.query(column).filter(column.in_(chunk)))
+    return existing
+
 # 获取数据库会话
 def get_db():
     db = SessionLocal()
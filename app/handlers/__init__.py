@@ -2,11 +2,18 @@
 处理器基础类和公共接口
 """
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from array import array
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import inspect
+import threading
 import time
 import logging
 from enum import Enum
 
+from chain_metrics import profiler
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,76 +28,487 @@ class RequestType(Enum):
     NOTIFICATION = "notification"
 
 
+# 每个线程持有一个持久的事件循环，供同步引擎执行异步处理器
+_loop_local = threading.local()
+
+
+def run_coroutine(coro):
+    """在当前线程的事件循环中同步执行协程"""
+    loop = getattr(_loop_local, 'loop', None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _loop_local.loop = loop
+    return loop.run_until_complete(coro)
+
+
+# 处理器名称和日志状态在进程内驻留为小整数，日志条目只保存编号
+_handler_names: List[str] = []
+_handler_ids: Dict[str, int] = {}
+_statuses: List[str] = ["INFO", "SUCCESS", "WARNING", "ERROR", "SKIPPED"]
+_status_codes: Dict[str, int] = {status: code for code, status in enumerate(_statuses)}
+# 新字符串的编号分配和追加必须一起完成（并行阶段和 asyncio.to_thread 会在多个线程中同时写日志）
+_intern_lock = threading.Lock()
+
+
+def _intern(value: str, values: List[str], codes: Dict[str, int]) -> int:
+    """获取字符串的驻留编号"""
+    code = codes.get(value)
+    if code is None:
+        with _intern_lock:
+            code = codes.get(value)
+            if code is None:
+                code = len(values)
+                values.append(value)
+                codes[value] = code
+    return code
+
+
+class PayloadView(MutableMapping):
+    """写时复制的负载视图
+
+    只记录本阶段修改、新增或删除的字段，其余字段从底层映射读取；底层映射可以是
+    另一个视图，因此多个处理阶段可以逐层叠加，而不必各自复制整个负载。
+    迭代顺序与 ``dict.copy()`` 后再修改相同：已有字段保持原位置，新字段追加在后面。
+    视图假定底层映射在其生命周期内不再被修改。
+    """
+    
+    __slots__ = ('_base', '_changes', '_deleted')
+    
+    def __init__(self, base: Mapping):
+        self._base = base
+        self._changes: Dict[Any, Any] = {}
+        self._deleted: Optional[set] = None
+    
+    def __getitem__(self, key):
+        if key in self._changes:
+            return self._changes[key]
+        if self._deleted and key in self._deleted:
+            raise KeyError(key)
+        return self._base[key]
+    
+    def __setitem__(self, key, value):
+        self._changes[key] = value
+        if self._deleted:
+            self._deleted.discard(key)
+    
+    def __delitem__(self, key):
+        in_base = key in self._base and not (self._deleted and key in self._deleted)
+        if key in self._changes:
+            del self._changes[key]
+        elif not in_base:
+            raise KeyError(key)
+        if in_base:
+            if self._deleted is None:
+                self._deleted = set()
+            self._deleted.add(key)
+    
+    def __contains__(self, key) -> bool:
+        if key in self._changes:
+            return True
+        if self._deleted and key in self._deleted:
+            return False
+        return key in self._base
+    
+    def __iter__(self) -> Iterator:
+        deleted = self._deleted
+        for key in self._base:
+            if not deleted or key not in deleted:
+                yield key
+        for key in self._changes:
+            if key not in self._base or (deleted and key in deleted):
+                yield key
+    
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+    
+    def __repr__(self) -> str:
+        return f"PayloadView({self.to_dict()!r})"
+    
+    @property
+    def changes(self) -> Dict[Any, Any]:
+        """本层修改或新增的字段"""
+        return self._changes
+    
+    def copy(self) -> 'PayloadView':
+        """在当前视图之上再叠加一层"""
+        return PayloadView(self)
+    
+    def to_dict(self) -> Dict[Any, Any]:
+        """转换为普通字典"""
+        return materialize(self)
+
+
+def materialize(value: Any) -> Any:
+    """把 PayloadView 以及字典中直接包含的视图转换为普通字典（JSON 序列化、缓存和结果使用）
+
+    不包含视图的值原样返回，不做复制。
+    """
+    if isinstance(value, PayloadView):
+        items = value.items()
+    elif isinstance(value, dict) and any(isinstance(item, PayloadView) for item in value.values()):
+        items = value.items()
+    else:
+        return value
+    return {key: materialize(item) if isinstance(item, PayloadView) else item for key, item in items}
+
+
+def json_default(value: Any) -> Any:
+    """json.dumps 的 default：视图转换为字典，其他不可序列化的值转换为字符串"""
+    if isinstance(value, PayloadView):
+        return value.to_dict()
+    return str(value)
+
+
+class _EntryLog:
+    """紧凑的日志条目存储（并行数组），仅在序列化时构建字典"""
+    
+    __slots__ = ('handler_ids', 'status_codes', 'timestamps', 'messages')
+    
+    def __init__(self, with_status: bool):
+        self.handler_ids = array('H')
+        self.status_codes = array('B') if with_status else None
+        self.timestamps = array('d')
+        self.messages: List[str] = []
+    
+    def __len__(self) -> int:
+        return len(self.messages)
+    
+    def append(self, handler_name: str, message: str, status: Optional[str] = None):
+        self.handler_ids.append(_intern(handler_name, _handler_names, _handler_ids))
+        if self.status_codes is not None:
+            self.status_codes.append(_intern(status, _statuses, _status_codes))
+        self.timestamps.append(time.time())
+        self.messages.append(message)
+    
+    def extend(self, other: '_EntryLog'):
+        """追加另一个存储中的所有条目"""
+        self.handler_ids.extend(other.handler_ids)
+        if self.status_codes is not None:
+            self.status_codes.extend(other.status_codes)
+        self.timestamps.extend(other.timestamps)
+        self.messages.extend(other.messages)
+    
+    def __getstate__(self):
+        # 驻留编号只在当前进程内有效，跨进程传递时还原为字符串
+        statuses = None
+        if self.status_codes is not None:
+            statuses = [_statuses[c] for c in self.status_codes]
+        return ([_handler_names[h] for h in self.handler_ids], statuses,
+                self.timestamps, self.messages)
+
+    def __setstate__(self, state):
+        handlers, statuses, self.timestamps, self.messages = state
+        self.handler_ids = array('H', (_intern(h, _handler_names, _handler_ids) for h in handlers))
+        self.status_codes = None
+        if statuses is not None:
+            self.status_codes = array('B', (_intern(s, _statuses, _status_codes) for s in statuses))
+
+    @classmethod
+    def from_dicts(cls, entries: List[Dict[str, Any]], message_key: str, with_status: bool) -> '_EntryLog':
+        """从字典列表恢复"""
+        log = cls(with_status)
+        for entry in entries:
+            log.handler_ids.append(_intern(entry["handler"], _handler_names, _handler_ids))
+            if with_status:
+                log.status_codes.append(_intern(entry["status"], _statuses, _status_codes))
+            log.timestamps.append(entry["timestamp"])
+            log.messages.append(entry[message_key])
+        return log
+    
+    def to_dicts(self, message_key: str) -> List[Dict[str, Any]]:
+        """还原为字典列表"""
+        if self.status_codes is None:
+            return [
+                {"handler": _handler_names[h], message_key: m, "timestamp": t}
+                for h, m, t in zip(self.handler_ids, self.messages, self.timestamps)
+            ]
+        return [
+            {"handler": _handler_names[h], message_key: m, "status": _statuses[c], "timestamp": t}
+            for h, m, c, t in zip(self.handler_ids, self.messages, self.status_codes, self.timestamps)
+        ]
+
+
 class ProcessingRequest:
-    """处理请求对象"""
+    """处理请求对象
+
+    日志、错误和警告以紧凑形式存储，``processing_log``、``errors``、``warnings``
+    属性在访问（序列化）时才构建字典列表。
+
+    metadata 中的 ``latency_budget_ms`` 为延迟预算：链开始执行时换算为 ``deadline``，
+    预算用尽后可选阶段被跳过并记录在 ``metadata['skipped_stages']`` 中。
+
+    ``quality_profile`` 为批量任务共享的数据质量草图（``data_sketches.DataQualityProfile``），
+    设置后验证处理器把请求的负载计入其中；与 ``deadline`` 一样只在运行期存在，不进入检查点。
+    ``cross_record_state`` 为批量任务共享的跨记录检查状态
+    （``handlers.cross_record_validation.CrossRecordState``），使唯一性在整个批次内检查，同样只在运行期存在。
+    """
+    
+    __slots__ = ('request_type', 'data', 'metadata', 'created_at', 'deadline', 'quality_profile',
+                 'cross_record_state', '_log', '_errors', '_warnings')
     
     def __init__(self, request_type: RequestType, data: Dict[str, Any], 
                  metadata: Optional[Dict[str, Any]] = None):
         self.request_type = request_type
         self.data = data
         self.metadata = metadata or {}
-        self.processing_log = []
         self.created_at = time.time()
-        self.errors = []
-        self.warnings = []
+        # 预算截止时间（time.monotonic），未设置延迟预算时为 None
+        self.deadline: Optional[float] = None
+        self.quality_profile = None
+        self.cross_record_state = None
+        self._log = _EntryLog(with_status=True)
+        # 大多数请求没有错误和警告，按需创建
+        self._errors: Optional[_EntryLog] = None
+        self._warnings: Optional[_EntryLog] = None
     
     def add_log(self, handler_name: str, message: str, status: str = "INFO"):
         """添加处理日志"""
-        self.processing_log.append({
-            "handler": handler_name,
-            "message": message,
-            "status": status,
-            "timestamp": time.time()
-        })
+        self._log.append(handler_name, message, status)
     
     def add_error(self, handler_name: str, error: str):
         """添加错误信息"""
-        self.errors.append({
-            "handler": handler_name,
-            "error": error,
-            "timestamp": time.time()
-        })
+        if self._errors is None:
+            self._errors = _EntryLog(with_status=False)
+        self._errors.append(handler_name, error)
     
     def add_warning(self, handler_name: str, warning: str):
         """添加警告信息"""
-        self.warnings.append({
-            "handler": handler_name,
-            "warning": warning,
-            "timestamp": time.time()
-        })
+        if self._warnings is None:
+            self._warnings = _EntryLog(with_status=False)
+        self._warnings.append(handler_name, warning)
+    
+    def fork(self) -> 'ProcessingRequest':
+        """创建共享 data/metadata、但拥有独立日志的子请求（供并行阶段使用）"""
+        child = ProcessingRequest.__new__(ProcessingRequest)
+        child.request_type = self.request_type
+        child.data = self.data
+        child.metadata = self.metadata
+        child.created_at = self.created_at
+        child.deadline = self.deadline
+        child.quality_profile = self.quality_profile
+        child.cross_record_state = self.cross_record_state
+        child._log = _EntryLog(with_status=True)
+        child._errors = None
+        child._warnings = None
+        return child
+    
+    def merge(self, child: 'ProcessingRequest'):
+        """合并子请求的日志、错误和警告"""
+        self._log.extend(child._log)
+        if child._errors is not None:
+            if self._errors is None:
+                self._errors = _EntryLog(with_status=False)
+            self._errors.extend(child._errors)
+        if child._warnings is not None:
+            if self._warnings is None:
+                self._warnings = _EntryLog(with_status=False)
+            self._warnings.extend(child._warnings)
+    
+    def start_budget(self):
+        """按 metadata 中的 latency_budget_ms 开始计算预算（已开始时不重复计算）"""
+        budget_ms = self.metadata.get('latency_budget_ms')
+        if budget_ms is not None and self.deadline is None:
+            self.deadline = time.monotonic() + float(budget_ms) / 1000
+    
+    @property
+    def budget_exhausted(self) -> bool:
+        """延迟预算是否已用尽"""
+        return self.deadline is not None and time.monotonic() >= self.deadline
+    
+    def remaining_budget_ms(self) -> Optional[float]:
+        """剩余预算（毫秒，超时为负数），未设置预算时返回 None"""
+        if self.deadline is None:
+            return None
+        return (self.deadline - time.monotonic()) * 1000
+    
+    def skip_stage(self, stage: str, reason: str):
+        """记录被跳过的阶段"""
+        self.add_log(stage, f"已跳过: {reason}", "SKIPPED")
+        self.metadata.setdefault('skipped_stages', []).append({'stage': stage, 'reason': reason})
+    
+    def to_state(self) -> Dict[str, Any]:
+        """导出可 JSON 序列化的完整状态（用于检查点）"""
+        return {
+            "request_type": self.request_type.value,
+            "data": materialize(self.data),
+            "metadata": self.metadata,
+            "created_at": self.created_at,
+            "processing_log": self.processing_log,
+            "errors": self.errors,
+            "warnings": self.warnings
+        }
+    
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> 'ProcessingRequest':
+        """从 ``to_state`` 导出的状态恢复请求"""
+        request = cls(RequestType(state["request_type"]), state["data"], state["metadata"])
+        request.created_at = state["created_at"]
+        request._log = _EntryLog.from_dicts(state["processing_log"], "message", with_status=True)
+        if state["errors"]:
+            request._errors = _EntryLog.from_dicts(state["errors"], "error", with_status=False)
+        if state["warnings"]:
+            request._warnings = _EntryLog.from_dicts(state["warnings"], "warning", with_status=False)
+        return request
+    
+    @property
+    def log_count(self) -> int:
+        return len(self._log)
+    
+    @property
+    def error_count(self) -> int:
+        return len(self._errors) if self._errors is not None else 0
+    
+    @property
+    def warning_count(self) -> int:
+        return len(self._warnings) if self._warnings is not None else 0
+    
+    @property
+    def processing_log(self) -> List[Dict[str, Any]]:
+        """处理日志（字典形式）"""
+        return self._log.to_dicts("message")
+    
+    @property
+    def errors(self) -> List[Dict[str, Any]]:
+        """错误信息（字典形式）"""
+        return self._errors.to_dicts("error") if self._errors is not None else []
+    
+    @property
+    def warnings(self) -> List[Dict[str, Any]]:
+        """警告信息（字典形式）"""
+        return self._warnings.to_dicts("warning") if self._warnings is not None else []
 
 
 class BaseHandler(ABC):
     """处理器基类"""
     
+    # 处理器可能处理的请求类型，用于预先编译执行计划；None 表示未声明（视为可能匹配任意类型）
+    request_types: Optional[Tuple[RequestType, ...]] = None
+    # 处理器读取/写入的 request.data 字段，用于 DAG 链判断阶段间依赖；None 表示未声明（视为读写全部字段）
+    inputs: Optional[Tuple[str, ...]] = None
+    outputs: Optional[Tuple[str, ...]] = None
+    # 处理逻辑版本，参与结果缓存键的计算；修改处理逻辑时应递增
+    version: str = "1.0"
+    # 有副作用（如发送通知）的处理器应设为 False，使包含它的执行计划不使用结果缓存
+    cacheable: bool = True
+    # 可选阶段：请求的延迟预算用尽后跳过
+    optional: bool = False
+    
     def __init__(self, name: str):
         self.name = name
         self._next_handler: Optional['BaseHandler'] = None
     
+    @property
+    def is_async(self) -> bool:
+        """处理器是否以 ``async def process`` 实现"""
+        return inspect.iscoroutinefunction(self.process)
+    
     def set_next(self, handler: 'BaseHandler') -> 'BaseHandler':
         """设置下一个处理器"""
         self._next_handler = handler
         return handler
     
+    def iter_chain(self) -> Iterator['BaseHandler']:
+        """按链接顺序遍历从当前处理器开始的整条链"""
+        seen = set()
+        handler = self
+        while handler is not None:
+            if id(handler) in seen:
+                raise ValueError(f"责任链中存在循环引用: {handler.name}")
+            seen.add(id(handler))
+            yield handler
+            handler = handler._next_handler
+    
     def handle(self, request: ProcessingRequest) -> ProcessingRequest:
-        """处理请求"""
-        if self.can_handle(request):
-            logger.info(f"{self.name} 正在处理请求类型: {request.request_type.value}")
-            request.add_log(self.name, f"开始处理请求", "INFO")
-            try:
-                request = self.process(request)
-                request.add_log(self.name, f"处理完成", "SUCCESS")
-            except Exception as e:
-                error_msg = f"处理失败: {str(e)}"
-                request.add_error(self.name, error_msg)
-                logger.error(f"{self.name}: {error_msg}")
+        """处理请求（沿链迭代执行，不使用递归）"""
+        for handler in self.iter_chain():
+            if handler.can_handle(request):
+                request = handler._run(request)
+        return request
+    
+    def handle_batch(self, requests: List[ProcessingRequest]) -> List[ProcessingRequest]:
+        """批量处理请求（只处理当前处理器匹配的请求）"""
+        matching = [request for request in requests if self.can_handle(request)]
+        if matching:
+            self.process_batch(matching)
+        return requests
+    
+    def process_batch(self, requests: List[ProcessingRequest]) -> List[ProcessingRequest]:
+        """批量处理逻辑，默认逐条调用 process
+
+        子类可以覆盖此方法，在整个批次内共享准备工作；覆盖的实现需要原地处理请求，
+        并自行隔离单条请求的失败（通常对每条请求调用 ``_run``）。
+        """
+        if self.is_async:
+            # 异步处理器在同一个事件循环中并发处理整个批次
+            return run_coroutine(self._arun_all(requests))
+        return [self._run(request) for request in requests]
+    
+    def _run(self, request: ProcessingRequest, process=None) -> ProcessingRequest:
+        """执行当前处理器并记录日志和错误
+
+        Args:
+            request: 处理请求
+            process: 实际的处理函数，默认为 ``self.process``
+        """
+        if self.optional and request.budget_exhausted:
+            request.skip_stage(self.name, "延迟预算已用尽")
+            return request
         
-        # 传递给下一个处理器
-        if self._next_handler:
-            return self._next_handler.handle(request)
+        logger.info(f"{self.name} 正在处理请求类型: {request.request_type.value}")
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        request.add_log(self.name, f"开始处理请求", "INFO")
+        try:
+            result = (process or self.process)(request)
+            if inspect.isawaitable(result):
+                # 同步引擎中调用异步处理器
+                result = run_coroutine(result)
+            request = result
+            request.add_log(self.name, f"处理完成", "SUCCESS")
+        except Exception as e:
+            error_msg = f"处理失败: {str(e)}"
+            request.add_error(self.name, error_msg)
+            logger.error(f"{self.name}: {error_msg}")
+        self._record_timing(request, wall_start, cpu_start)
+        return request
+    
+    async def _arun_all(self, requests: List[ProcessingRequest]) -> List[ProcessingRequest]:
+        """在事件循环中并发处理多个请求"""
+        return list(await asyncio.gather(*(self._arun(request) for request in requests)))
+    
+    async def _arun(self, request: ProcessingRequest) -> ProcessingRequest:
+        """在事件循环中执行当前处理器，同步处理器被转移到线程中执行"""
+        if not self.is_async:
+            return await asyncio.to_thread(self._run, request)
+        if self.optional and request.budget_exhausted:
+            request.skip_stage(self.name, "延迟预算已用尽")
+            return request
         
+        logger.info(f"{self.name} 正在处理请求类型: {request.request_type.value}")
+        # 协程等待期间线程可能执行其他任务，CPU 时间为近似值
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        request.add_log(self.name, f"开始处理请求", "INFO")
+        try:
+            request = await self.process(request)
+            request.add_log(self.name, f"处理完成", "SUCCESS")
+        except Exception as e:
+            error_msg = f"处理失败: {str(e)}"
+            request.add_error(self.name, error_msg)
+            logger.error(f"{self.name}: {error_msg}")
+        self._record_timing(request, wall_start, cpu_start)
         return request
     
+    def _record_timing(self, request: ProcessingRequest, wall_start: float, cpu_start: float):
+        """记录本次调用的墙钟时间和 CPU 时间；metadata 中设置 debug 时同时附加到请求上"""
+        wall_time = time.perf_counter() - wall_start
+        cpu_time = time.thread_time() - cpu_start
+        profiler.record(self.name, request.request_type.value, wall_time, cpu_time)
+        if request.metadata.get('debug'):
+            request.metadata.setdefault('handler_timings', []).append({
+                'handler': self.name,
+                'wall_ms': wall_time * 1000,
+                'cpu_ms': cpu_time * 1000
+            })
+    
     @abstractmethod
     def can_handle(self, request: ProcessingRequest) -> bool:
         """判断是否可以处理此请求"""
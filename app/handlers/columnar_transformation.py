@@ -0,0 +1,184 @@
+"""
+按列转换 - 对批量请求中同一字段的值整列执行转换
+
+算术转换（multiply_/divide_/add_/subtract_）在整列都是数字时用 NumPy 数组运算完成
+（requirements.txt 中的依赖；未安装 NumPy 时导入给出警告，算术转换逐值执行）；
+round_ 和 to_number 为保持 Python 的舍入和解析规则，在一次整列遍历中逐值执行；
+uppercase、remove_special_chars、extract_numbers 把整列拼接后一次完成，strip 一次处理整列。
+结果（包括每个值的异常）与逐条转换完全一致：无法整列处理的值逐个转换。
+"""
+import re
+import logging
+import operator
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Sequence
+
+from handlers.transformation_dsl import DIGIT_PATTERN, SPECIAL_CHARS_PATTERN, FieldProgram
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+    logger.warning("未安装 NumPy，算术转换逐值执行")
+
+# float64 能精确表示的最大整数，超出时逐值转换
+_MAX_EXACT_INT = 2 ** 53
+
+# 拼接整列时使用的分隔符（不会被 remove_special_chars、extract_numbers、uppercase 改变）
+_SEPARATOR = '\n'
+# 拼接后的整列一次替换连续的字符
+_SPECIAL_CHARS_RUN_PATTERN = re.compile(r'[^a-zA-Z0-9\s]+')
+_NON_DIGIT_RUN_PATTERN = re.compile(r'[^\d\n]+')
+
+# 整列转换：值列表 -> 结果列表，无法保证与逐值转换一致时返回 None
+ColumnStep = Callable[[List[Any]], Optional[List[Any]]]
+
+
+class ColumnFailure:
+    """某个值的转换异常，按列转换后在对应请求中抛出"""
+
+    __slots__ = ('error',)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+def _is_numeric(values: Sequence[Any]) -> bool:
+    """整列都是 float64 可以精确表示的数字"""
+    types = set(map(type, values))
+    if not types <= {int, float, bool}:
+        return False
+    return int not in types or all(-_MAX_EXACT_INT <= value <= _MAX_EXACT_INT
+                                   for value in values if type(value) is int)
+
+
+def _strings(values: Sequence[Any]) -> List[str]:
+    return [value if type(value) is str else str(value) for value in values]
+
+
+def _joined(strings: List[str], transform: Callable[[str], str]) -> Optional[List[str]]:
+    """拼接整列后一次转换再拆分，值中含有分隔符时返回 None"""
+    joined = _SEPARATOR.join(strings)
+    if joined.count(_SEPARATOR) != len(strings) - 1:
+        return None
+    return transform(joined).split(_SEPARATOR)
+
+
+def _arithmetic(operation: Callable[[Any, Any], Any], operand: float) -> ColumnStep:
+    def step(values):
+        if np is None or not _is_numeric(values):
+            return None
+        with np.errstate(all='ignore'):
+            return operation(np.array(values, dtype=np.float64), operand).tolist()
+    return step
+
+
+def _rounding(decimals: int) -> ColumnStep:
+    def step(values):
+        if not _is_numeric(values):
+            return None
+        return [round(float(value), decimals) for value in values]
+    return step
+
+
+def _uppercase(values):
+    strings = _strings(values)
+    return _joined(strings, str.upper) or [string.upper() for string in strings]
+
+
+def _strip(values):
+    return [string.strip() for string in _strings(values)]
+
+
+def _remove_special_chars(values):
+    strings = _strings(values)
+    return (_joined(strings, lambda text: _SPECIAL_CHARS_RUN_PATTERN.sub('', text)) or
+            [SPECIAL_CHARS_PATTERN.sub('', string) for string in strings])
+
+
+def _extract_numbers(values):
+    strings = _strings(values)
+    return (_joined(strings, lambda text: _NON_DIGIT_RUN_PATTERN.sub('', text)) or
+            [''.join(DIGIT_PATTERN.findall(string)) for string in strings])
+
+
+_SIMPLE_COLUMN_STEPS = {
+    'uppercase': _uppercase,
+    'strip': _strip,
+    'remove_special_chars': _remove_special_chars,
+    'extract_numbers': _extract_numbers,
+}
+
+_ARITHMETIC = (
+    ('multiply_', operator.mul),
+    ('divide_', operator.truediv),
+    ('add_', operator.add),
+    ('subtract_', operator.sub),
+)
+
+
+@lru_cache(maxsize=1024)
+def compile_column_step(transformation: str) -> Optional[ColumnStep]:
+    """编译支持整列执行的转换，其余转换（以及参数无效的转换）返回 None"""
+    step = _SIMPLE_COLUMN_STEPS.get(transformation)
+    if step is not None:
+        return step
+    try:
+        for prefix, operation in _ARITHMETIC:
+            if transformation.startswith(prefix):
+                operand = float(transformation.split('_')[1])
+                # 除数为零时逐值转换，得到原有的异常
+                return _arithmetic(operation, operand) if operation is not operator.truediv or operand else None
+        if transformation.startswith('round_'):
+            return _rounding(int(transformation.split('_')[1]))
+    except ValueError:
+        return None
+    return None
+
+
+def supports_columns(program: FieldProgram) -> bool:
+    """字段的转换中是否有可以整列执行的转换"""
+    return any(isinstance(name, str) and compile_column_step(name) is not None for name in program.names)
+
+
+def transform_column(values: Sequence[Any], program: FieldProgram) -> List[Any]:
+    """按字段的转换依次整列转换
+
+    Returns:
+        每个值的转换结果，转换出错的值为 ``ColumnFailure``
+    """
+    results: List[Any] = list(values)
+    # 已出错的值不再参与后续转换；None 表示还没有值出错
+    pending: Optional[List[int]] = None
+    for name, step in zip(program.names, program.steps):
+        column = results if pending is None else [results[index] for index in pending]
+        column_step = compile_column_step(name) if isinstance(name, str) else None
+        transformed = None
+        if column_step is not None:
+            try:
+                transformed = column_step(column)
+            except Exception:
+                transformed = None
+
+        failed = False
+        if transformed is None:
+            # 逐值转换（to_number、format_ 等，以及无法整列处理的列）
+            transformed = []
+            for value in column:
+                try:
+                    transformed.append(step(value))
+                except Exception as e:
+                    transformed.append(ColumnFailure(e))
+                    failed = True
+
+        if pending is None:
+            results = transformed
+        else:
+            for index, value in zip(pending, transformed):
+                results[index] = value
+        if failed:
+            pending = [index for index in (pending if pending is not None else range(len(results)))
+                       if type(results[index]) is not ColumnFailure]
+    return results
@@ -0,0 +1,229 @@
+"""
+按列验证 - 对列式批量数据（每个字段一个数组）整列计算检查掩码，最后再展开为每条记录的错误
+
+检查项和消息与逐条验证（``validation_schema``）相同；列中的 None 视为该记录缺少此字段。
+掩码、长度和数值比较用 NumPy 数组运算完成（requirements.txt 中的依赖）；
+未安装 NumPy 的环境（如本地直接运行）使用等价但较慢的纯 Python 实现，并在导入时给出警告。
+"""
+import logging
+import operator
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from handlers.validation_schema import compile_field_rule, is_valid_email, is_valid_phone
+from handlers.cross_record_validation import ReferenceLookup, compile_cross_record_rules, find_violations
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+    logger.warning("未安装 NumPy，按列验证使用纯 Python 实现")
+
+# float64 能精确表示的最大整数，超出时数值比较改用 Python 对象比较
+_MAX_EXACT_INT = 2 ** 53
+
+
+def _mask(flags, count: int):
+    if np is not None:
+        return np.fromiter(flags, dtype=bool, count=count)
+    return list(flags)
+
+
+def _full(value: bool, count: int):
+    if np is not None:
+        return np.full(count, value, dtype=bool)
+    return [value] * count
+
+
+def _and(left, right):
+    if np is not None:
+        return left & right
+    return [a and b for a, b in zip(left, right)]
+
+
+def _or(left, right):
+    if np is not None:
+        return left | right
+    return [a or b for a, b in zip(left, right)]
+
+
+def _not(mask):
+    if np is not None:
+        return ~mask
+    return [not flag for flag in mask]
+
+
+def _indices(mask) -> List[int]:
+    if np is not None:
+        return np.flatnonzero(mask).tolist()
+    return [index for index, flag in enumerate(mask) if flag]
+
+
+def _compare(values, check, compare: Callable[[Any, Any], bool], limit):
+    """在 check 为真的位置比较 values 和 limit"""
+    if np is not None:
+        return check & compare(values, limit).astype(bool)
+    return [flag and compare(value, limit) for value, flag in zip(values, check)]
+
+
+class _Column:
+    """一列数据及按需计算的掩码"""
+
+    def __init__(self, values: Sequence[Any]):
+        self.values = values
+        self.count = len(values)
+        self.present = _mask((value is not None for value in values), self.count)
+        self._is_str = None
+        self._is_number = None
+        self._lengths = None
+        self._numbers = None
+
+    @property
+    def is_str(self):
+        if self._is_str is None:
+            self._is_str = _mask((isinstance(value, str) for value in self.values), self.count)
+        return self._is_str
+
+    @property
+    def is_number(self):
+        if self._is_number is None:
+            self._is_number = _mask((isinstance(value, (int, float)) for value in self.values), self.count)
+        return self._is_number
+
+    @property
+    def lengths(self):
+        """每个值 ``len(str(value))``"""
+        if self._lengths is None:
+            lengths = (len(value) if type(value) is str else len(str(value)) for value in self.values)
+            self._lengths = (np.fromiter(lengths, dtype=np.int64, count=self.count)
+                             if np is not None else list(lengths))
+        return self._lengths
+
+    @property
+    def numbers(self):
+        """数值数组，非数值的位置为占位值（比较结果由 is_number 掩码排除）"""
+        if self._numbers is None:
+            if np is None:
+                self._numbers = self.values
+            else:
+                numbers = [value if flag else 0 for value, flag in zip(self.values, self.is_number.tolist())]
+                exact = all(type(value) is not int or -_MAX_EXACT_INT <= value <= _MAX_EXACT_INT
+                            for value in numbers)
+                self._numbers = np.array(numbers, dtype=np.float64 if exact else object)
+        return self._numbers
+
+    def matches(self, predicate: Callable[[Any], bool], check):
+        """对 check 为真的位置逐个执行 predicate（正则等无法向量化的检查）"""
+        checked = _indices(check)
+        flags = _full(False, self.count)
+        for index in checked:
+            if predicate(self.values[index]):
+                flags[index] = True
+        return flags
+
+
+def validate_columns(columns: Dict[str, Sequence[Any]], required_fields: Sequence[str],
+                     validation_rules: Dict[str, Any],
+                     lookup: Optional[ReferenceLookup] = None) -> Dict[str, Any]:
+    """按列验证批量数据
+
+    Args:
+        columns: 字段名到值数组的映射，所有数组长度必须相同
+        required_fields: 必填字段
+        validation_rules: 验证规则，格式与逐条验证相同（包括跨记录规则）
+        lookup: 引用查询，默认使用当前设置的查询
+
+    Returns:
+        验证报告：记录总数、有效/无效记录数，以及有错误或警告的记录
+        （``{'index': 记录序号, 'errors': [...], 'warnings': [...]}``，按序号排列）
+    """
+    lengths = {field: len(values) for field, values in columns.items()}
+    if len(set(lengths.values())) > 1:
+        raise ValueError(f"列长度不一致: {lengths}")
+    count = next(iter(lengths.values()), 0)
+
+    compiled = []
+    for field, rule in validation_rules.items():
+        field_rule, well_formed = compile_field_rule(field, rule)
+        if not well_formed:
+            raise ValueError(f"字段 {field} 的验证规则格式错误")
+        compiled.append(field_rule)
+    cross_record_rules = compile_cross_record_rules(validation_rules)
+
+    data = {field: _Column(values) for field, values in columns.items()}
+    errors: Dict[int, List[str]] = {}
+    warnings: Dict[int, List[str]] = {}
+
+    def emit(target: Dict[int, List[str]], mask, message: str):
+        for index in _indices(mask):
+            target.setdefault(index, []).append(message)
+
+    # 必填字段：缺少任一必填字段的记录只报告缺少的字段，不再做其他检查
+    missing_by_record: Dict[int, List[str]] = {}
+    missing_any = _full(False, count)
+    for field in required_fields:
+        missing = _not(data[field].present) if field in data else _full(True, count)
+        for index in _indices(missing):
+            missing_by_record.setdefault(index, []).append(field)
+        missing_any = _or(missing_any, missing)
+    for index, missing_fields in missing_by_record.items():
+        errors[index] = [f"缺少必填字段: {missing_fields}"]
+    active = _not(missing_any)
+
+    checks = [(field_rule, data[field_rule[0]], _and(active, data[field_rule[0]].present))
+              for field_rule in compiled if field_rule[0] in data]
+
+    # 类型检查（所有字段）在前，业务规则检查在后，与逐条验证的消息顺序一致
+    for (field, _, field_type, *_), column, check in checks:
+        if field_type == 'string':
+            emit(errors, _and(check, _not(column.is_str)), f"字段 {field} 应为字符串类型")
+        elif field_type == 'number':
+            emit(errors, _and(check, _not(column.is_number)), f"字段 {field} 应为数字类型")
+        elif field_type == 'email':
+            emit(errors, column.matches(lambda value: not is_valid_email(value), check),
+                 f"字段 {field} 不是有效的邮箱格式")
+        elif field_type == 'phone':
+            emit(warnings, column.matches(lambda value: not is_valid_phone(value), check),
+                 f"字段 {field} 可能不是有效的电话号码格式")
+
+    for (field, rule, _, min_length, max_length, min_value, max_value, pattern), column, check in checks:
+        if min_length is not None:
+            emit(warnings, _compare(column.lengths, check, operator.lt, min_length),
+                 f"字段 {field} 长度不足最小要求 {rule['min_length']}")
+        if max_length is not None:
+            emit(errors, _compare(column.lengths, check, operator.gt, max_length),
+                 f"字段 {field} 长度超过最大限制 {rule['max_length']}")
+        if min_value is not None:
+            emit(errors, _compare(column.numbers, _and(check, column.is_number), operator.lt, min_value),
+                 f"字段 {field} 值小于最小值 {rule['min_value']}")
+        if max_value is not None:
+            emit(errors, _compare(column.numbers, _and(check, column.is_number), operator.gt, max_value),
+                 f"字段 {field} 值大于最大值 {rule['max_value']}")
+        if pattern is not None:
+            emit(errors, column.matches(lambda value: not pattern.match(str(value)), check),
+                 f"字段 {field} 不匹配所需格式")
+
+    # 跨记录规则（唯一性、引用）在业务规则之后
+    checked = {field_rule[0]: check for field_rule, _, check in checks}
+    groups = {rule: [(index, columns[rule.field][index]) for index in _indices(checked[rule.field])]
+              for rule in cross_record_rules if rule.field in checked}
+    if groups:
+        cross_errors, cross_warnings = find_violations(groups, lookup)
+        for rule, entries in groups.items():
+            for index, _ in entries:
+                if (rule, index) in cross_errors:
+                    errors.setdefault(index, []).extend(cross_errors[(rule, index)])
+                if (rule, index) in cross_warnings:
+                    warnings.setdefault(index, []).extend(cross_warnings[(rule, index)])
+
+    records = [
+        {'index': index, 'errors': errors.get(index, []), 'warnings': warnings.get(index, [])}
+        for index in sorted(errors.keys() | warnings.keys())
+    ]
+    return {
+        'total_records': count,
+        'valid_records': count - len(errors),
+        'invalid_records': len(errors),
+        'records': records
+    }
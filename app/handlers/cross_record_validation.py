@@ -0,0 +1,191 @@
+"""
+跨记录验证 - 批次内唯一性检查和数据库引用检查
+
+规则（写在 validation_rules 的字段规则中）:
+    unique          批次内取值不能重复，重复的记录（第一次出现之后的）报告错误
+    exists_in       取值必须存在于引用列中，如 ``users.email``
+    not_exists_in   取值不能存在于引用列中，如 ``users.username``
+
+批次内唯一性用哈希集合检查，分块处理的批量任务通过 ``CrossRecordState`` 在各块之间保留已出现的取值；引用检查把整个批次的取值去重后，每个引用列按块执行 IN 查询，
+不再逐条记录查询数据库。引用查询失败时相关记录得到警告，不影响其他检查。
+"""
+import os
+import json
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+# 支持的引用列（均为 users 表上的唯一索引列）
+REFERENCES = ('users.email', 'users.username')
+REFERENCE_LOOKUP_CHUNK_SIZE = int(os.getenv("REFERENCE_LOOKUP_CHUNK_SIZE", "500"))
+
+# 引用查询：(引用列, 取值列表) -> 其中存在的取值
+ReferenceLookup = Callable[[str, List[Any]], Set[Any]]
+
+
+class CrossRecordRule(NamedTuple):
+    """单个字段的跨记录规则"""
+    field: str
+    unique: bool
+    exists_in: Optional[str]
+    not_exists_in: Optional[str]
+
+
+def compile_cross_record_rules(validation_rules: Dict[str, Any]) -> Tuple[CrossRecordRule, ...]:
+    """提取验证规则中的跨记录规则，引用列不受支持时抛出 ValueError"""
+    compiled = []
+    for field, rule in validation_rules.items():
+        if not isinstance(rule, dict):
+            continue
+        exists_in = rule.get('exists_in') or None
+        not_exists_in = rule.get('not_exists_in') or None
+        for reference in (exists_in, not_exists_in):
+            if reference is not None and reference not in REFERENCES:
+                raise ValueError(f"字段 {field} 的引用列不受支持: {reference}，可用: {', '.join(REFERENCES)}")
+        if rule.get('unique') or exists_in or not_exists_in:
+            compiled.append(CrossRecordRule(field, bool(rule.get('unique')), exists_in, not_exists_in))
+    return tuple(compiled)
+
+
+def database_lookup(reference: str, values: List[Any]) -> Set[Any]:
+    """在数据库中按块查询存在的取值"""
+    from database import SessionLocal, find_existing_values
+
+    db = SessionLocal()
+    try:
+        return find_existing_values(db, reference, values, REFERENCE_LOOKUP_CHUNK_SIZE)
+    finally:
+        db.close()
+
+
+_reference_lookup: ReferenceLookup = database_lookup
+
+
+def get_reference_lookup() -> ReferenceLookup:
+    return _reference_lookup
+
+
+def set_reference_lookup(lookup: Optional[ReferenceLookup]):
+    """替换引用查询（测试或基准测试时使用内存数据），传入 None 时恢复为数据库查询"""
+    global _reference_lookup
+    _reference_lookup = lookup if lookup is not None else database_lookup
+
+
+def _hash_key(value: Any) -> Any:
+    """取值的哈希键，不可哈希的值（列表、对象）按规范化 JSON 比较"""
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class CrossRecordState:
+    """批次范围的跨记录检查状态：每条唯一性规则已出现的取值
+
+    分块处理的批量任务和流式任务为整个任务创建一个状态，挂在每个请求的 ``cross_record_state`` 上，
+    使唯一性在整个批次内检查，而不只是在一次 ``process_batch`` 的块内检查。
+    """
+
+    __slots__ = ('seen',)
+
+    def __init__(self):
+        self.seen: Dict[CrossRecordRule, Set[Any]] = {}
+
+    def seen_values(self, rule: CrossRecordRule) -> Set[Any]:
+        return self.seen.setdefault(rule, set())
+
+
+# 检查结果：(规则, 记录序号) -> 消息列表
+Violations = Dict[Tuple[CrossRecordRule, int], List[str]]
+
+
+def find_violations(groups: Dict[CrossRecordRule, Iterable[Tuple[int, Any]]],
+                    lookup: Optional[ReferenceLookup] = None,
+                    state: Optional[CrossRecordState] = None) -> Tuple[Violations, Violations]:
+    """检查跨记录规则
+
+    Args:
+        groups: 每条规则参与检查的 (记录序号, 取值)，取值为 None 或字段缺失的记录不应包含在内
+        lookup: 引用查询，默认使用当前设置的查询
+        state: 批次范围的状态，设置时与之前各块中出现过的取值一起检查唯一性，并记录本次的取值
+
+    Returns:
+        (错误, 警告)，键为 (规则, 记录序号)
+    """
+    lookup = lookup or get_reference_lookup()
+    groups = {rule: list(entries) for rule, entries in groups.items()}
+    errors: Violations = {}
+    warnings: Violations = {}
+
+    # 每个引用列只查询一次（去重后的字符串取值）
+    requested: Dict[str, Set[str]] = {}
+    for rule, entries in groups.items():
+        for reference in (rule.exists_in, rule.not_exists_in):
+            if reference is not None:
+                requested.setdefault(reference, set()).update(
+                    value for _, value in entries if isinstance(value, str))
+    existing: Dict[str, Set[str]] = {}
+    failures: Dict[str, str] = {}
+    for reference, values in requested.items():
+        try:
+            found = lookup(reference, sorted(values)) if values else set()
+        except Exception as e:
+            failures[reference] = str(e)
+            continue
+        # MySQL 默认排序规则不区分大小写，数据库返回的取值按忽略大小写比较
+        existing[reference] = {value.casefold() for value in found if isinstance(value, str)}
+
+    for rule, entries in groups.items():
+        seen = state.seen_values(rule) if state is not None else set()
+        for index, value in entries:
+            if rule.unique:
+                key = _hash_key(value)
+                if key in seen:
+                    errors.setdefault((rule, index), []).append(f"字段 {rule.field} 的值在批次中重复: {value}")
+                seen.add(key)
+
+            for reference, must_exist in ((rule.exists_in, True), (rule.not_exists_in, False)):
+                if reference is None:
+                    continue
+                if reference in failures:
+                    warnings.setdefault((rule, index), []).append(
+                        f"字段 {rule.field} 的引用检查失败（{reference}）: {failures[reference]}")
+                    continue
+                exists = isinstance(value, str) and value.casefold() in existing[reference]
+                if must_exist and not exists:
+                    errors.setdefault((rule, index), []).append(
+                        f"字段 {rule.field} 的值在 {reference} 中不存在: {value}")
+                elif not must_exist and exists:
+                    errors.setdefault((rule, index), []).append(
+                        f"字段 {rule.field} 的值在 {reference} 中已存在: {value}")
+    return errors, warnings
+
+
+def check_records(records: Sequence[Optional[Tuple[Dict[str, Any], Tuple[CrossRecordRule, ...]]]],
+                  lookup: Optional[ReferenceLookup] = None,
+                  state: Optional[CrossRecordState] = None) -> List[Tuple[List[str], List[str]]]:
+    """检查一批记录（每条记录为 (负载, 跨记录规则)，None 表示不参与检查）
+
+    规则相同的记录互相检查唯一性（设置 state 时还与之前各块的记录比较）。返回每条记录的 (错误列表, 警告列表)，
+    消息按该记录的规则顺序排列。
+    """
+    groups: Dict[CrossRecordRule, List[Tuple[int, Any]]] = {}
+    for index, record in enumerate(records):
+        if record is None:
+            continue
+        payload, rules = record
+        for rule in rules:
+            value = payload.get(rule.field)
+            if value is not None:
+                groups.setdefault(rule, []).append((index, value))
+
+    errors, warnings = find_violations(groups, lookup, state)
+    results: List[Tuple[List[str], List[str]]] = []
+    for index, record in enumerate(records):
+        record_errors: List[str] = []
+        record_warnings: List[str] = []
+        if record is not None:
+            for rule in record[1]:
+                record_errors.extend(errors.get((rule, index), ()))
+                record_warnings.extend(warnings.get((rule, index), ()))
+        results.append((record_errors, record_warnings))
+    return results
@@ -3,27 +3,128 @@
 """
 import time
 import random
-from handlers import BaseHandler, ProcessingRequest, RequestType
+from typing import List
+from handlers import BaseHandler, PayloadView, ProcessingRequest, RequestType
+from handlers.latency import simulate_latency
+from reference_store import ReferenceData, reference_fingerprint, reference_key
+
+# 内置的参考数据，REFERENCE_DATA_DIR 下没有对应的参考数据文件时使用
+BUILTIN_COUNTRIES = {
+    'USA': {
+        'continent': 'North America',
+        'timezone': 'UTC-5',
+        'currency': 'USD',
+        'country_code': 'US',
+        'language': 'English'
+    },
+    'China': {
+        'continent': 'Asia',
+        'timezone': 'UTC+8',
+        'currency': 'CNY',
+        'country_code': 'CN',
+        'language': 'Chinese'
+    },
+    'Germany': {
+        'continent': 'Europe',
+        'timezone': 'UTC+1',
+        'currency': 'EUR',
+        'country_code': 'DE',
+        'language': 'German'
+    },
+    'Japan': {
+        'continent': 'Asia',
+        'timezone': 'UTC+9',
+        'currency': 'JPY',
+        'country_code': 'JP',
+        'language': 'Japanese'
+    },
+    'United Kingdom': {
+        'continent': 'Europe',
+        'timezone': 'UTC+0',
+        'currency': 'GBP',
+        'country_code': 'GB',
+        'language': 'English'
+    }
+}
+
+BUILTIN_COMPANIES = {
+    'Google': {
+        'industry': 'Technology',
+        'size': 'Large',
+        'founded': 1998,
+        'headquarters': 'Mountain View, CA'
+    },
+    'Microsoft': {
+        'industry': 'Technology',
+        'size': 'Large',
+        'founded': 1975,
+        'headquarters': 'Redmond, WA'
+    },
+    'Apple': {
+        'industry': 'Technology',
+        'size': 'Large',
+        'founded': 1976,
+        'headquarters': 'Cupertino, CA'
+    }
+}
+
+BUILTIN_CITIES = {
+    'New York': {'population': 8400000, 'area_km2': 783},
+    'Beijing': {'population': 21540000, 'area_km2': 16411},
+    'London': {'population': 8982000, 'area_km2': 1572},
+    'Tokyo': {'population': 13960000, 'area_km2': 2194}
+}
+
+# 进程内所有处理器实例共用的参考表（参考数据文件以内存映射打开，prefork 子进程共享页缓存）
+COUNTRIES = ReferenceData('countries', BUILTIN_COUNTRIES)
+CITIES = ReferenceData('cities', BUILTIN_CITIES)
+POSTAL_CODES = ReferenceData('postal_codes', {})
+COMPANIES = ReferenceData('companies', BUILTIN_COMPANIES)
+REFERENCE_TABLES = (COUNTRIES, CITIES, POSTAL_CODES, COMPANIES)
 
 
 class DataEnrichmentHandler(BaseHandler):
     """数据丰富化处理器"""
     
+    request_types = (RequestType.DATA_ENRICHMENT,)
+    inputs = ('payload',)
+    outputs = ('enriched_payload',)
+    
     def __init__(self):
         super().__init__("DataEnrichmentHandler")
-        self._geo_database = self._init_geo_database()
-        self._company_database = self._init_company_database()
+    
+    @property
+    def version(self) -> str:
+        """处理逻辑版本，加载了参考数据文件时附带其指纹（重新构建参考数据后缓存结果随之失效）"""
+        fingerprint = reference_fingerprint(table.name for table in REFERENCE_TABLES)
+        return f"2.0+ref.{fingerprint}" if fingerprint else '2.0'
     
     def can_handle(self, request: ProcessingRequest) -> bool:
         return request.request_type == RequestType.DATA_ENRICHMENT
     
     def process(self, request: ProcessingRequest) -> ProcessingRequest:
         """执行数据丰富化"""
+        self._enrich(request)
+        
+        # 模拟丰富化处理时间
+        simulate_latency('enrichment', 0.7)
+        return request
+    
+    def process_batch(self, requests: List[ProcessingRequest]) -> List[ProcessingRequest]:
+        """批量执行数据丰富化，整个批次只产生一次模拟处理时间"""
+        for request in requests:
+            self._run(request, self._enrich)
+        
+        simulate_latency('enrichment', 0.7)
+        return requests
+    
+    def _enrich(self, request: ProcessingRequest) -> ProcessingRequest:
+        """丰富化单个请求的数据"""
         data = request.data
         payload = data.get('payload', {})
         
-        # 创建丰富化数据副本
-        enriched_data = payload.copy()
+        # 创建丰富化数据视图（只记录新增和修改的字段）
+        enriched_data = PayloadView(payload)
         
         # 添加基础元数据
         enriched_data['_metadata'] = self._create_metadata()
@@ -34,14 +135,15 @@ class DataEnrichmentHandler(BaseHandler):
         self._enrich_geographic_info(enriched_data, request)
         self._enrich_demographic_info(enriched_data, request)
         self._enrich_professional_info(enriched_data, request)
-        self._enrich_behavioral_info(enriched_data, request)
+        # 行为预测是可选的子步骤，延迟预算用尽时跳过
+        if request.budget_exhausted:
+            request.skip_stage(f"{self.name}.behavioral_info", "延迟预算已用尽")
+        else:
+            self._enrich_behavioral_info(enriched_data, request)
         
         # 保存丰富化结果
         request.data['enriched_payload'] = enriched_data
         
-        # 模拟丰富化处理时间
-        time.sleep(0.7)
-        
         rules_count = len(enriched_data['_metadata']['enrichment_rules_applied'])
         request.add_log(self.name, f"应用了 {rules_count} 个丰富化规则")
         return request
@@ -119,8 +221,8 @@ class DataEnrichmentHandler(BaseHandler):
         # 国家信息丰富化
         if 'country' in data:
             country = data['country']
-            if country in self._geo_database:
-                geo_info = self._geo_database[country]
+            geo_info = COUNTRIES.get(country)
+            if geo_info is not None:
                 data['geo_info'] = geo_info.copy()
                 data['continent'] = geo_info['continent']
                 data['timezone'] = geo_info['timezone']
@@ -279,15 +381,12 @@ class DataEnrichmentHandler(BaseHandler):
         return result
     
     def _get_city_info(self, city: str, country: str = None) -> dict:
-        """获取城市信息（模拟）"""
-        # 这里应该连接真实的城市数据库
-        mock_cities = {
-            'New York': {'population': 8400000, 'area_km2': 783},
-            'Beijing': {'population': 21540000, 'area_km2': 16411},
-            'London': {'population': 8982000, 'area_km2': 1572},
-            'Tokyo': {'population': 13960000, 'area_km2': 2194}
-        }
-        return mock_cities.get(city)
+        """获取城市信息（先按 国家|城市 查找，再按城市名查找）"""
+        if country is not None and isinstance(city, str):
+            city_info = CITIES.get(reference_key(country, city))
+            if city_info is not None:
+                return city_info
+        return CITIES.get(city)
     
     def _analyze_postal_code(self, postal_code: str, country: str = None) -> dict:
         """分析邮政编码"""
@@ -302,6 +401,12 @@ class DataEnrichmentHandler(BaseHandler):
                 result['postal_type'] = 'China Postal'
                 result['province_code'] = postal_code[:2]
         
+        # 参考数据中的邮政编码信息（按 国家名|邮政编码 查找，与城市的键相同）
+        if country is not None and isinstance(postal_code, str):
+            postal_info = POSTAL_CODES.get(reference_key(country, postal_code))
+            if postal_info is not None:
+                result.update(postal_info)
+        
         return result
     
     def _guess_gender(self, first_name: str) -> str:
@@ -349,7 +454,7 @@ class DataEnrichmentHandler(BaseHandler):
     
     def _get_company_info(self, company: str) -> dict:
         """获取公司信息"""
-        return self._company_database.get(company)
+        return COMPANIES.get(company)
     
     def _estimate_income(self, job_title: str, age: int) -> str:
         """估算收入范围"""
@@ -453,66 +558,3 @@ class DataEnrichmentHandler(BaseHandler):
             return "Summer"
         else:
             return "Fall"
-    
-    def _init_geo_database(self) -> dict:
-        """初始化地理数据库"""
-        return {
-            'USA': {
-                'continent': 'North America',
-                'timezone': 'UTC-5',
-                'currency': 'USD',
-                'country_code': 'US',
-                'language': 'English'
-            },
-            'China': {
-                'continent': 'Asia',
-                'timezone': 'UTC+8',
-                'currency': 'CNY',
-                'country_code': 'CN',
-                'language': 'Chinese'
-            },
-            'Germany': {
-                'continent': 'Europe',
-                'timezone': 'UTC+1',
-                'currency': 'EUR',
-                'country_code': 'DE',
-                'language': 'German'
-            },
-            'Japan': {
-                'continent': 'Asia',
-                'timezone': 'UTC+9',
-                'currency': 'JPY',
-                'country_code': 'JP',
-                'language': 'Japanese'
-            },
-            'United Kingdom': {
-                'continent': 'Europe',
-                'timezone': 'UTC+0',
-                'currency': 'GBP',
-                'country_code': 'GB',
-                'language': 'English'
-            }
-        }
-    
-    def _init_company_database(self) -> dict:
-        """初始化公司数据库"""
-        return {
-            'Google': {
-                'industry': 'Technology',
-                'size': 'Large',
-                'founded': 1998,
-                'headquarters': 'Mountain View, CA'
-            },
-            'Microsoft': {
-                'industry': 'Technology',
-                'size': 'Large',
-                'founded': 1975,
-                'headquarters': 'Redmond, WA'
-            },
-            'Apple': {
-                'industry': 'Technology',
-                'size': 'Large',
-                'founded': 1976,
-                'headquarters': 'Cupertino, CA'
-            }
-        }
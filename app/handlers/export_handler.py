@@ -6,12 +6,19 @@ import csv
 import time
 import xml.etree.ElementTree as ET
 from io import StringIO
-from handlers import BaseHandler, ProcessingRequest, RequestType
+from handlers import BaseHandler, PayloadView, ProcessingRequest, RequestType, materialize
+from handlers.latency import simulate_latency
 
 
 class DataExportHandler(BaseHandler):
     """数据导出处理器"""
     
+    request_types = (RequestType.DATA_EXPORT,)
+    # source='full' 或自定义 source 时读取的字段超出此声明，DAG 链中需显式声明输入
+    inputs = ('export_config', 'payload', 'enriched_payload', 'transformed_data')
+    # 未指定文件名时会写回 export_config['filename']
+    outputs = ('export_result', 'export_error', 'export_config')
+    
     def __init__(self):
         super().__init__("DataExportHandler")
         self._export_formats = {
@@ -65,7 +72,7 @@ class DataExportHandler(BaseHandler):
             request.data['export_result'] = export_result
             
             # 模拟导出处理时间
-            time.sleep(0.5)
+            simulate_latency('export', 0.5)
             
             request.add_log(self.name, f"导出 {export_result['record_count']} 条记录为 {export_format.upper()} 格式")
         else:
@@ -86,7 +93,7 @@ class DataExportHandler(BaseHandler):
         elif source == 'transformed_data':
             export_data = data.get('transformed_data', data.get('payload', {}))
         elif source == 'full':
-            export_data = data.copy()
+            export_data = PayloadView(data)
         else:
             export_data = data.get(source, {})
         
@@ -98,11 +105,16 @@ class DataExportHandler(BaseHandler):
                     filtered_data[field] = export_data[field]
             export_data = filtered_data
         
-        # 应用字段排除
+        # 应用字段排除（在视图上删除，不修改请求中的数据）
         if 'exclude_fields' in config:
+            if not isinstance(export_data, PayloadView):
+                export_data = PayloadView(export_data)
             for field in config['exclude_fields']:
                 export_data.pop(field, None)
         
+        # 导出格式按 dict 处理数据
+        export_data = materialize(export_data)
+        
         # 应用数据转换
         if config.get('flatten', False):
             export_data = self._flatten_dict(export_data)
@@ -353,6 +365,11 @@ class DataExportHandler(BaseHandler):
 class ReportExportHandler(BaseHandler):
     """报告导出处理器"""
     
+    request_types = (RequestType.DATA_EXPORT,)
+    inputs = ('export_config', 'payload', 'logs')
+    outputs = ('report_result', 'report_error')
+    optional = True
+    
     def __init__(self):
         super().__init__("ReportExportHandler")
         self._report_templates = {
@@ -0,0 +1,187 @@
+"""
+模拟耗时模型 - 所有处理器通过同一个模型产生模拟的处理/外部调用耗时
+
+模式（环境变量 CHAIN_LATENCY_MODE）:
+    default       使用处理器中的默认耗时（固定值或均匀分布区间），乘以 CHAIN_LATENCY_SCALE
+    zero          不产生任何耗时，用于基准测试和负载测试测量实际的 CPU 开销
+    fixed         每次都使用 CHAIN_LATENCY_FIXED_MS 毫秒
+    distribution  从 CHAIN_LATENCY_FILE 中记录的耗时分布随机采样
+    replay        按顺序回放 CHAIN_LATENCY_FILE 中记录的耗时序列（循环）
+
+CHAIN_LATENCY_FILE 为 JSON 对象，键为耗时名称（如 ``validation``、``notification.email``），
+值为毫秒耗时样本列表，或百分位摘要（如 /chain/profile 导出的
+``{"p50_ms": .., "p90_ms": .., "p99_ms": .., "max_ms": ..}``）。文件中没有的名称使用默认耗时。
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# 默认耗时：固定秒数，或 (最小值, 最大值) 均匀分布区间
+DefaultLatency = Union[float, Tuple[float, float]]
+
+LATENCY_MODES = ('default', 'zero', 'fixed', 'distribution', 'replay')
+
+# 百分位摘要中的键及其对应的累积概率
+_PERCENTILE_KEYS = (
+    ('min_ms', 0.0), ('p50_ms', 0.5), ('p90_ms', 0.9), ('p99_ms', 0.99),
+    ('p999_ms', 0.999), ('max_ms', 1.0)
+)
+
+
+def _percentile_points(summary: Dict[str, float]) -> Tuple[List[float], List[float]]:
+    """把百分位摘要转换为 (累积概率, 毫秒) 的分段线性逆分布函数"""
+    probabilities: List[float] = []
+    values: List[float] = []
+    for key, probability in _PERCENTILE_KEYS:
+        if key in summary:
+            probabilities.append(probability)
+            values.append(float(summary[key]))
+    if not values:
+        raise ValueError("百分位摘要中没有可用的百分位")
+    if probabilities[0] > 0.0:
+        probabilities.insert(0, 0.0)
+        values.insert(0, values[0])
+    if probabilities[-1] < 1.0:
+        probabilities.append(1.0)
+        values.append(values[-1])
+    return probabilities, values
+
+
+class LatencyModel:
+    """模拟耗时模型
+
+    Args:
+        mode: 耗时模式，见 ``LATENCY_MODES``
+        scale: default 模式下默认耗时的缩放比例
+        fixed_ms: fixed 模式的耗时（毫秒）
+        recorded: distribution/replay 模式使用的记录，键为耗时名称
+        seed: 随机种子，便于复现
+    """
+
+    def __init__(self, mode: str = 'default', scale: float = 1.0, fixed_ms: float = 0.0,
+                 recorded: Optional[Dict[str, Any]] = None, seed: Optional[int] = None):
+        if mode not in LATENCY_MODES:
+            raise ValueError(f"未知的耗时模式: {mode}")
+        if mode in ('distribution', 'replay') and not recorded:
+            raise ValueError(f"{mode} 模式需要耗时记录")
+        self.mode = mode
+        self.scale = scale
+        self.fixed = fixed_ms / 1000.0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[float]] = {}
+        self._percentiles: Dict[str, Tuple[List[float], List[float]]] = {}
+        self._positions: Dict[str, int] = {}
+        for key, record in (recorded or {}).items():
+            if isinstance(record, dict):
+                if mode == 'replay':
+                    raise ValueError(f"replay 模式需要耗时序列: {key}")
+                self._percentiles[key] = _percentile_points(record)
+            elif record:
+                self._samples[key] = [float(value) / 1000.0 for value in record]
+
+    @classmethod
+    def from_file(cls, path: str, mode: str = 'distribution', seed: Optional[int] = None) -> 'LatencyModel':
+        """从耗时记录文件创建模型"""
+        with open(path, encoding='utf-8') as f:
+            return cls(mode, recorded=json.load(f), seed=seed)
+
+    @classmethod
+    def from_env(cls) -> 'LatencyModel':
+        """按环境变量创建模型"""
+        mode = os.getenv("CHAIN_LATENCY_MODE", "default")
+        seed = os.getenv("CHAIN_LATENCY_SEED")
+        seed = int(seed) if seed else None
+        if mode in ('distribution', 'replay'):
+            return cls.from_file(os.environ["CHAIN_LATENCY_FILE"], mode, seed)
+        return cls(mode,
+                   scale=float(os.getenv("CHAIN_LATENCY_SCALE", "1.0")),
+                   fixed_ms=float(os.getenv("CHAIN_LATENCY_FIXED_MS", "0")),
+                   seed=seed)
+
+    def _default(self, default: DefaultLatency) -> float:
+        if isinstance(default, tuple):
+            with self._lock:
+                return self._random.uniform(*default) * self.scale
+        return default * self.scale
+
+    def delay(self, key: str, default: DefaultLatency) -> float:
+        """计算一次耗时（秒）"""
+        if self.mode == 'zero':
+            return 0.0
+        if self.mode == 'fixed':
+            return self.fixed
+        if self.mode == 'default':
+            return self._default(default)
+
+        samples = self._samples.get(key)
+        if samples is not None:
+            with self._lock:
+                if self.mode == 'replay':
+                    position = self._positions.get(key, 0)
+                    self._positions[key] = (position + 1) % len(samples)
+                    return samples[position]
+                return self._random.choice(samples)
+
+        points = self._percentiles.get(key)
+        if points is not None:
+            with self._lock:
+                target = self._random.random()
+            return self._interpolate(points, target) / 1000.0
+        return self._default(default)
+
+    @staticmethod
+    def _interpolate(points: Tuple[List[float], List[float]], target: float) -> float:
+        probabilities, values = points
+        index = bisect.bisect_left(probabilities, target)
+        if index == 0:
+            return values[0]
+        if index >= len(probabilities):
+            return values[-1]
+        low, high = probabilities[index - 1], probabilities[index]
+        fraction = (target - low) / (high - low) if high > low else 0.0
+        return values[index - 1] + (values[index] - values[index - 1]) * fraction
+
+    def sleep(self, key: str, default: DefaultLatency):
+        """阻塞当前线程模拟耗时"""
+        seconds = self.delay(key, default)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    async def asleep(self, key: str, default: DefaultLatency):
+        """在事件循环中模拟耗时"""
+        seconds = self.delay(key, default)
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+
+_latency_model: Optional[LatencyModel] = None
+
+
+def get_latency_model() -> LatencyModel:
+    """获取进程内共享的耗时模型（首次使用时按环境变量创建）"""
+    global _latency_model
+    if _latency_model is None:
+        _latency_model = LatencyModel.from_env()
+    return _latency_model
+
+
+def set_latency_model(model: Optional[LatencyModel]):
+    """替换进程内共享的耗时模型，传入 None 时下次使用按环境变量重新创建"""
+    global _latency_model
+    _latency_model = model
+
+
+def simulate_latency(key: str, default: DefaultLatency):
+    """按当前耗时模型阻塞模拟耗时"""
+    get_latency_model().sleep(key, default)
+
+
+async def asimulate_latency(key: str, default: DefaultLatency):
+    """按当前耗时模型在事件循环中模拟耗时"""
+    await get_latency_model().asleep(key, default)
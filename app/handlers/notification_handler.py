@@ -3,14 +3,21 @@
 """
 import time
 import json
+import asyncio
 import random
 from datetime import datetime, timedelta
 from handlers import BaseHandler, ProcessingRequest, RequestType
+from handlers.latency import simulate_latency, asimulate_latency
 
 
 class NotificationHandler(BaseHandler):
     """通知处理器"""
     
+    request_types = (RequestType.NOTIFICATION,)
+    inputs = ('notification_config', 'payload', 'logs', 'error', 'task_id', 'processing_time')
+    outputs = ('notification_result',)
+    cacheable = False
+    
     def __init__(self):
         super().__init__("NotificationHandler")
         self._notification_channels = {
@@ -32,7 +39,7 @@ class NotificationHandler(BaseHandler):
     def can_handle(self, request: ProcessingRequest) -> bool:
         return request.request_type == RequestType.NOTIFICATION
     
-    def process(self, request: ProcessingRequest) -> ProcessingRequest:
+    async def process(self, request: ProcessingRequest) -> ProcessingRequest:
         """执行通知发送"""
         data = request.data
         notification_config = data.get('notification_config', {})
@@ -48,36 +55,20 @@ class NotificationHandler(BaseHandler):
         # 准备通知内容
         notification_content = self._prepare_notification_content(data, notification_config)
         
-        # 发送结果
-        send_results = []
-        
-        # 逐个渠道发送通知
-        for channel in channels:
-            if channel in self._notification_channels:
-                try:
-                    result = self._notification_channels[channel](notification_content, notification_config)
-                    send_results.append({
-                        'channel': channel,
-                        'status': 'success',
-                        'result': result,
-                        'sent_at': time.time()
-                    })
-                    request.add_log(self.name, f"通过 {channel} 渠道发送通知成功")
-                except Exception as e:
-                    send_results.append({
-                        'channel': channel,
-                        'status': 'failed',
-                        'error': str(e),
-                        'sent_at': time.time()
-                    })
-                    request.add_log(self.name, f"通过 {channel} 渠道发送通知失败: {str(e)}")
+        # 各渠道并发发送通知（发送本身是 I/O 等待，放到线程中执行）
+        send_results = await asyncio.gather(
+            *(self._send_via_channel(channel, notification_content, notification_config)
+              for channel in channels)
+        )
+        
+        # 按渠道顺序记录日志
+        for send_result in send_results:
+            channel = send_result['channel']
+            if send_result['status'] == 'success':
+                request.add_log(self.name, f"通过 {channel} 渠道发送通知成功")
+            elif channel in self._notification_channels:
+                request.add_log(self.name, f"通过 {channel} 渠道发送通知失败: {send_result['error']}")
             else:
-                send_results.append({
-                    'channel': channel,
-                    'status': 'failed',
-                    'error': f"Unsupported channel: {channel}",
-                    'sent_at': time.time()
-                })
                 request.add_log(self.name, f"不支持的通知渠道: {channel}")
         
         # 保存通知结果
@@ -94,10 +85,36 @@ class NotificationHandler(BaseHandler):
         request.data['notification_result'] = notification_result
         
         # 模拟通知处理时间
-        time.sleep(0.3)
+        await asimulate_latency('notification', 0.3)
         
         return request
     
+    async def _send_via_channel(self, channel: str, content: dict, config: dict) -> dict:
+        """通过单个渠道发送通知"""
+        if channel not in self._notification_channels:
+            return {
+                'channel': channel,
+                'status': 'failed',
+                'error': f"Unsupported channel: {channel}",
+                'sent_at': time.time()
+            }
+        
+        try:
+            result = await asyncio.to_thread(self._notification_channels[channel], content, config)
+            return {
+                'channel': channel,
+                'status': 'success',
+                'result': result,
+                'sent_at': time.time()
+            }
+        except Exception as e:
+            return {
+                'channel': channel,
+                'status': 'failed',
+                'error': str(e),
+                'sent_at': time.time()
+            }
+    
     def _prepare_notification_content(self, data: dict, config: dict) -> dict:
         """准备通知内容"""
         notification_type = config.get('type', 'info')
@@ -178,7 +195,7 @@ class NotificationHandler(BaseHandler):
         sender = config.get('sender', 'noreply@example.com')
         
         # 模拟发送延迟
-        time.sleep(random.uniform(0.1, 0.3))
+        simulate_latency('notification.email', (0.1, 0.3))
         
         # 模拟发送结果
         message_id = f"email_{int(time.time())}_{random.randint(1000, 9999)}"
@@ -200,7 +217,7 @@ class NotificationHandler(BaseHandler):
         # 短信内容通常较短
         sms_body = content['body'][:160]  # SMS通常限制在160字符
         
-        time.sleep(random.uniform(0.05, 0.15))
+        simulate_latency('notification.sms', (0.05, 0.15))
         
         message_id = f"sms_{int(time.time())}_{random.randint(1000, 9999)}"
         
@@ -224,7 +241,7 @@ class NotificationHandler(BaseHandler):
             'source': 'celery_task_system'
         }
         
-        time.sleep(random.uniform(0.1, 0.2))
+        simulate_latency('notification.webhook', (0.1, 0.2))
         
         # 模拟HTTP响应
         response_code = random.choice([200, 200, 200, 201, 400, 500])  # 大部分成功
@@ -258,7 +275,7 @@ class NotificationHandler(BaseHandler):
             }]
         }
         
-        time.sleep(random.uniform(0.1, 0.3))
+        simulate_latency('notification.slack', (0.1, 0.3))
         
         return {
             'channel': channel,
@@ -283,7 +300,7 @@ class NotificationHandler(BaseHandler):
             'footer': {'text': 'Celery Task System'}
         }
         
-        time.sleep(random.uniform(0.1, 0.25))
+        simulate_latency('notification.discord', (0.1, 0.25))
         
         return {
             'channel_id': channel_id,
@@ -315,7 +332,7 @@ class NotificationHandler(BaseHandler):
             }]
         }
         
-        time.sleep(random.uniform(0.1, 0.3))
+        simulate_latency('notification.teams', (0.1, 0.3))
         
         return {
             'webhook_url': webhook_url,
@@ -340,7 +357,7 @@ class NotificationHandler(BaseHandler):
             }
         }
         
-        time.sleep(random.uniform(0.05, 0.15))
+        simulate_latency('notification.push', (0.05, 0.15))
         
         return {
             'device_tokens': device_tokens,
@@ -459,6 +476,11 @@ class NotificationHandler(BaseHandler):
 class AlertHandler(BaseHandler):
     """告警处理器"""
     
+    request_types = (RequestType.NOTIFICATION,)
+    inputs = ('notification_config',)
+    outputs = ('alerts',)
+    cacheable = False
+    
     def __init__(self):
         super().__init__("AlertHandler")
         self._alert_rules = [
@@ -0,0 +1,132 @@
+"""
+多进程转换 - 字段数很多的负载按字段分片，在进程内共享的进程池中转换
+
+默认关闭：``TRANSFORMATION_PROCESSES`` 大于 0 时启用，且只有需要转换的字段数达到
+``TRANSFORMATION_PARALLEL_MIN_FIELDS`` 的负载才分片。每个分片是一段连续的字段，
+结果按字段原来的顺序合并，日志、错误和警告的顺序与单进程转换完全相同。
+
+进程池使用 billiard（Celery 自带的 multiprocessing 分支），Celery prefork 的子进程虽然是守护进程，
+也可以创建自己的转换进程池；每个 prefork 子进程最多再使用 ``TRANSFORMATION_PROCESSES`` 个进程，
+部署时按 ``--concurrency`` 乘以该值估算 CPU 占用。没有安装 billiard 时使用标准库 multiprocessing，
+此时守护进程中不分片，仍在当前进程中转换。
+进程池不可用（无法序列化的取值、子进程异常退出、超时等）时退回单进程转换。
+"""
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from typing import Any, Dict, List, Optional, Tuple
+
+from handlers.transformation_dsl import compile_transformations
+from handlers.columnar_transformation import ColumnFailure
+
+try:
+    # billiard 允许守护进程（Celery prefork 子进程）创建子进程
+    import billiard as _multiprocessing
+except ImportError:
+    _multiprocessing = None
+
+logger = logging.getLogger(__name__)
+
+TRANSFORMATION_PROCESSES = int(os.getenv("TRANSFORMATION_PROCESSES", "0"))
+TRANSFORMATION_PARALLEL_MIN_FIELDS = int(os.getenv("TRANSFORMATION_PARALLEL_MIN_FIELDS", "10000"))
+# 等待一个负载全部分片的最长总时间（秒），超时后丢弃进程池并改为单进程转换
+TRANSFORMATION_PARALLEL_TIMEOUT = float(os.getenv("TRANSFORMATION_PARALLEL_TIMEOUT", "300"))
+
+# 分片的转换结果：(是否成功, 新值或异常消息)
+ShardResult = Tuple[bool, Any]
+
+# 转换进程池（每个进程一个，按需创建；fork 出的子进程重新创建自己的进程池）
+_pool = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def _get_context():
+    """进程池的启动方式：forkserver 的子进程不继承当前进程的线程和锁"""
+    backend = _multiprocessing or multiprocessing
+    method = 'forkserver' if 'forkserver' in backend.get_all_start_methods() else 'spawn'
+    return backend.get_context(method)
+
+
+def _get_pool():
+    """获取转换进程池"""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = _get_context().Pool(processes=TRANSFORMATION_PROCESSES)
+                _pool_pid = pid
+    return _pool
+
+
+def _reset_pool(pool):
+    """进程池出错（子进程退出、超时）后丢弃，下次使用时重新创建"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    try:
+        pool.terminate()
+    except Exception as e:
+        logger.warning(f"关闭转换进程池失败: {e}")
+
+
+def parallel_enabled(field_count: int) -> bool:
+    """是否应当分片转换（已启用、字段足够多、当前进程可以创建子进程）"""
+    if TRANSFORMATION_PROCESSES <= 0 or field_count < TRANSFORMATION_PARALLEL_MIN_FIELDS:
+        return False
+    # 标准库 multiprocessing 不允许守护进程创建子进程
+    return _multiprocessing is not None or not multiprocessing.current_process().daemon
+
+
+def _transform_shard(transformations: Dict[str, Any], values: Dict[str, Any]) -> List[ShardResult]:
+    """在子进程中转换一个分片的字段"""
+    results: List[ShardResult] = []
+    for field, _, steps, _, _ in compile_transformations(transformations):
+        try:
+            value = values[field]
+            for step in steps:
+                value = step(value)
+            results.append((True, value))
+        except Exception as e:
+            results.append((False, str(e)))
+    return results
+
+
+def transform_fields(transformations: Dict[str, Any], payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """按字段分片在进程池中转换负载中存在的字段
+
+    Returns:
+        字段到新值的映射，转换出错的字段为 ``ColumnFailure``（异常消息与原异常相同）；
+        进程池不可用时返回 None
+    """
+    fields = [field for field in transformations if field in payload]
+    if not fields:
+        return {}
+    shard_count = min(TRANSFORMATION_PROCESSES, len(fields)) or 1
+    shard_size = -(-len(fields) // shard_count)
+    shards = [fields[start:start + shard_size] for start in range(0, len(fields), shard_size)]
+
+    pool = _get_pool()
+    try:
+        pending = [
+            pool.apply_async(_transform_shard,
+                             ({field: transformations[field] for field in shard},
+                              {field: payload[field] for field in shard}))
+            for shard in shards
+        ]
+        # 所有分片共用一个截止时间，整个负载最多等待 TRANSFORMATION_PARALLEL_TIMEOUT 秒
+        deadline = time.monotonic() + TRANSFORMATION_PARALLEL_TIMEOUT
+        results: Dict[str, Any] = {}
+        for shard, result in zip(shards, pending):
+            for field, (succeeded, value) in zip(shard, result.get(max(0.0, deadline - time.monotonic()))):
+                results[field] = value if succeeded else ColumnFailure(Exception(value))
+        return results
+    except Exception as e:
+        logger.warning(f"多进程转换失败，改为单进程转换: {type(e).__name__}: {e}")
+        # 转换异常已作为分片结果返回，这里是进程池或序列化的问题；丢弃进程池，避免残留未完成的分片
+        _reset_pool(pool)
+        return None
@@ -0,0 +1,116 @@
+"""
+抽样验证 - 对超大列式批量数据只验证随机样本，按样本外推错误率及其置信区间
+
+抽样配置（data['sampling']）:
+    size            样本记录数
+    rate            样本比例（0 到 1），与 size 同时设置时取两者中较大的样本
+    seed            随机种子，相同的种子和记录数得到相同的样本
+    confidence      错误率置信区间的置信水平，默认 0.95
+    max_error_rate  样本错误率超过该阈值时改为全量验证，默认 0.01
+
+批次中有唯一性规则时无法由样本推断，直接全量验证。
+"""
+import math
+import random
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from handlers.columnar_validation import validate_columns
+from handlers.cross_record_validation import ReferenceLookup, compile_cross_record_rules
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MAX_ERROR_RATE = 0.01
+
+
+def wilson_interval(failures: int, trials: int, confidence: float = DEFAULT_CONFIDENCE) -> Tuple[float, float]:
+    """二项比例的 Wilson 置信区间"""
+    if trials <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    p = failures / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    lower = 0.0 if failures == 0 else max(0.0, center - margin)
+    upper = 1.0 if failures == trials else min(1.0, center + margin)
+    return lower, upper
+
+
+def sample_size(total: int, config: Dict[str, Any]) -> int:
+    """按配置计算样本记录数（不超过总数）"""
+    size = int(config.get('size') or 0)
+    rate = config.get('rate')
+    if rate is not None:
+        if not 0 < rate <= 1:
+            raise ValueError(f"抽样比例必须在 0 到 1 之间: {rate}")
+        size = max(size, math.ceil(total * rate))
+    if size <= 0:
+        raise ValueError("抽样配置需要 size 或 rate")
+    return min(size, total)
+
+
+def sample_indices(total: int, size: int, seed: Optional[int] = None) -> List[int]:
+    """按种子抽取 size 个记录序号（升序）"""
+    return sorted(random.Random(seed).sample(range(total), size))
+
+
+def validate_sampled(columns: Dict[str, Sequence[Any]], required_fields: Sequence[str],
+                     validation_rules: Dict[str, Any], config: Dict[str, Any],
+                     lookup: Optional[ReferenceLookup] = None) -> Dict[str, Any]:
+    """抽样验证列式批量数据
+
+    Returns:
+        验证报告。``mode`` 为 ``sampled`` 时 ``records`` 只包含样本中的记录（序号为原始序号），
+        并附带外推的错误率和置信区间；样本错误率超过阈值、样本覆盖全部记录或有唯一性规则时
+        ``mode`` 为 ``full``，报告与全量验证相同，``sampling`` 中说明原因。
+    """
+    total = len(next(iter(columns.values()), ()))
+    confidence = config.get('confidence', DEFAULT_CONFIDENCE)
+    max_error_rate = config.get('max_error_rate', DEFAULT_MAX_ERROR_RATE)
+    size = sample_size(total, config)
+
+    def full(reason: str, sampling: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        report = validate_columns(columns, required_fields, validation_rules, lookup)
+        report['mode'] = 'full'
+        report['sampling'] = dict(sampling or {}, fallback_reason=reason)
+        return report
+
+    if size >= total:
+        return full("样本覆盖全部记录")
+    if any(rule.unique for rule in compile_cross_record_rules(validation_rules)):
+        return full("唯一性规则需要全量验证")
+
+    indices = sample_indices(total, size, config.get('seed'))
+    sample = {field: [values[index] for index in indices] for field, values in columns.items()}
+    report = validate_columns(sample, required_fields, validation_rules, lookup)
+
+    error_rate = report['invalid_records'] / size
+    lower, upper = wilson_interval(report['invalid_records'], size, confidence)
+    sampling = {
+        'sampled_records': size,
+        'sampled_invalid_records': report['invalid_records'],
+        'seed': config.get('seed'),
+        'confidence': confidence,
+        'max_error_rate': max_error_rate,
+        'estimated_error_rate': error_rate,
+        'error_rate_lower': lower,
+        'error_rate_upper': upper
+    }
+    if error_rate > max_error_rate:
+        return full("样本错误率超过阈值", sampling)
+
+    for record in report['records']:
+        record['index'] = indices[record['index']]
+    sampling.update(
+        estimated_invalid_records=round(error_rate * total),
+        invalid_records_lower=math.floor(lower * total),
+        invalid_records_upper=math.ceil(upper * total)
+    )
+    return {
+        'mode': 'sampled',
+        'total_records': total,
+        'sampled_records': size,
+        'invalid_records': report['invalid_records'],
+        'records': report['records'],
+        'sampling': sampling
+    }
@@ -0,0 +1,245 @@
+"""
+编译后的转换规则 - 把 transformations 编译为每个字段的一组转换函数，按规则内容缓存
+
+规则写法不变（如 ``uppercase``、``multiply_2``、``replace_a_b``、``format_{:02d}``）；
+字段的规则也可以是列表，按顺序依次执行（如 ``["strip", "lowercase"]``）。
+规则名在编译时分派一次，参数只解析一次，正则预编译；参数无效的规则在应用时抛出与
+逐条解释规则时相同的异常，未知的规则在应用时给出警告并跳过。
+"""
+import os
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from chain_metrics import profiler
+
+TRANSFORMATION_CACHE_SIZE = int(os.getenv("TRANSFORMATION_CACHE_SIZE", "256"))
+# 标准化函数（电话、邮箱、slug）每个的记忆化条数，同一客户、公司的取值大量重复
+NORMALIZER_CACHE_SIZE = int(os.getenv("NORMALIZER_CACHE_SIZE", "10000"))
+
+SPECIAL_CHARS_PATTERN = re.compile(r'[^a-zA-Z0-9\s]')
+DIGIT_PATTERN = re.compile(r'\d')
+LETTER_PATTERN = re.compile(r'[a-zA-Z]')
+NON_DIGIT_PATTERN = re.compile(r'\D')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+NON_SLUG_PATTERN = re.compile(r'[^a-z0-9\-]')
+HYPHENS_PATTERN = re.compile(r'-+')
+
+# 单个转换：原值 -> 新值
+Step = Callable[[Any], Any]
+
+
+def convert_to_number(value):
+    """转换为数字"""
+    try:
+        # 尝试转换为整数
+        if '.' not in str(value):
+            return int(value)
+        else:
+            return float(value)
+    except ValueError:
+        raise ValueError(f"无法将 '{value}' 转换为数字")
+
+
+def convert_to_boolean(value):
+    """转换为布尔值"""
+    if isinstance(value, bool):
+        return value
+
+    str_value = str(value).lower().strip()
+    if str_value in ['true', '1', 'yes', 'on', 'enabled']:
+        return True
+    elif str_value in ['false', '0', 'no', 'off', 'disabled']:
+        return False
+    else:
+        raise ValueError(f"无法将 '{value}' 转换为布尔值")
+
+
+@profiler.memoize('normalize_phone', NORMALIZER_CACHE_SIZE)
+def normalize_phone_number(phone: str) -> str:
+    """标准化电话号码格式"""
+    # 移除所有非数字字符
+    digits = NON_DIGIT_PATTERN.sub('', phone)
+
+    # 根据长度判断格式
+    if len(digits) == 10:
+        # 美国格式 (123) 456-7890
+        return f"({digits[:3]}) {digits[3:6]}-{digits[6:]}"
+    elif len(digits) == 11 and digits.startswith('1'):
+        # 美国格式带国家码 +1 (123) 456-7890
+        return f"+1 ({digits[1:4]}) {digits[4:7]}-{digits[7:]}"
+    elif len(digits) == 11 and digits.startswith('86'):
+        # 中国格式 +86 138-0013-8000
+        return f"+86 {digits[2:5]}-{digits[5:9]}-{digits[9:]}"
+    else:
+        # 保持原格式
+        return phone
+
+
+@profiler.memoize('normalize_email', NORMALIZER_CACHE_SIZE)
+def normalize_email(email: str) -> str:
+    """标准化邮箱（小写、去除首尾空白）"""
+    return email.lower().strip()
+
+
+@profiler.memoize('generate_slug', NORMALIZER_CACHE_SIZE)
+def generate_slug(text: str) -> str:
+    """生成URL友好的slug"""
+    # 转小写，空格替换为连字符
+    text = WHITESPACE_PATTERN.sub('-', text.lower())
+    # 移除特殊字符，只保留字母、数字和连字符
+    text = NON_SLUG_PATTERN.sub('', text)
+    # 移除多余的连字符和首尾连字符
+    return HYPHENS_PATTERN.sub('-', text).strip('-')
+
+
+def _divide_by_zero(value):
+    raise ValueError("除数不能为零")
+
+
+# 不带参数的转换
+SIMPLE_TRANSFORMATIONS: Dict[str, Step] = {
+    'uppercase': lambda value: str(value).upper(),
+    'lowercase': lambda value: str(value).lower(),
+    'strip': lambda value: str(value).strip(),
+    'title_case': lambda value: str(value).title(),
+    'capitalize': lambda value: str(value).capitalize(),
+    'to_number': convert_to_number,
+    'to_string': str,
+    'to_boolean': convert_to_boolean,
+    'remove_spaces': lambda value: str(value).replace(' ', ''),
+    'remove_special_chars': lambda value: SPECIAL_CHARS_PATTERN.sub('', str(value)),
+    'extract_numbers': lambda value: ''.join(DIGIT_PATTERN.findall(str(value))),
+    'extract_letters': lambda value: ''.join(LETTER_PATTERN.findall(str(value))),
+    'reverse': lambda value: str(value)[::-1],
+    'normalize_phone': lambda value: normalize_phone_number(str(value)),
+    'normalize_email': lambda value: normalize_email(str(value)),
+    'generate_slug': lambda value: generate_slug(str(value)),
+}
+
+
+def _compile_parameterized(transformation: str) -> Optional[Step]:
+    """编译带参数的转换，未知的转换返回 None"""
+    if transformation.startswith('multiply_'):
+        factor = float(transformation.split('_')[1])
+        return lambda value: float(value) * factor
+
+    elif transformation.startswith('divide_'):
+        divisor = float(transformation.split('_')[1])
+        if divisor == 0:
+            return _divide_by_zero
+        return lambda value: float(value) / divisor
+
+    elif transformation.startswith('add_'):
+        addend = float(transformation.split('_')[1])
+        return lambda value: float(value) + addend
+
+    elif transformation.startswith('subtract_'):
+        subtrahend = float(transformation.split('_')[1])
+        return lambda value: float(value) - subtrahend
+
+    elif transformation.startswith('round_'):
+        decimals = int(transformation.split('_')[1])
+        return lambda value: round(float(value), decimals)
+
+    elif transformation.startswith('substring_'):
+        # substring_start_end 格式
+        parts = transformation.split('_')
+        start = int(parts[1])
+        end = int(parts[2]) if len(parts) > 2 else None
+        return lambda value: str(value)[start:end]
+
+    elif transformation.startswith('replace_'):
+        # replace_old_new 格式，格式不完整时与原有实现一样得到 None
+        parts = transformation.split('_', 2)
+        if len(parts) != 3:
+            return lambda value: None
+        old, new = parts[1], parts[2]
+        return lambda value: str(value).replace(old, new)
+
+    elif transformation.startswith('format_'):
+        # format_template 格式，例如 format_{:02d}
+        return transformation.split('_', 1)[1].format
+
+    return None
+
+
+def _raising(error: Exception) -> Step:
+    """参数无效的转换：每次应用时抛出与编译时相同类型和消息的新异常"""
+    error_type, args = type(error), error.args
+
+    def step(value):
+        raise error_type(*args)
+    return step
+
+
+@lru_cache(maxsize=1024)
+def compile_transformation(transformation: str) -> Optional[Step]:
+    """编译单个转换规则，未知的规则返回 None"""
+    step = SIMPLE_TRANSFORMATIONS.get(transformation)
+    if step is not None:
+        return step
+    try:
+        return _compile_parameterized(transformation)
+    except Exception as e:
+        return _raising(e)
+
+
+class FieldProgram(NamedTuple):
+    """单个字段编译后的转换"""
+    field: str
+    label: str                # 日志中显示的规则
+    steps: Tuple[Step, ...]
+    unknown: Tuple[str, ...]  # 未知的转换类型，应用时给出警告
+    names: Tuple[Any, ...]    # 每个转换函数对应的规则名（按列转换时使用）
+
+
+# 编译后的整套转换规则
+Program = Tuple[FieldProgram, ...]
+
+
+def _compile_field(field: Any, transformation: Any) -> FieldProgram:
+    if isinstance(transformation, (list, tuple)):
+        names = tuple(transformation)
+        label = str(list(transformation))
+    else:
+        names = (transformation,)
+        label = f"{transformation}"
+
+    steps = []
+    unknown = []
+    known = []
+    for name in names:
+        if not isinstance(name, str):
+            # 与原有实现抛出相同的异常
+            step = _raising(AttributeError(f"'{type(name).__name__}' object has no attribute 'startswith'"))
+        else:
+            step = compile_transformation(name)
+            if step is None:
+                unknown.append(name)
+                continue
+        steps.append(step)
+        known.append(name)
+    return FieldProgram(field, label, tuple(steps), tuple(unknown), tuple(known))
+
+
+@lru_cache(maxsize=TRANSFORMATION_CACHE_SIZE)
+def _compile_cached(spec: Tuple[Tuple[str, Any], ...]) -> Program:
+    return tuple(_compile_field(field, transformation) for field, transformation in spec)
+
+
+def compile_transformations(transformations: Dict[str, Any]) -> Program:
+    """编译整套转换规则（进程内 LRU 缓存，键为规则内容）"""
+    spec = tuple(transformations.items())
+    # 只缓存字符串字段名和字符串规则，避免 True 和 1 这类相等的取值共用编译结果
+    cacheable = set(map(type, transformations)) <= {str}
+    value_types = set(map(type, transformations.values()))
+    if list in value_types or tuple in value_types:
+        spec = tuple((field, tuple(transformation) if isinstance(transformation, list) else transformation)
+                     for field, transformation in spec)
+        chains = [transformation for _, transformation in spec if type(transformation) is tuple]
+        cacheable = cacheable and all(set(map(type, chain)) <= {str} for chain in chains)
+        value_types -= {list, tuple}
+    if not cacheable or not value_types <= {str}:
+        return tuple(_compile_field(field, transformation) for field, transformation in transformations.items())
+    return _compile_cached(spec)
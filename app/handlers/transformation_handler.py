@@ -1,14 +1,26 @@
 """
 数据转换处理器
 """
-import time
-import re
-from handlers import BaseHandler, ProcessingRequest, RequestType
+from functools import partial
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple
+from handlers import BaseHandler, PayloadView, ProcessingRequest, RequestType
+from handlers.latency import simulate_latency
+from handlers.transformation_dsl import Program, compile_transformations
+from handlers.columnar_transformation import ColumnFailure, supports_columns, transform_column
+from handlers.parallel_transformation import parallel_enabled, transform_fields
+
+# 批量转换的预处理结果：id(request) -> (编译后的规则, 请求在分组中的位置, {字段: 整列转换结果})
+ColumnResults = Dict[int, Tuple[Program, int, Dict[str, List[Any]]]]
 
 
 class DataTransformationHandler(BaseHandler):
     """数据转换处理器"""
     
+    request_types = (RequestType.DATA_TRANSFORMATION,)
+    inputs = ('payload', 'transformations')
+    outputs = ('transformed_payload',)
+    
     def __init__(self):
         super().__init__("DataTransformationHandler")
     
@@ -17,19 +29,109 @@ class DataTransformationHandler(BaseHandler):
     
     def process(self, request: ProcessingRequest) -> ProcessingRequest:
         """执行数据转换"""
+        self._transform(request)
+        
+        # 模拟转换处理时间
+        simulate_latency('transformation', 0.3)
+        return request
+    
+    def process_batch(self, requests: List[ProcessingRequest]) -> List[ProcessingRequest]:
+        """批量执行数据转换，整个批次只产生一次模拟处理时间
+
+        转换规则相同的请求先按字段整列转换，再逐条写入结果和日志。
+        """
+        columns = self._transform_columns(requests)
+        transform = partial(self._transform, columns=columns)
+        for request in requests:
+            self._run(request, transform)
+        
+        simulate_latency('transformation', 0.3)
+        return requests
+    
+    def _transform_columns(self, requests: List[ProcessingRequest]) -> ColumnResults:
+        """按转换规则分组，对每组中支持整列执行的字段整列转换"""
+        groups: Dict[int, Tuple[Program, List[ProcessingRequest]]] = {}
+        for request in requests:
+            payload = request.data.get('payload', {})
+            transformations = request.data.get('transformations', {})
+            if type(payload) is not dict or not isinstance(transformations, dict):
+                continue
+            try:
+                program = compile_transformations(transformations)
+            except Exception:
+                # 规则有误的请求逐条转换时报告错误
+                continue
+            # 相同的规则命中同一个缓存的编译结果
+            groups.setdefault(id(program), (program, []))[1].append(request)
+        
+        results: ColumnResults = {}
+        for program, members in groups.values():
+            field_columns: Dict[str, List[Any]] = {}
+            if len(members) > 1:
+                payloads = [request.data['payload'] for request in members]
+                for field_program in program:
+                    if not supports_columns(field_program):
+                        continue
+                    field = field_program.field
+                    try:
+                        values = transform_column(list(map(itemgetter(field), payloads)), field_program)
+                    except KeyError:
+                        # 部分请求缺少该字段，这些请求不会读取对应位置
+                        positions = [position for position, payload in enumerate(payloads) if field in payload]
+                        present = transform_column([payloads[position][field] for position in positions],
+                                                   field_program)
+                        values = [None] * len(payloads)
+                        for position, value in zip(positions, present):
+                            values[position] = value
+                    field_columns[field] = values
+            for position, request in enumerate(members):
+                results[id(request)] = (program, position, field_columns)
+        return results
+    
+    def _transform(self, request: ProcessingRequest,
+                   columns: Optional[ColumnResults] = None) -> ProcessingRequest:
+        """转换单个请求的数据
+
+        Args:
+            columns: 批量转换时预先完成的编译和按列转换结果（按 ``id(request)``），
+                没有按列结果的字段逐条转换
+        """
         data = request.data
         payload = data.get('payload', {})
         transformations = data.get('transformations', {})
         
-        transformed_data = payload.copy()
+        # 只记录被转换的字段，其余字段从原始负载读取
+        transformed_data = PayloadView(payload) if isinstance(payload, dict) else payload.copy()
         transformation_count = 0
         
-        for field, transformation in transformations.items():
+        # 每个字段的转换在编译时已分派为函数序列（编译结果按规则内容缓存）
+        entry = columns.get(id(request)) if columns else None
+        if entry is not None:
+            program, position, field_columns = entry
+        else:
+            program, position, field_columns = compile_transformations(transformations), 0, {}
+        if not field_columns and type(payload) is dict and parallel_enabled(len(program)):
+            # 字段很多的负载按字段分片多进程转换，结果按字段顺序写入
+            results = transform_fields(transformations, payload)
+            if results is not None:
+                position, field_columns = 0, {field: [value] for field, value in results.items()}
+        
+        for field, transformation, steps, unknown, _ in program:
             if field in transformed_data:
                 original_value = transformed_data[field]
+                for name in unknown:
+                    request.add_warning(self.name, f"未知的转换类型: {name}")
                 
                 try:
-                    new_value = self._apply_transformation(original_value, transformation, request)
+                    column = field_columns.get(field)
+                    if column is not None:
+                        new_value = column[position]
+                        if type(new_value) is ColumnFailure:
+                            raise new_value.error
+                    else:
+                        new_value = original_value
+                        for step in steps:
+                            new_value = step(new_value)
                     if new_value != original_value:
                         transformed_data[field] = new_value
                         transformation_count += 1
@@ -43,160 +145,5 @@ class DataTransformationHandler(BaseHandler):
         # 添加转换后的数据
         request.data['transformed_payload'] = transformed_data
         
-        # 模拟转换处理时间
-        time.sleep(0.3)
-        
         request.add_log(self.name, f"成功转换了 {transformation_count} 个字段")
         return request
-    
-    def _apply_transformation(self, value, transformation: str, request):
-        """应用具体的转换逻辑"""
-        if transformation == 'uppercase':
-            return str(value).upper()
-        
-        elif transformation == 'lowercase':
-            return str(value).lower()
-        
-        elif transformation == 'strip':
-            return str(value).strip()
-        
-        elif transformation == 'title_case':
-            return str(value).title()
-        
-        elif transformation == 'capitalize':
-            return str(value).capitalize()
-        
-        elif transformation == 'to_number':
-            return self._convert_to_number(value)
-        
-        elif transformation == 'to_string':
-            return str(value)
-        
-        elif transformation == 'to_boolean':
-            return self._convert_to_boolean(value)
-        
-        elif transformation.startswith('multiply_'):
-            factor = float(transformation.split('_')[1])
-            return float(value) * factor
-        
-        elif transformation.startswith('divide_'):
-            divisor = float(transformation.split('_')[1])
-            if divisor == 0:
-                raise ValueError("除数不能为零")
-            return float(value) / divisor
-        
-        elif transformation.startswith('add_'):
-            addend = float(transformation.split('_')[1])
-            return float(value) + addend
-        
-        elif transformation.startswith('subtract_'):
-            subtrahend = float(transformation.split('_')[1])
-            return float(value) - subtrahend
-        
-        elif transformation.startswith('round_'):
-            decimals = int(transformation.split('_')[1])
-            return round(float(value), decimals)
-        
-        elif transformation == 'remove_spaces':
-            return str(value).replace(' ', '')
-        
-        elif transformation == 'remove_special_chars':
-            return re.sub(r'[^a-zA-Z0-9\s]', '', str(value))
-        
-        elif transformation == 'extract_numbers':
-            return ''.join(re.findall(r'\d', str(value)))
-        
-        elif transformation == 'extract_letters':
-            return ''.join(re.findall(r'[a-zA-Z]', str(value)))
-        
-        elif transformation.startswith('substring_'):
-            # substring_start_end 格式
-            parts = transformation.split('_')
-            if len(parts) >= 2:
-                start = int(parts[1])
-                end = int(parts[2]) if len(parts) > 2 else None
-                return str(value)[start:end]
-        
-        elif transformation.startswith('replace_'):
-            # replace_old_new 格式
-            parts = transformation.split('_', 2)
-            if len(parts) == 3:
-                old, new = parts[1], parts[2]
-                return str(value).replace(old, new)
-        
-        elif transformation == 'reverse':
-            return str(value)[::-1]
-        
-        elif transformation.startswith('format_'):
-            # format_template 格式，例如 format_{:02d}
-            template = transformation.split('_', 1)[1]
-            return template.format(value)
-        
-        elif transformation == 'normalize_phone':
-            return self._normalize_phone_number(str(value))
-        
-        elif transformation == 'normalize_email':
-            return str(value).lower().strip()
-        
-        elif transformation == 'generate_slug':
-            return self._generate_slug(str(value))
-        
-        else:
-            request.add_warning(self.name, f"未知的转换类型: {transformation}")
-            return value
-    
-    def _convert_to_number(self, value):
-        """转换为数字"""
-        try:
-            # 尝试转换为整数
-            if '.' not in str(value):
-                return int(value)
-            else:
-                return float(value)
-        except ValueError:
-            raise ValueError(f"无法将 '{value}' 转换为数字")
-    
-    def _convert_to_boolean(self, value):
-        """转换为布尔值"""
-        if isinstance(value, bool):
-            return value
-        
-        str_value = str(value).lower().strip()
-        if str_value in ['true', '1', 'yes', 'on', 'enabled']:
-            return True
-        elif str_value in ['false', '0', 'no', 'off', 'disabled']:
-            return False
-        else:
-            raise ValueError(f"无法将 '{value}' 转换为布尔值")
-    
-    def _normalize_phone_number(self, phone: str) -> str:
-        """标准化电话号码格式"""
-        # 移除所有非数字字符
-        digits = re.sub(r'\D', '', phone)
-        
-        # 根据长度判断格式
-        if len(digits) == 10:
-            # 美国格式 (123) 456-7890
-            return f"({digits[:3]}) {digits[3:6]}-{digits[6:]}"
-        elif len(digits) == 11 and digits.startswith('1'):
-            # 美国格式带国家码 +1 (123) 456-7890
-            return f"+1 ({digits[1:4]}) {digits[4:7]}-{digits[7:]}"
-        elif len(digits) == 11 and digits.startswith('86'):
-            # 中国格式 +86 138-0013-8000
-            return f"+86 {digits[2:5]}-{digits[5:9]}-{digits[9:]}"
-        else:
-            # 保持原格式
-            return phone
-    
-    def _generate_slug(self, text: str) -> str:
-        """生成URL友好的slug"""
-        # 转小写
-        text = text.lower()
-        # 替换空格为连字符
-        text = re.sub(r'\s+', '-', text)
-        # 移除特殊字符，只保留字母、数字和连字符
-        text = re.sub(r'[^a-z0-9\-]', '', text)
-        # 移除多余的连字符
-        text = re.sub(r'-+', '-', text)
-        # 移除首尾连字符
-        return text.strip('-')
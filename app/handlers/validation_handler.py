@@ -1,13 +1,28 @@
 """
 数据验证处理器
 """
-import time
+from collections.abc import Mapping
+from functools import partial
+from typing import Dict, List, Optional, Tuple
 from handlers import BaseHandler, ProcessingRequest, RequestType
+from data_sketches import DataQualityProfile
+from handlers.latency import simulate_latency
+from handlers.validation_schema import get_validator
+from handlers.columnar_validation import validate_columns
+from handlers.sampled_validation import validate_sampled
+from handlers.cross_record_validation import check_records
+
+# 跨记录检查结果：(错误列表, 警告列表)
+CrossRecordResult = Tuple[List[str], List[str]]
 
 
 class DataValidationHandler(BaseHandler):
     """数据验证处理器"""
     
+    request_types = (RequestType.DATA_VALIDATION,)
+    inputs = ('payload', 'columns', 'required_fields', 'validation_rules', 'quality_stats', 'sampling')
+    outputs = ('validation_report', 'data_quality')
+    
     def __init__(self):
         super().__init__("DataValidationHandler")
     
@@ -16,26 +31,153 @@ class DataValidationHandler(BaseHandler):
     
     def process(self, request: ProcessingRequest) -> ProcessingRequest:
         """执行数据验证"""
+        self._validate(request)
+        
+        # 模拟验证处理时间
+        simulate_latency('validation', 0.5)
+        return request
+    
+    def process_batch(self, requests: List[ProcessingRequest]) -> List[ProcessingRequest]:
+        """批量执行数据验证，整个批次只产生一次模拟处理时间
+
+        跨记录规则（唯一性、引用）在整个批次上一次完成检查；请求带有批次范围的
+        ``cross_record_state`` 时唯一性还与之前各块的记录比较。
+        """
+        cross_record = self._check_cross_record(requests)
+        validate = partial(self._validate, cross_record=cross_record)
+        for request in requests:
+            self._run(request, validate)
+        
+        simulate_latency('validation', 0.5)
+        return requests
+    
+    def _validate(self, request: ProcessingRequest,
+                  cross_record: Optional[Dict[int, CrossRecordResult]] = None) -> ProcessingRequest:
+        """验证单个请求的数据
+
+        Args:
+            cross_record: 批量验证时预先完成的跨记录检查结果（按 ``id(request)``），
+                为 None 时只在当前请求内检查
+        """
         data = request.data
+        self._update_quality(request)
+        if 'columns' in data:
+            return self._validate_columns(request)
         
         # 检查必填字段
         validation_result = self._validate_required_fields(data, request)
         if not validation_result:
             return request
         
-        # 验证数据类型
-        self._validate_data_types(data, request)
-        
-        # 验证业务规则
-        self._validate_business_rules(data, request)
+        # 一次遍历验证数据类型和业务规则（编译后的规则按内容缓存）
+        payload = data.get('payload', {})
+        validation_rules = data.get('validation_rules', {})
+        validator = get_validator(validation_rules)
+        validator.validate(payload, validation_rules, request, self.name)
         
-        # 模拟验证处理时间
-        time.sleep(0.5)
+        # 跨记录规则（唯一性、引用）
+        if validator.cross_record_rules():
+            if cross_record is None:
+                cross_record = self._check_cross_record([request])
+            errors, warnings = cross_record.get(id(request), ((), ()))
+            for message in errors:
+                request.add_error(self.name, message)
+            for message in warnings:
+                request.add_warning(self.name, message)
         
-        payload = data.get('payload', {})
         request.add_log(self.name, f"验证了 {len(payload)} 个字段")
         return request
     
+    def _update_quality(self, request: ProcessingRequest):
+        """把负载计入数据质量草图
+
+        请求设置了 quality_stats（True 或配置字典）时统计结果写入 data_quality；
+        批量任务设置了共享草图（``request.quality_profile``）时同时计入共享草图。
+        """
+        data = request.data
+        config = data.get('quality_stats')
+        profiles = [DataQualityProfile.from_config(config)] if config else []
+        if request.quality_profile is not None:
+            profiles.append(request.quality_profile)
+        
+        for profile in profiles:
+            if 'columns' in data:
+                profile.add_columns(data['columns'])
+            elif isinstance(data.get('payload'), Mapping):
+                profile.add_record(data['payload'])
+        
+        if config:
+            data['data_quality'] = profiles[0].to_dict()
+    
+    def _check_cross_record(self, requests: List[ProcessingRequest]) -> Dict[int, CrossRecordResult]:
+        """对一批按行验证的请求执行跨记录检查，返回 ``id(request)`` 到 (错误, 警告) 的映射
+
+        缺少必填字段的请求不参与检查；规则格式错误的请求在 ``_validate`` 中报告。
+        """
+        records = []
+        for request in requests:
+            data = request.data
+            record = None
+            if 'columns' not in data:
+                payload = data.get('payload', {})
+                try:
+                    rules = get_validator(data.get('validation_rules', {})).cross_record_rules()
+                except Exception:
+                    rules = ()
+                if (rules and isinstance(payload, Mapping) and
+                        all(field in payload for field in data.get('required_fields', []))):
+                    record = (payload, rules)
+            records.append(record)
+        
+        if not any(records):
+            return {}
+        
+        # 按批次范围的状态分组检查（同一任务的请求共享一个状态，未设置时只在本次调用内检查）
+        by_state: Dict[int, List[int]] = {}
+        for index, request in enumerate(requests):
+            if records[index] is not None:
+                by_state.setdefault(id(request.cross_record_state), []).append(index)
+        results: Dict[int, CrossRecordResult] = {}
+        for indexes in by_state.values():
+            state = requests[indexes[0]].cross_record_state
+            checked = check_records([records[index] for index in indexes], state=state)
+            for index, result in zip(indexes, checked):
+                results[id(requests[index])] = result
+        return results
+    
+    def _validate_columns(self, request: ProcessingRequest) -> ProcessingRequest:
+        """按列验证列式批量数据（每个字段一个数组），结果写入 validation_report
+
+        设置了 data['sampling'] 时只验证随机样本，样本错误率超过阈值时改为全量验证。
+        """
+        data = request.data
+        columns = data['columns']
+        required_fields = data.get('required_fields', [])
+        validation_rules = data.get('validation_rules', {})
+        if data.get('sampling'):
+            report = validate_sampled(columns, required_fields, validation_rules, data['sampling'])
+        else:
+            report = validate_columns(columns, required_fields, validation_rules)
+        data['validation_report'] = report
+        
+        if report.get('mode') == 'sampled':
+            sampling = report['sampling']
+            if report['invalid_records']:
+                request.add_warning(
+                    self.name,
+                    f"样本中 {report['invalid_records']} 条记录验证失败，估计错误率 "
+                    f"{sampling['estimated_error_rate']:.2%}（{sampling['confidence']:.0%} 置信区间 "
+                    f"{sampling['error_rate_lower']:.2%} - {sampling['error_rate_upper']:.2%}）")
+            request.add_log(self.name, f"抽样验证了 {report['sampled_records']}/{report['total_records']} 条记录")
+            return request
+        
+        if 'sampling' in report:
+            request.add_log(self.name, f"改为全量验证: {report['sampling']['fallback_reason']}")
+        if report['invalid_records']:
+            request.add_warning(self.name, f"{report['invalid_records']} 条记录验证失败")
+        request.add_log(self.name, f"按列验证了 {report['total_records']} 条记录")
+        return request
+    
     def _validate_required_fields(self, data: dict, request: ProcessingRequest) -> bool:
         """验证必填字段"""
         required_fields = data.get('required_fields', [])
@@ -51,69 +193,3 @@ class DataValidationHandler(BaseHandler):
             return False
         
         return True
-    
-    def _validate_data_types(self, data: dict, request: ProcessingRequest):
-        """验证数据类型"""
-        validation_rules = data.get('validation_rules', {})
-        payload = data.get('payload', {})
-        
-        for field, rule in validation_rules.items():
-            if field in payload:
-                value = payload[field]
-                field_type = rule.get('type')
-                
-                if field_type == 'string' and not isinstance(value, str):
-                    request.add_error(self.name, f"字段 {field} 应为字符串类型")
-                elif field_type == 'number' and not isinstance(value, (int, float)):
-                    request.add_error(self.name, f"字段 {field} 应为数字类型")
-                elif field_type == 'email' and not self._is_valid_email(value):
-                    request.add_error(self.name, f"字段 {field} 不是有效的邮箱格式")
-                elif field_type == 'phone' and not self._is_valid_phone(value):
-                    request.add_warning(self.name, f"字段 {field} 可能不是有效的电话号码格式")
-    
-    def _validate_business_rules(self, data: dict, request: ProcessingRequest):
-        """验证业务规则"""
-        validation_rules = data.get('validation_rules', {})
-        payload = data.get('payload', {})
-        
-        for field, rule in validation_rules.items():
-            if field in payload:
-                value = payload[field]
-                
-                # 最小长度检查
-                if rule.get('min_length') and len(str(value)) < rule['min_length']:
-                    request.add_warning(self.name, f"字段 {field} 长度不足最小要求 {rule['min_length']}")
-                
-                # 最大长度检查
-                if rule.get('max_length') and len(str(value)) > rule['max_length']:
-                    request.add_error(self.name, f"字段 {field} 长度超过最大限制 {rule['max_length']}")
-                
-                # 数值范围检查
-                if rule.get('min_value') and isinstance(value, (int, float)) and value < rule['min_value']:
-                    request.add_error(self.name, f"字段 {field} 值小于最小值 {rule['min_value']}")
-                
-                if rule.get('max_value') and isinstance(value, (int, float)) and value > rule['max_value']:
-                    request.add_error(self.name, f"字段 {field} 值大于最大值 {rule['max_value']}")
-                
-                # 正则表达式验证
-                if rule.get('pattern'):
-                    import re
-                    if not re.match(rule['pattern'], str(value)):
-                        request.add_error(self.name, f"字段 {field} 不匹配所需格式")
-    
-    def _is_valid_email(self, email: str) -> bool:
-        """验证邮箱格式"""
-        import re
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return re.match(pattern, str(email)) is not None
-    
-    def _is_valid_phone(self, phone: str) -> bool:
-        """验证电话号码格式（简单验证）"""
-        import re
-        # 支持多种电话号码格式
-        patterns = [
-            r'^\+?1?[-.\s]?\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}$',  # 美国格式
-            r'^\+?86[-.\s]?1[0-9]{10}$',  # 中国手机格式
-            r'^\+?[0-9]{1,4}[-.\s]?[0-9]{1,4}[-.\s]?[0-9]{1,4}[-.\s]?[0-9]{1,4}$'  # 通用格式
-        ]
-        return any(re.match(pattern, str(phone)) for pattern in patterns)
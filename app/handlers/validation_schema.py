@@ -0,0 +1,239 @@
+"""
+编译后的验证规则 - 把 validation_rules 编译为单次遍历的验证器，按规则内容缓存
+
+同一套规则通常用于大量负载，编译（预编译正则、整理检查项）只做一次。
+验证结果（错误/警告的内容和顺序）与逐条解释规则完全一致：先是所有类型检查的结果，
+再是所有业务规则检查的结果。
+"""
+import os
+import re
+import copy
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from handlers import ProcessingRequest
+from handlers.cross_record_validation import CrossRecordRule, compile_cross_record_rules
+
+VALIDATION_SCHEMA_CACHE_SIZE = int(os.getenv("VALIDATION_SCHEMA_CACHE_SIZE", "256"))
+
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+# 支持多种电话号码格式
+PHONE_PATTERNS = (
+    re.compile(r'^\+?1?[-.\s]?\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}$'),  # 美国格式
+    re.compile(r'^\+?86[-.\s]?1[0-9]{10}$'),  # 中国手机格式
+    re.compile(r'^\+?[0-9]{1,4}[-.\s]?[0-9]{1,4}[-.\s]?[0-9]{1,4}[-.\s]?[0-9]{1,4}$')  # 通用格式
+)
+
+
+def is_valid_email(email: Any) -> bool:
+    """验证邮箱格式"""
+    return EMAIL_PATTERN.match(str(email)) is not None
+
+
+def is_valid_phone(phone: Any) -> bool:
+    """验证电话号码格式（简单验证）"""
+    phone = str(phone)
+    return any(pattern.match(phone) for pattern in PHONE_PATTERNS)
+
+
+# 编译后的单个字段规则：
+# (字段名, 原规则, 类型, 最小长度, 最大长度, 最小值, 最大值, 正则)
+# 与原有规则一致，取值为假（0、空字符串）的限制和正则编译为 None，不参与检查
+FieldRule = Tuple[str, Any, Any, Any, Any, Any, Any, Any]
+
+
+def compile_field_rule(field: str, rule: Any) -> Tuple[FieldRule, bool]:
+    """编译单个字段的规则，返回 (编译结果, 规则格式是否正确)"""
+    if not isinstance(rule, dict):
+        return (field, rule, None, None, None, None, None, None), False
+
+    well_formed = True
+    limits = []
+    for name in ('min_length', 'max_length', 'min_value', 'max_value'):
+        limit = rule.get(name) or None
+        if limit is not None and not isinstance(limit, (int, float)):
+            well_formed = False
+        limits.append(limit)
+    pattern = rule.get('pattern') or None
+    if pattern is not None:
+        try:
+            pattern = re.compile(pattern)
+        except (re.error, TypeError):
+            # 无效的正则在验证时再抛出原来的异常
+            well_formed = False
+    return (field, rule, rule.get('type'), *limits, pattern), well_formed
+
+
+class CompiledValidator:
+    """编译后的验证规则
+
+    规则格式正确时一次遍历完成类型检查和业务规则检查，两类结果分别收集后按原有顺序
+    （先类型、后业务规则）输出。规则格式有误（规则不是字典、限制不是数字、正则无效）时
+    按原有的两次遍历执行，保证抛出异常的位置和异常前已产生的结果不变。
+    """
+
+    __slots__ = ('fields', 'single_pass', '_cross_record', '_cross_record_error')
+
+    def __init__(self, validation_rules: Dict[str, Any]):
+        compiled = [compile_field_rule(field, rule) for field, rule in validation_rules.items()]
+        self.fields = tuple(field_rule for field_rule, _ in compiled)
+        self.single_pass = all(well_formed for _, well_formed in compiled)
+        self._cross_record: Tuple[CrossRecordRule, ...] = ()
+        self._cross_record_error: Optional[str] = None
+        try:
+            self._cross_record = compile_cross_record_rules(validation_rules)
+        except ValueError as e:
+            self._cross_record_error = str(e)
+
+    def cross_record_rules(self) -> Tuple[CrossRecordRule, ...]:
+        """跨记录规则（唯一性、引用），规则格式错误时抛出 ValueError"""
+        if self._cross_record_error is not None:
+            raise ValueError(self._cross_record_error)
+        return self._cross_record
+
+    def validate(self, payload: Dict[str, Any], validation_rules: Dict[str, Any],
+                 request: ProcessingRequest, source: str):
+        """按规则 ``validation_rules``（与编译时的规则相等）验证负载，错误和警告写入请求
+
+        消息中的限制值取自 ``validation_rules``，与逐条解释规则时的消息完全一致。
+        """
+        type_errors: List[str] = []
+        type_warnings: List[str] = []
+        rule_errors: List[str] = []
+        rule_warnings: List[str] = []
+        try:
+            if self.single_pass:
+                self._check(payload, validation_rules, True, True,
+                            type_errors, type_warnings, rule_errors, rule_warnings)
+            else:
+                self._check(payload, validation_rules, True, False,
+                            type_errors, type_warnings, rule_errors, rule_warnings)
+                self._check(payload, validation_rules, False, True,
+                            type_errors, type_warnings, rule_errors, rule_warnings)
+        finally:
+            for message in type_errors + rule_errors:
+                request.add_error(source, message)
+            for message in type_warnings + rule_warnings:
+                request.add_warning(source, message)
+
+    def _check(self, payload: Dict[str, Any], validation_rules: Dict[str, Any],
+               check_types: bool, check_rules: bool,
+               type_errors: List[str], type_warnings: List[str],
+               rule_errors: List[str], rule_warnings: List[str]):
+        for field, rule, field_type, min_length, max_length, min_value, max_value, pattern in self.fields:
+            if field not in payload:
+                continue
+            value = payload[field]
+
+            if check_types:
+                if not isinstance(rule, dict):
+                    # 与原有实现抛出相同的异常
+                    rule.get('type')
+                if field_type == 'string':
+                    if not isinstance(value, str):
+                        type_errors.append(f"字段 {field} 应为字符串类型")
+                elif field_type == 'number':
+                    if not isinstance(value, (int, float)):
+                        type_errors.append(f"字段 {field} 应为数字类型")
+                elif field_type == 'email':
+                    if not is_valid_email(value):
+                        type_errors.append(f"字段 {field} 不是有效的邮箱格式")
+                elif field_type == 'phone':
+                    if not is_valid_phone(value):
+                        type_warnings.append(f"字段 {field} 可能不是有效的电话号码格式")
+
+            if not check_rules:
+                continue
+
+            # 最小/最大长度检查
+            if min_length is not None or max_length is not None:
+                length = len(str(value))
+                if min_length is not None and length < min_length:
+                    rule_warnings.append(f"字段 {field} 长度不足最小要求 {validation_rules[field]['min_length']}")
+                if max_length is not None and length > max_length:
+                    rule_errors.append(f"字段 {field} 长度超过最大限制 {validation_rules[field]['max_length']}")
+
+            # 数值范围检查
+            if (min_value is not None or max_value is not None) and isinstance(value, (int, float)):
+                if min_value is not None and value < min_value:
+                    rule_errors.append(f"字段 {field} 值小于最小值 {validation_rules[field]['min_value']}")
+                if max_value is not None and value > max_value:
+                    rule_errors.append(f"字段 {field} 值大于最大值 {validation_rules[field]['max_value']}")
+
+            # 正则表达式验证
+            if pattern is not None:
+                if isinstance(pattern, str):
+                    matched = re.match(pattern, str(value))
+                else:
+                    matched = pattern.match(str(value))
+                if not matched:
+                    rule_errors.append(f"字段 {field} 不匹配所需格式")
+
+
+class ValidatorCache:
+    """编译后验证器的进程内 LRU 缓存
+
+    以字段名序列为键，同一组字段下保留最多 ``max_variants`` 套规则；命中要求规则与
+    缓存的规则快照相等（字典比较在 C 中完成，比序列化规则计算哈希快得多）。
+    数值相等的限制（如 1 和 1.0）共用同一个验证器，检查结果相同，消息取自当前规则。
+    """
+
+    def __init__(self, max_entries: int = VALIDATION_SCHEMA_CACHE_SIZE, max_variants: int = 8):
+        self.max_entries = max_entries
+        self.max_variants = max_variants
+        self._entries: 'OrderedDict[Tuple[str, ...], List[Tuple[Dict[str, Any], CompiledValidator]]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, validation_rules: Dict[str, Any]) -> CompiledValidator:
+        """获取规则对应的验证器，未命中时编译并缓存"""
+        if not isinstance(validation_rules, dict):
+            return CompiledValidator(validation_rules)
+        key = tuple(validation_rules)
+        with self._lock:
+            variants = self._entries.get(key)
+            if variants is not None:
+                self._entries.move_to_end(key)
+                for snapshot, validator in variants:
+                    if snapshot == validation_rules:
+                        self.hits += 1
+                        return validator
+
+        # 字段名不是字符串（JSON 请求体中不会出现）时不缓存，避免 1 和 1.0 这类相等的字段名共用验证器
+        if not all(type(field) is str for field in key):
+            return CompiledValidator(validation_rules)
+        try:
+            snapshot = copy.deepcopy(validation_rules)
+        except Exception:
+            return CompiledValidator(validation_rules)
+        validator = CompiledValidator(snapshot)
+        with self._lock:
+            self.misses += 1
+            variants = self._entries.setdefault(key, [])
+            self._entries.move_to_end(key)
+            variants.append((snapshot, validator))
+            if len(variants) > self.max_variants:
+                del variants[0]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return validator
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """缓存命中统计"""
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries),
+                'max_entries': self.max_entries}
+
+
+validator_cache = ValidatorCache()
+
+
+def get_validator(validation_rules: Dict[str, Any]) -> CompiledValidator:
+    """获取编译后的验证器（进程内共享缓存）"""
+    return validator_cache.get(validation_rules)
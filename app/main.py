@@ -7,6 +7,11 @@ import uuid
 
 from celery_app import celery_app
 from database import get_db, Task, User
+from chain_handlers import ChainProcessor, ProcessingRequest, RequestType
+from chain_registry import chain_registry
+from chain_stream import resolve_data_path
+from chain_metrics import profiler
+from chain_cache import get_result_cache
 import tasks
 
 app = FastAPI(
@@ -43,11 +48,20 @@ class ChainProcessingData(BaseModel):
     request_type: str  # "data_validation", "data_transformation", etc.
     data: dict
     metadata: Optional[dict] = {}
-    chain_type: str = "standard"  # "standard", "validation_only", "transform_export", "enrich_notify"
+    chain_type: str = "standard"  # 链定义中的链类型，见 GET /chain/definitions
 
 class BatchChainData(BaseModel):
     batch_requests: List[dict]
     chain_type: str = "standard"
+    debug: bool = False
+    data_quality: bool = False  # 在验证过程中统计整个批次的数据质量草图
+
+class StreamChainData(BaseModel):
+    input_path: str  # STREAM_DATA_DIR 内的 NDJSON 输入文件（worker 中的路径）
+    output_path: str  # STREAM_DATA_DIR 内的 NDJSON 输出文件
+    chain_type: str = "standard"
+    chunk_size: int = 100
+    data_quality: bool = False
 
 class DynamicChainData(BaseModel):
     request_type: str
@@ -70,9 +84,14 @@ async def root():
                 "submit_api_fetch_task": "/tasks/api-fetch"
             },
             "chain_tasks": {
+                "chain_definitions": "/chain/definitions",
                 "submit_chain_processing": "/chain/process",
                 "submit_batch_chain": "/chain/batch",
+                "submit_stream_chain": "/chain/stream",
                 "submit_dynamic_chain": "/chain/dynamic",
+                "execute_chain_inline": "/chain/execute",
+                "chain_profile": "/chain/profile",
+                "worker_chain_profile": "/chain/profile/worker",
                 "chain_demo": "/chain/demo"
             },
             "monitoring": {
@@ -331,9 +350,25 @@ async def run_concurrent_demo():
 # 责任链模式任务端点
 # ===============================
 
+def _check_chain_type(chain_type: str):
+    """入队前拒绝未定义的链类型"""
+    if not chain_registry.has_chain(chain_type):
+        raise HTTPException(
+            status_code=400,
+            detail=f"未知的链类型: {chain_type}，可用类型: {', '.join(chain_registry.chain_types())}"
+        )
+
+
+@app.get("/chain/definitions")
+async def get_chain_definitions():
+    """获取当前加载的链定义"""
+    return chain_registry.describe()
+
+
 @app.post("/chain/process")
 async def submit_chain_processing(data: ChainProcessingData):
     """提交责任链处理任务"""
+    _check_chain_type(data.chain_type)
     request_data = {
         'request_type': data.request_type,
         'data': data.data,
@@ -352,7 +387,9 @@ async def submit_chain_processing(data: ChainProcessingData):
 @app.post("/chain/batch")
 async def submit_batch_chain_processing(data: BatchChainData):
     """提交批量责任链处理任务"""
-    task = tasks.batch_chain_processing.delay(data.batch_requests, data.chain_type)
+    _check_chain_type(data.chain_type)
+    task = tasks.batch_chain_processing.delay(data.batch_requests, data.chain_type, data.debug,
+                                              data.data_quality)
     return {
         "task_id": task.id,
         "status": "submitted",
@@ -362,9 +399,39 @@ async def submit_batch_chain_processing(data: BatchChainData):
     }
 
 
+@app.post("/chain/stream")
+async def submit_stream_chain_processing(data: StreamChainData):
+    """提交流式责任链处理任务（NDJSON 文件输入/输出，内存占用与记录总数无关）"""
+    _check_chain_type(data.chain_type)
+    if data.chunk_size < 1:
+        raise HTTPException(status_code=400, detail="chunk_size 必须大于 0")
+    # 文件是否存在由 worker 检查，web 容器看不到 worker 的数据目录
+    try:
+        resolve_data_path(data.input_path)
+        resolve_data_path(data.output_path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    task = tasks.stream_chain_processing.delay(data.input_path, data.output_path,
+                                               data.chain_type, data.chunk_size, data.data_quality)
+    return {
+        "task_id": task.id,
+        "status": "submitted",
+        "message": "流式责任链处理任务已提交",
+        "chain_type": data.chain_type,
+        "input_path": data.input_path,
+        "output_path": data.output_path
+    }
+
+
 @app.post("/chain/dynamic")
 async def submit_dynamic_chain_assembly(data: DynamicChainData):
     """提交动态组装责任链任务"""
+    try:
+        chain_registry.validate_sequence(data.handler_sequence)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     request_data = {
         'request_type': data.request_type,
         'data': data.data,
@@ -381,6 +448,51 @@ async def submit_dynamic_chain_assembly(data: DynamicChainData):
     }
 
 
+@app.post("/chain/execute")
+async def execute_chain_inline(data: ChainProcessingData):
+    """在 API 进程的事件循环中直接执行责任链，同步处理器在线程中执行"""
+    _check_chain_type(data.chain_type)
+    try:
+        request_type = RequestType(data.request_type)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"未知的请求类型: {data.request_type}")
+    
+    processing_request = ProcessingRequest(
+        request_type=request_type,
+        data=data.data,
+        metadata=data.metadata or {}
+    )
+    processor = ChainProcessor(chain_registry.get_chain(data.chain_type),
+                               result_cache=get_result_cache(), cache_namespace=data.chain_type)
+    result = await processor.aprocess_request(processing_request)
+    
+    return {
+        "status": "completed",
+        "chain_type": data.chain_type,
+        "result": result
+    }
+
+
+@app.get("/chain/profile")
+async def get_chain_profile(reset: bool = False):
+    """获取 API 进程内（/chain/execute 执行）的处理器耗时分布和记忆化函数命中率"""
+    snapshot = profiler.snapshot()
+    if reset:
+        profiler.reset()
+    return snapshot
+
+
+@app.post("/chain/profile/worker")
+async def submit_worker_chain_profile(reset: bool = False):
+    """提交任务获取某个 worker 进程内的处理器耗时分布和记忆化函数命中率"""
+    task = tasks.chain_profile_snapshot.delay(reset)
+    return {
+        "task_id": task.id,
+        "status": "submitted",
+        "message": "worker 耗时分布快照任务已提交，使用 GET /tasks/{task_id}/result 获取结果"
+    }
+
+
 @app.post("/chain/demo")
 async def run_chain_demo():
     """运行责任链演示，提交多种类型的链式处理任务"""
@@ -0,0 +1,277 @@
+"""
+只读参考数据存储 - 离线构建的排序键文件，运行时以内存映射打开并二分查找
+
+每张参考表（国家、城市、邮政编码、公司）是 ``REFERENCE_DATA_DIR`` 下的一个 ``<表名>.ref`` 文件。
+文件在首次查询时以只读方式映射到内存，所有 prefork 子进程共享操作系统页缓存中的同一份数据，
+而不是各自持有一个字典；文件不存在时调用方使用内置的小字典。
+查询时（最多每 ``REFERENCE_DATA_RELOAD_INTERVAL`` 秒一次）检查文件是否被重新构建、新增或删除，
+变化后重新打开；``reference_fingerprint`` 给出当前已加载文件的指纹，供结果缓存区分参考数据版本。
+
+文件格式（整数均为小端）:
+    头部        魔数 ``REFSTOR1``、版本号 (uint32)、保留 (uint32)、记录数 n (uint64)
+    键偏移      n + 1 个 uint64，键区中每个键的起止位置
+    值偏移      n + 1 个 uint64，值区中每个值的起止位置
+    键区        按 UTF-8 字节序排序的键
+    值区        与键对应的 JSON 对象（UTF-8）
+
+复合键（如城市、邮政编码）用 ``|`` 连接，第一部分是负载中的国家名（与 countries 表的键相同），
+例如 ``USA|New York``、``USA|94043``。
+
+命令行用法（从 CSV 或 NDJSON 构建）:
+    python reference_store.py countries.csv reference_data/countries.ref --key name
+    python reference_store.py postal_codes.ndjson reference_data/postal_codes.ref --key country,postal_code
+    （postal_codes.ndjson 中的 country 为国家名，如 USA）
+"""
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import mmap
+import struct
+import logging
+import argparse
+import threading
+from array import array
+from itertools import accumulate
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_DATA_DIR = os.getenv("REFERENCE_DATA_DIR", "/app/reference_data")
+# 检查参考数据文件是否变化的最小间隔（秒），0 表示每次查询都检查
+REFERENCE_DATA_RELOAD_INTERVAL = float(os.getenv("REFERENCE_DATA_RELOAD_INTERVAL", "5"))
+
+MAGIC = b'REFSTOR1'
+VERSION = 1
+KEY_SEPARATOR = '|'
+
+_HEADER = struct.Struct('<8sIIQ')
+_OFFSET = struct.Struct('<Q')
+
+
+# 文件标识：(设备, inode, 修改时间, 大小)，重新构建（os.replace）后必然变化
+FileIdentity = Tuple[int, int, int, int]
+
+
+def _file_identity(stat: os.stat_result) -> FileIdentity:
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def reference_key(*parts: Any) -> str:
+    """复合键"""
+    return KEY_SEPARATOR.join(str(part) for part in parts)
+
+
+class ReferenceTable:
+    """内存映射的只读参考表"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.identity = _file_identity(os.fstat(f.fileno()))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count = (_HEADER.unpack_from(self._mmap, 0) if len(self._mmap) >= _HEADER.size
+                                    else (b'', 0, 0, 0))
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"不是有效的参考数据文件: {path}")
+        self.count = count
+        key_offsets = _HEADER.size
+        value_offsets = key_offsets + (count + 1) * _OFFSET.size
+        self._keys = value_offsets + (count + 1) * _OFFSET.size
+        self._view = memoryview(self._mmap)
+        if sys.byteorder == 'little':
+            # 偏移表直接按 uint64 数组读取
+            self._key_offsets = self._view[key_offsets:value_offsets].cast('Q')
+            self._value_offsets = self._view[value_offsets:self._keys].cast('Q')
+        else:
+            self._key_offsets = array('Q', self._view[key_offsets:value_offsets])
+            self._value_offsets = array('Q', self._view[value_offsets:self._keys])
+            self._key_offsets.byteswap()
+            self._value_offsets.byteswap()
+        self._values = self._keys + self._key_offsets[count]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _key(self, index: int) -> bytes:
+        offsets = self._key_offsets
+        return self._mmap[self._keys + offsets[index]:self._keys + offsets[index + 1]]
+
+    def _value(self, index: int) -> Dict[str, Any]:
+        offsets = self._value_offsets
+        return json.loads(self._mmap[self._values + offsets[index]:self._values + offsets[index + 1]])
+
+    def _find(self, key: str) -> int:
+        """二分查找键的序号，不存在时返回 -1"""
+        target = key.encode('utf-8')
+        data, base, offsets = self._mmap, self._keys, self._key_offsets
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if data[base + offsets[middle]:base + offsets[middle + 1]] < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._key(low) == target:
+            return low
+        return -1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """查询键对应的记录（每次返回新的字典），不存在时返回 None"""
+        index = self._find(key)
+        return self._value(index) if index >= 0 else None
+
+    def __contains__(self, key: str) -> bool:
+        return self._find(key) >= 0
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for index in range(self.count):
+            yield self._key(index).decode('utf-8'), self._value(index)
+
+    def close(self):
+        for view in (self._key_offsets, self._value_offsets, self._view):
+            if isinstance(view, memoryview):
+                view.release()
+        self._mmap.close()
+
+
+def build_reference_table(records: Iterable[Tuple[str, Dict[str, Any]]], path: str) -> int:
+    """把 (键, 记录) 写成参考数据文件，键重复时保留最后一条；返回记录数
+
+    先写入临时文件再替换，已打开旧文件的进程继续使用旧的映射。
+    """
+    entries: Dict[bytes, bytes] = {}
+    for key, record in records:
+        entries[key.encode('utf-8')] = json.dumps(record, ensure_ascii=False, sort_keys=True,
+                                                  default=str).encode('utf-8')
+    keys = sorted(entries)
+
+    values = [entries[key] for key in keys]
+
+    temporary = f"{path}.tmp.{os.getpid()}"
+    with open(temporary, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, len(keys)))
+        for blobs in (keys, values):
+            offsets = array('Q', accumulate(map(len, blobs), initial=0))
+            if sys.byteorder != 'little':
+                offsets.byteswap()
+            f.write(offsets.tobytes())
+        f.write(b''.join(keys))
+        f.write(b''.join(values))
+    os.replace(temporary, path)
+    return len(keys)
+
+
+class _TableSlot:
+    """一张参考表在当前进程中的状态"""
+
+    __slots__ = ('table', 'identity', 'next_check')
+
+    def __init__(self, table: Optional[ReferenceTable], identity: Optional[FileIdentity], next_check: float):
+        self.table = table
+        self.identity = identity      # 打开（或尝试打开）时的文件标识，文件不存在时为 None
+        self.next_check = next_check
+
+
+# 每个进程按需打开的参考表
+_tables: Dict[str, _TableSlot] = {}
+_tables_lock = threading.Lock()
+
+
+def _stat_identity(path: str) -> Optional[FileIdentity]:
+    try:
+        return _file_identity(os.stat(path))
+    except OSError:
+        return None
+
+
+def get_reference_table(name: str) -> Optional[ReferenceTable]:
+    """获取参考表，文件不存在或无法打开时返回 None
+
+    首次调用时打开 ``REFERENCE_DATA_DIR/<name>.ref``；之后每隔 ``REFERENCE_DATA_RELOAD_INTERVAL`` 秒
+    检查一次文件标识，文件被重新构建、新增或删除后重新打开。旧的映射在不再被引用后释放，
+    正在进行的查询不受影响。
+    """
+    slot = _tables.get(name)
+    now = time.monotonic()
+    if slot is not None and now < slot.next_check:
+        return slot.table
+
+    path = os.path.join(REFERENCE_DATA_DIR, f"{name}.ref")
+    identity = _stat_identity(path)
+    with _tables_lock:
+        slot = _tables.get(name)
+        if slot is not None and slot.identity == identity:
+            slot.next_check = now + REFERENCE_DATA_RELOAD_INTERVAL
+            return slot.table
+
+        table = None
+        if identity is not None:
+            try:
+                table = ReferenceTable(path)
+                identity = table.identity
+            except (OSError, ValueError) as e:
+                logger.error(f"无法打开参考数据文件 {path}，使用内置数据: {e}")
+        if slot is not None:
+            logger.info(f"参考数据文件已变化，重新加载: {path}")
+        _tables[name] = _TableSlot(table, identity, now + REFERENCE_DATA_RELOAD_INTERVAL)
+        return table
+
+
+def reference_fingerprint(names: Iterable[str]) -> str:
+    """已加载参考数据文件的指纹（文件标识和记录数的摘要），所有表都使用内置数据时为空字符串"""
+    loaded = []
+    for name in names:
+        table = get_reference_table(name)
+        if table is not None:
+            loaded.append(f"{name}:{':'.join(map(str, table.identity))}:{table.count}")
+    if not loaded:
+        return ''
+    return hashlib.sha256('|'.join(loaded).encode('utf-8')).hexdigest()[:16]
+
+
+class ReferenceData:
+    """参考表查询，参考数据文件不存在时使用内置字典（返回记录的副本）"""
+
+    def __init__(self, name: str, fallback: Dict[str, Dict[str, Any]]):
+        self.name = name
+        self.fallback = fallback
+
+    def get(self, key: Any) -> Optional[Dict[str, Any]]:
+        table = get_reference_table(self.name) if isinstance(key, str) else None
+        if table is None:
+            record = self.fallback.get(key)
+            return dict(record) if record is not None else None
+        return table.get(key)
+
+
+def _read_records(path: str, key_fields: Sequence[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """读取 CSV 或 NDJSON，记录去掉键字段后作为值"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        rows: Iterable[Dict[str, Any]]
+        if path.endswith('.csv'):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            key = reference_key(*(row[field] for field in key_fields))
+            yield key, {field: value for field, value in row.items() if field not in key_fields}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="构建只读参考数据文件")
+    parser.add_argument('input', help="输入文件（.csv 或 NDJSON）")
+    parser.add_argument('output', help="输出的 .ref 文件")
+    parser.add_argument('--key', required=True, help="键字段，多个字段用逗号分隔（组成复合键）")
+    args = parser.parse_args(argv)
+
+    count = build_reference_table(_read_records(args.input, args.key.split(',')), args.output)
+    print(f"已写入 {count} 条记录: {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,21 @@
+import os
 import time
 import random
 import requests
 from celery import current_task
+from celery.signals import worker_process_init
 from celery_app import celery_app
 from database import SessionLocal, Task, User
 from chain_handlers import (
-    ProcessingRequest, RequestType, ChainBuilder, ChainProcessor
+    ProcessingRequest, RequestType, ChainProcessor
 )
-# 导入新的模块化处理器
-from handlers.validation_handler import DataValidationHandler
-from handlers.transformation_handler import DataTransformationHandler
-from handlers.enrichment_handler import DataEnrichmentHandler
-from handlers.export_handler import DataExportHandler, ReportExportHandler
-from handlers.notification_handler import NotificationHandler, AlertHandler
+from chain_registry import chain_registry
+from chain_metrics import profiler
+from chain_cache import get_result_cache
+from chain_checkpoint import get_checkpoint
+from chain_stream import process_ndjson_file, resolve_data_path
+from data_sketches import DataQualityProfile
+from handlers.cross_record_validation import CrossRecordState
 
 
 @celery_app.task(bind=True, name="tasks.long_running_task")
@@ -306,6 +309,28 @@ def api_data_fetch(urls: list):
 # 责任链模式任务实现
 # ===============================
 
+# 批量任务中每次送入处理链的请求数量
+BATCH_CHUNK_SIZE = 100
+
+
+@worker_process_init.connect
+def compile_chain_definitions(**kwargs):
+    """worker 子进程启动时校验并编译所有链定义，定义无效时进程启动失败"""
+    chain_registry.load()
+    chain_registry.compile_all()
+
+
+def _start_task_record(db, task_id: str, task_name: str) -> Task:
+    """创建任务记录；任务重试或被重新投递时复用已有记录"""
+    task_record = db.query(Task).filter(Task.task_id == task_id).first()
+    if task_record is None:
+        task_record = Task(task_id=task_id, task_name=task_name)
+        db.add(task_record)
+    task_record.status = "RUNNING"
+    db.commit()
+    return task_record
+
+
 @celery_app.task(bind=True, name="tasks.chain_data_processing")
 def chain_data_processing(self, request_data: dict, chain_type: str = "standard"):
     """
@@ -317,13 +342,7 @@ def chain_data_processing(self, request_data: dict, chain_type: str = "standard"
     """
     db = SessionLocal()
     try:
-        task_record = Task(
-            task_id=self.request.id,
-            task_name="Chain Data Processing",
-            status="RUNNING"
-        )
-        db.add(task_record)
-        db.commit()
+        task_record = _start_task_record(db, self.request.id, "Chain Data Processing")
         
         # 创建处理请求
         request_type = RequestType(request_data.get('request_type', 'data_validation'))
@@ -333,23 +352,11 @@ def chain_data_processing(self, request_data: dict, chain_type: str = "standard"
             metadata=request_data.get('metadata', {})
         )
         
-        # 根据链类型构建处理链
-        if chain_type == "standard":
-            chain = ChainBuilder.build_standard_chain()
-        elif chain_type == "validation_only":
-            chain = DataValidationHandler()
-        elif chain_type == "transform_export":
-            handlers = [DataTransformationHandler(), DataExportHandler()]
-            chain = ChainBuilder.build_custom_chain(handlers)
-        elif chain_type == "enrich_notify":
-            handlers = [DataEnrichmentHandler(), NotificationHandler()]
-            chain = ChainBuilder.build_custom_chain(handlers)
-        else:
-            # 自定义链
-            chain = ChainBuilder.build_standard_chain()
+        # 根据链类型获取处理链（worker 进程内缓存，未知类型使用标准链）
+        chain = chain_registry.get_chain(chain_type)
         
         # 创建处理器并执行
-        processor = ChainProcessor(chain)
+        processor = ChainProcessor(chain, result_cache=get_result_cache(), cache_namespace=chain_type)
         
         # 更新任务进度
         current_task.update_state(
@@ -357,8 +364,8 @@ def chain_data_processing(self, request_data: dict, chain_type: str = "standard"
             meta={"current": 1, "total": 3, "progress": 33, "status": "初始化处理链"}
         )
         
-        # 执行处理链
-        result = processor.process_request(processing_request)
+        # 执行处理链（启用检查点时，重试或重新投递的任务从上次完成的阶段继续）
+        result = processor.process_request(processing_request, checkpoint=get_checkpoint(self.request.id))
         
         # 更新任务进度
         current_task.update_state(
@@ -373,6 +380,10 @@ def chain_data_processing(self, request_data: dict, chain_type: str = "standard"
             'celery_worker': current_task.request.hostname
         }
         
+        # 调试模式下附加 worker 进程内的处理器耗时分布
+        if processing_request.metadata.get('debug'):
+            result['profile'] = profiler.snapshot()
+        
         # 更新数据库
         task_record.status = "SUCCESS"
         task_record.result = str(result)
@@ -396,13 +407,16 @@ def chain_data_processing(self, request_data: dict, chain_type: str = "standard"
 
 
 @celery_app.task(bind=True, name="tasks.batch_chain_processing")
-def batch_chain_processing(self, batch_requests: list, chain_type: str = "standard"):
+def batch_chain_processing(self, batch_requests: list, chain_type: str = "standard", debug: bool = False,
+                           data_quality: bool = False):
     """
     批量责任链处理任务
     
     Args:
         batch_requests: 批量请求列表
         chain_type: 链类型
+        debug: 是否在结果中附加处理器耗时分布
+        data_quality: 是否在验证过程中统计整个批次的数据质量草图（附加到结果的 data_quality）
     """
     db = SessionLocal()
     try:
@@ -415,52 +429,63 @@ def batch_chain_processing(self, batch_requests: list, chain_type: str = "standa
         db.commit()
         
         total_requests = len(batch_requests)
-        processed_results = []
-        
-        # 构建处理链
-        if chain_type == "standard":
-            chain = ChainBuilder.build_standard_chain()
-        else:
-            chain = ChainBuilder.build_standard_chain()
-        
-        processor = ChainProcessor(chain)
-        
-        for i, request_data in enumerate(batch_requests):
-            try:
-                # 创建处理请求
-                request_type = RequestType(request_data.get('request_type', 'data_validation'))
-                processing_request = ProcessingRequest(
-                    request_type=request_type,
-                    data=request_data.get('data', {}),
-                    metadata=request_data.get('metadata', {})
-                )
-                
-                # 执行处理
-                result = processor.process_request(processing_request)
-                result['batch_index'] = i
-                processed_results.append(result)
-                
-                # 更新进度
-                progress = int((i + 1) / total_requests * 100)
-                current_task.update_state(
-                    state="PROGRESS",
-                    meta={
-                        "current": i + 1,
-                        "total": total_requests,
-                        "progress": progress,
-                        "status": f"处理第 {i + 1}/{total_requests} 个请求"
+        processed_results = [None] * total_requests
+        
+        # 获取处理链（worker 进程内缓存）
+        processor = ChainProcessor(chain_registry.get_chain(chain_type),
+                                   result_cache=get_result_cache(), cache_namespace=chain_type)
+        quality_profile = DataQualityProfile() if data_quality else None
+        # 唯一性规则在整个批次内检查，而不只是在块内检查
+        cross_record_state = CrossRecordState()
+        
+        # 按块处理，每个处理阶段一次接收整块请求
+        for chunk_start in range(0, total_requests, BATCH_CHUNK_SIZE):
+            chunk_end = min(chunk_start + BATCH_CHUNK_SIZE, total_requests)
+            chunk_requests = []
+            chunk_indexes = []
+            
+            for i in range(chunk_start, chunk_end):
+                request_data = batch_requests[i]
+                try:
+                    # 创建处理请求
+                    request_type = RequestType(request_data.get('request_type', 'data_validation'))
+                    request = ProcessingRequest(
+                        request_type=request_type,
+                        data=request_data.get('data', {}),
+                        metadata=request_data.get('metadata', {})
+                    )
+                    request.quality_profile = quality_profile
+                    request.cross_record_state = cross_record_state
+                    chunk_requests.append(request)
+                    chunk_indexes.append(i)
+                except Exception as e:
+                    processed_results[i] = {
+                        'batch_index': i,
+                        'error': str(e),
+                        'success': False
                     }
-                )
-                
-                # 模拟处理间隔
-                time.sleep(0.1)
-                
+            
+            # 执行处理
+            try:
+                chunk_results = processor.process_batch_requests(chunk_requests)
             except Exception as e:
-                processed_results.append({
-                    'batch_index': i,
-                    'error': str(e),
-                    'success': False
-                })
+                chunk_results = [{'error': str(e), 'success': False} for _ in chunk_requests]
+            
+            for i, result in zip(chunk_indexes, chunk_results):
+                result['batch_index'] = i
+                processed_results[i] = result
+            
+            # 更新进度
+            progress = int(chunk_end / total_requests * 100)
+            current_task.update_state(
+                state="PROGRESS",
+                meta={
+                    "current": chunk_end,
+                    "total": total_requests,
+                    "progress": progress,
+                    "status": f"处理第 {chunk_end}/{total_requests} 个请求"
+                }
+            )
         
         # 生成批量处理结果
         batch_result = {
@@ -476,6 +501,11 @@ def batch_chain_processing(self, batch_requests: list, chain_type: str = "standa
             }
         }
         
+        if debug:
+            batch_result['profile'] = profiler.snapshot()
+        if quality_profile is not None:
+            batch_result['data_quality'] = quality_profile.to_dict()
+        
         # 更新数据库
         task_record.status = "SUCCESS"
         task_record.result = str(batch_result)
@@ -492,6 +522,56 @@ def batch_chain_processing(self, batch_requests: list, chain_type: str = "standa
         db.close()
 
 
+@celery_app.task(bind=True, name="tasks.stream_chain_processing")
+def stream_chain_processing(self, input_path: str, output_path: str, chain_type: str = "standard",
+                            chunk_size: int = BATCH_CHUNK_SIZE, data_quality: bool = False):
+    """
+    流式责任链处理任务：逐行读取 NDJSON 输入文件，结果逐行写入 NDJSON 输出文件
+    
+    Args:
+        input_path: 输入 NDJSON 文件路径（每行一个请求，格式与 batch_requests 的元素相同），必须位于 STREAM_DATA_DIR 内
+        output_path: 输出 NDJSON 文件路径，必须位于 STREAM_DATA_DIR 内
+        chain_type: 链类型
+        chunk_size: 每次送入处理链的记录数
+        data_quality: 是否在验证过程中统计数据质量草图（附加到摘要的 data_quality）
+    """
+    db = SessionLocal()
+    try:
+        task_record = _start_task_record(db, self.request.id, "Stream Chain Processing")
+        
+        # 只在 worker 中检查文件：web 和 worker 容器看到的文件系统不同
+        input_path = resolve_data_path(input_path)
+        output_path = resolve_data_path(output_path)
+        if not os.path.isfile(input_path):
+            raise ValueError(f"输入文件不存在: {input_path}")
+        if output_path == input_path:
+            raise ValueError("输出文件不能与输入文件相同")
+        
+        def report_progress(count: int):
+            current_task.update_state(
+                state="PROGRESS",
+                meta={"current": count, "status": f"已处理 {count} 条记录"}
+            )
+        
+        summary = process_ndjson_file(input_path, output_path, chain_type, chunk_size,
+                                      progress=report_progress, data_quality=data_quality)
+        summary['chain_type'] = chain_type
+        
+        task_record.status = "SUCCESS"
+        task_record.result = str(summary)
+        db.commit()
+        
+        return summary
+        
+    except Exception as e:
+        task_record.status = "FAILURE"
+        task_record.result = str(e)
+        db.commit()
+        raise e
+    finally:
+        db.close()
+
+
 @celery_app.task(bind=True, name="tasks.dynamic_chain_assembly")
 def dynamic_chain_assembly(self, request_data: dict, handler_sequence: list):
     """
@@ -503,13 +583,7 @@ def dynamic_chain_assembly(self, request_data: dict, handler_sequence: list):
     """
     db = SessionLocal()
     try:
-        task_record = Task(
-            task_id=self.request.id,
-            task_name="Dynamic Chain Assembly",
-            status="RUNNING"
-        )
-        db.add(task_record)
-        db.commit()
+        task_record = _start_task_record(db, self.request.id, "Dynamic Chain Assembly")
         
         # 创建处理请求
         request_type = RequestType(request_data.get('request_type', 'data_validation'))
@@ -519,27 +593,11 @@ def dynamic_chain_assembly(self, request_data: dict, handler_sequence: list):
             metadata=request_data.get('metadata', {})
         )
         
-        # 动态创建处理器
-        handler_map = {
-            'validation': DataValidationHandler(),
-            'transformation': DataTransformationHandler(),
-            'enrichment': DataEnrichmentHandler(),
-            'export': DataExportHandler(),
-            'notification': NotificationHandler()
-        }
-        
-        # 根据序列构建处理器链
-        handlers = []
-        for handler_name in handler_sequence:
-            if handler_name in handler_map:
-                handlers.append(handler_map[handler_name])
-        
-        if not handlers:
-            raise ValueError("没有有效的处理器序列")
-        
-        # 构建自定义链
-        chain = ChainBuilder.build_custom_chain(handlers)
-        processor = ChainProcessor(chain)
+        # 根据序列获取处理器链（按序列缓存，未知的处理器名称被忽略）
+        chain = chain_registry.get_sequence_chain(handler_sequence)
+        handlers = chain.handlers
+        processor = ChainProcessor(chain, result_cache=get_result_cache(),
+                                   cache_namespace='sequence:' + ','.join(handler.name for handler in handlers))
         
         # 更新进度
         current_task.update_state(
@@ -552,8 +610,8 @@ def dynamic_chain_assembly(self, request_data: dict, handler_sequence: list):
             }
         )
         
-        # 执行处理链
-        result = processor.process_request(processing_request)
+        # 执行处理链（启用检查点时，重试或重新投递的任务从上次完成的阶段继续）
+        result = processor.process_request(processing_request, checkpoint=get_checkpoint(self.request.id))
         
         # 添加动态链信息
         result['dynamic_chain_info'] = {
@@ -562,6 +620,9 @@ def dynamic_chain_assembly(self, request_data: dict, handler_sequence: list):
             'task_id': self.request.id
         }
         
+        if processing_request.metadata.get('debug'):
+            result['profile'] = profiler.snapshot()
+        
         # 更新数据库
         task_record.status = "SUCCESS"
         task_record.result = str(result)
@@ -587,3 +648,18 @@ def dynamic_chain_assembly(self, request_data: dict, handler_sequence: list):
         raise e
     finally:
         db.close()
+
+
+@celery_app.task(name="tasks.chain_profile_snapshot")
+def chain_profile_snapshot(reset: bool = False):
+    """
+    获取执行该任务的 worker 进程内的责任链耗时分布和记忆化函数命中率
+    
+    Args:
+        reset: 获取后是否清空统计数据
+    """
+    snapshot = profiler.snapshot()
+    snapshot['worker'] = current_task.request.hostname
+    if reset:
+        profiler.reset()
+    return snapshot
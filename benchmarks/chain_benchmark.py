@@ -0,0 +1,223 @@
+"""
+责任链基准测试 - 在进程内构建责任链，用合成负载测量吞吐量和各处理器的耗时分布
+
+不依赖 RabbitMQ、MySQL 或 Redis。默认使用 zero 耗时模型去掉处理器中的模拟耗时，
+只测量实际的处理开销；容量测试可以用 --latency-mode replay --latency-file 回放记录的耗时。
+
+用法:
+    python benchmarks/chain_benchmark.py --chains standard,standard_parallel --requests 500
+    python benchmarks/chain_benchmark.py --output baseline.json
+    python benchmarks/chain_benchmark.py --baseline baseline.json --threshold 0.1 --fail-on-regression
+"""
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+from typing import Any, Dict, List, Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARK_DIR), 'app'))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from handlers import ProcessingRequest, RequestType  # noqa: E402
+from handlers.latency import LATENCY_MODES, LatencyModel, set_latency_model  # noqa: E402
+from chain_handlers import ChainProcessor  # noqa: E402
+from chain_registry import chain_registry  # noqa: E402
+from chain_metrics import LatencyHistogram, profiler  # noqa: E402
+from payloads import REQUEST_TYPES, PayloadShape, generate_requests  # noqa: E402
+
+MODES = ('single', 'batch')
+
+
+def _to_processing_requests(requests: List[Dict[str, Any]]) -> List[ProcessingRequest]:
+    """每轮都重新构建请求，处理器会修改 request.data"""
+    return [
+        ProcessingRequest(
+            request_type=RequestType(request['request_type']),
+            data=json.loads(json.dumps(request['data'])),
+            metadata=dict(request['metadata'])
+        )
+        for request in requests
+    ]
+
+
+def run_scenario(chain_type: str, mode: str, requests: List[Dict[str, Any]],
+                 batch_size: int, warmup: int) -> Dict[str, Any]:
+    """运行一个场景（链类型 + 执行方式），返回吞吐量、请求耗时分布和各处理器耗时分布"""
+    processor = ChainProcessor(chain_registry.get_chain(chain_type), cache_namespace=chain_type)
+
+    warmup_requests = _to_processing_requests(requests[:warmup])
+    for request in warmup_requests:
+        processor.process_request(request)
+    profiler.reset()
+
+    latency = LatencyHistogram()
+    pending = _to_processing_requests(requests)
+    results: List[Dict[str, Any]] = []
+    start = time.perf_counter()
+    if mode == 'single':
+        for request in pending:
+            request_start = time.perf_counter()
+            results.append(processor.process_request(request))
+            latency.record(time.perf_counter() - request_start)
+    else:
+        for chunk_start in range(0, len(pending), batch_size):
+            chunk = pending[chunk_start:chunk_start + batch_size]
+            chunk_start_time = time.perf_counter()
+            results.extend(processor.process_batch_requests(chunk))
+            # 批量模式下记录每个块的耗时
+            latency.record(time.perf_counter() - chunk_start_time)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'chain_type': chain_type,
+        'mode': mode,
+        'requests': len(pending),
+        'batch_size': batch_size if mode == 'batch' else 1,
+        'elapsed_s': elapsed,
+        'throughput_rps': len(pending) / elapsed if elapsed else 0.0,
+        'failed_requests': sum(1 for result in results if not result['success']),
+        'latency': latency.snapshot(),
+        'handlers': profiler.snapshot()['handlers']
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+            min_delta_ms: float = 0.05) -> List[str]:
+    """与基线比较，返回回归项
+
+    吞吐量下降超过阈值，或处理器墙钟耗时 p50 上升超过阈值且绝对增量超过
+    ``min_delta_ms``（避免亚毫秒级抖动误报）时视为回归。
+    """
+    regressions: List[str] = []
+    for name, scenario in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            print(f"  {name}: 基线中没有该场景")
+            continue
+
+        ratio = scenario['throughput_rps'] / base['throughput_rps'] if base['throughput_rps'] else 1.0
+        print(f"  {name}: 吞吐量 {base['throughput_rps']:.1f} -> {scenario['throughput_rps']:.1f} req/s "
+              f"({(ratio - 1) * 100:+.1f}%)")
+        if ratio < 1 - threshold:
+            regressions.append(f"{name} 吞吐量下降 {(1 - ratio) * 100:.1f}%")
+
+        for handler_name, request_types in scenario['handlers'].items():
+            for request_type, timings in request_types.items():
+                base_wall = base.get('handlers', {}).get(handler_name, {}).get(request_type, {}).get('wall', {})
+                if not base_wall.get('count') or not timings['wall'].get('count'):
+                    continue
+                before, after = base_wall['p50_ms'], timings['wall']['p50_ms']
+                if before and after > before * (1 + threshold) and after - before > min_delta_ms:
+                    regressions.append(f"{name} {handler_name}[{request_type}] p50 "
+                                       f"{before:.3f} -> {after:.3f} ms")
+    return regressions
+
+
+def print_report(results: Dict[str, Any]):
+    """打印结果摘要"""
+    for name, scenario in results['scenarios'].items():
+        latency = scenario['latency']
+        print(f"{name}: {scenario['throughput_rps']:.1f} req/s, "
+              f"p50 {latency.get('p50_ms', 0):.3f} ms, p99 {latency.get('p99_ms', 0):.3f} ms, "
+              f"失败 {scenario['failed_requests']}/{scenario['requests']}")
+        for handler_name, request_types in scenario['handlers'].items():
+            for request_type, timings in request_types.items():
+                wall, cpu = timings['wall'], timings['cpu']
+                print(f"    {handler_name:<28} {request_type:<20} n={wall['count']:<6} "
+                      f"p50 {wall['p50_ms']:.3f} ms  p99 {wall['p99_ms']:.3f} ms  "
+                      f"cpu p50 {cpu['p50_ms']:.3f} ms")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="责任链基准测试")
+    parser.add_argument('--chains', default='standard', help="逗号分隔的链类型")
+    parser.add_argument('--modes', default='single,batch', help="逗号分隔的执行方式: single, batch")
+    parser.add_argument('--request-types', default=','.join(REQUEST_TYPES), help="逗号分隔的请求类型")
+    parser.add_argument('--requests', type=int, default=500, help="每个场景的请求数")
+    parser.add_argument('--batch-size', type=int, default=100, help="批量模式的块大小")
+    parser.add_argument('--warmup', type=int, default=20, help="预热请求数")
+    parser.add_argument('--extra-fields', type=int, default=10, help="负载的附加字段数")
+    parser.add_argument('--string-length', type=int, default=16, help="附加字符串字段长度")
+    parser.add_argument('--nested-depth', type=int, default=0, help="嵌套对象深度")
+    parser.add_argument('--list-length', type=int, default=0, help="列表字段长度")
+    parser.add_argument('--invalid-rate', type=float, default=0.0, help="无效数据比例")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--latency-mode', default='zero', choices=LATENCY_MODES, help="模拟耗时模式")
+    parser.add_argument('--latency-file', help="distribution/replay 模式的耗时记录 JSON 文件")
+    parser.add_argument('--output', help="结果 JSON 文件")
+    parser.add_argument('--baseline', help="用于比较的基线结果 JSON 文件")
+    parser.add_argument('--threshold', type=float, default=0.1, help="回归阈值（比例）")
+    parser.add_argument('--min-delta-ms', type=float, default=0.05, help="处理器耗时回归的最小绝对增量（毫秒）")
+    parser.add_argument('--fail-on-regression', action='store_true', help="存在回归时以状态码 1 退出")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.disable(logging.INFO)
+
+    shape = PayloadShape(extra_fields=args.extra_fields, string_length=args.string_length,
+                         nested_depth=args.nested_depth, list_length=args.list_length,
+                         invalid_rate=args.invalid_rate)
+    request_types = [name for name in args.request_types.split(',') if name]
+    requests = generate_requests(args.requests, shape, request_types, args.seed)
+
+    chain_types = [name for name in args.chains.split(',') if name]
+    unknown = [name for name in chain_types if not chain_registry.has_chain(name)]
+    if unknown:
+        print(f"未知的链类型: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    results: Dict[str, Any] = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'latency_mode': args.latency_mode,
+            'latency_file': args.latency_file,
+            'shape': shape.to_dict(),
+            'request_types': request_types,
+            'seed': args.seed
+        },
+        'scenarios': {}
+    }
+
+    if args.latency_file:
+        set_latency_model(LatencyModel.from_file(args.latency_file, args.latency_mode, seed=args.seed))
+    else:
+        set_latency_model(LatencyModel(args.latency_mode, seed=args.seed))
+
+    for chain_type in chain_types:
+        for mode in args.modes.split(','):
+            if mode not in MODES:
+                print(f"未知的执行方式: {mode}", file=sys.stderr)
+                return 2
+            results['scenarios'][f"{chain_type}/{mode}"] = run_scenario(
+                chain_type, mode, requests, args.batch_size, args.warmup)
+
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"与基线 {args.baseline} 比较:")
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        for regression in regressions:
+            print(f"  回归: {regression}")
+        if regressions and args.fail_on_regression:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
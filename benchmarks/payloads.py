@@ -0,0 +1,152 @@
+"""
+基准测试的合成负载生成器 - 按可配置的大小和结构生成责任链请求
+"""
+import random
+import string
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+# 默认轮流生成的请求类型
+REQUEST_TYPES = (
+    'data_validation',
+    'data_transformation',
+    'data_enrichment',
+    'data_export',
+    'notification'
+)
+
+COUNTRIES = ('China', 'USA', 'Japan', 'UK', 'Germany', 'France', 'Canada', 'Australia')
+CITIES = ('Beijing', 'Shanghai', 'New York', 'London', 'Tokyo', 'Paris', 'Berlin', 'Sydney')
+DEPARTMENTS = ('Engineering', 'Sales', 'Marketing', 'Finance', 'Support')
+FIRST_NAMES = ('Alice', 'Bob', 'Carol', 'David', 'Emma', 'Frank', 'Grace', 'Henry')
+LAST_NAMES = ('Smith', 'Johnson', 'Brown', 'Wang', 'Li', 'Tanaka', 'Müller', 'Martin')
+EMAIL_DOMAINS = ('gmail.com', 'outlook.com', 'example.com', 'company.cn', 'qq.com')
+TRANSFORMS = ('uppercase', 'lowercase', 'strip', 'title_case', 'remove_spaces', 'extract_numbers')
+
+
+class PayloadShape:
+    """负载的大小和结构
+
+    Args:
+        extra_fields: 基础字段之外的附加字段数量（字符串和数字交替）
+        string_length: 附加字符串字段的长度
+        nested_depth: 嵌套对象 ``attributes`` 的深度，0 表示不生成
+        list_length: 列表字段 ``tags`` 的长度，0 表示不生成
+        invalid_rate: 生成无效值（错误的邮箱、超长字符串）的比例
+    """
+
+    def __init__(self, extra_fields: int = 0, string_length: int = 16, nested_depth: int = 0,
+                 list_length: int = 0, invalid_rate: float = 0.0):
+        self.extra_fields = extra_fields
+        self.string_length = string_length
+        self.nested_depth = nested_depth
+        self.list_length = list_length
+        self.invalid_rate = invalid_rate
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class PayloadGenerator:
+    """按固定随机种子生成可复现的请求"""
+
+    def __init__(self, shape: Optional[PayloadShape] = None, seed: int = 42):
+        self.shape = shape or PayloadShape()
+        self.random = random.Random(seed)
+
+    def _text(self, length: int) -> str:
+        return ''.join(self.random.choice(string.ascii_letters + ' ') for _ in range(length))
+
+    def _nested(self, depth: int) -> Dict[str, Any]:
+        node: Dict[str, Any] = {'value': self.random.randint(0, 1000), 'label': self._text(8)}
+        if depth > 1:
+            node['child'] = self._nested(depth - 1)
+        return node
+
+    def payload(self, index: int) -> Dict[str, Any]:
+        """生成用户记录负载"""
+        first_name = self.random.choice(FIRST_NAMES)
+        last_name = self.random.choice(LAST_NAMES)
+        invalid = self.random.random() < self.shape.invalid_rate
+        local_part = f"{first_name}.{last_name}".encode('ascii', 'ignore').decode('ascii').lower()
+        payload: Dict[str, Any] = {
+            'user_id': index,
+            'first_name': first_name,
+            'last_name': last_name,
+            'name': f"  {first_name} {last_name}  ",
+            'age': self.random.randint(18, 80),
+            'email': local_part if invalid else f"{local_part}{index}@{self.random.choice(EMAIL_DOMAINS)}",
+            'phone': f"+1-{self.random.randint(200, 999)}-{self.random.randint(200, 999)}-"
+                     f"{self.random.randint(1000, 9999)}",
+            'country': self.random.choice(COUNTRIES),
+            'city': self.random.choice(CITIES),
+            'postal_code': f"{self.random.randint(10000, 99999)}",
+            'department': self.random.choice(DEPARTMENTS),
+            'salary': self.random.randint(3000, 50000)
+        }
+        for i in range(self.shape.extra_fields):
+            if i % 2:
+                payload[f'metric_{i}'] = round(self.random.uniform(0, 1000), 3)
+            else:
+                payload[f'field_{i}'] = self._text(self.shape.string_length * (4 if invalid else 1))
+        if self.shape.nested_depth:
+            payload['attributes'] = self._nested(self.shape.nested_depth)
+        if self.shape.list_length:
+            payload['tags'] = [self._text(6) for _ in range(self.shape.list_length)]
+        return payload
+
+    def validation_rules(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        rules: Dict[str, Any] = {
+            'name': {'type': 'string', 'min_length': 2, 'max_length': 64},
+            'age': {'type': 'number', 'min_value': 18, 'max_value': 120},
+            'email': {'type': 'email'},
+            'phone': {'type': 'phone'},
+            'postal_code': {'type': 'string', 'pattern': r'^\d{5}$'}
+        }
+        for field in payload:
+            if field.startswith('field_'):
+                rules[field] = {'type': 'string', 'max_length': self.shape.string_length * 2}
+            elif field.startswith('metric_'):
+                rules[field] = {'type': 'number', 'min_value': 0, 'max_value': 1000}
+        return rules
+
+    def transformations(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        transformations: Dict[str, Any] = {
+            'name': 'strip',
+            'department': 'lowercase',
+            'phone': 'extract_numbers',
+            'salary': 'multiply_1.1'
+        }
+        for field in payload:
+            if field.startswith('field_'):
+                transformations[field] = self.random.choice(TRANSFORMS)
+            elif field.startswith('metric_'):
+                transformations[field] = 'round_1'
+        return transformations
+
+    def request(self, request_type: str, index: int) -> Dict[str, Any]:
+        """生成一个请求（格式与 chain_data_processing 的 request_data 相同）"""
+        payload = self.payload(index)
+        data: Dict[str, Any] = {'payload': payload}
+        if request_type == 'data_validation':
+            data['required_fields'] = ['user_id', 'name', 'email']
+            data['validation_rules'] = self.validation_rules(payload)
+        elif request_type == 'data_transformation':
+            data['transformations'] = self.transformations(payload)
+        elif request_type == 'data_export':
+            data['export_config'] = {'format': self.random.choice(('json', 'csv', 'xml')),
+                                     'source': 'payload'}
+        elif request_type == 'notification':
+            data['notification_config'] = {'type': 'info', 'channels': ['email', 'slack'],
+                                           'recipients': [payload['email']]}
+        return {'request_type': request_type, 'data': data, 'metadata': {'benchmark': True}}
+
+    def requests(self, count: int, request_types: Sequence[str] = REQUEST_TYPES) -> Iterator[Dict[str, Any]]:
+        """按请求类型轮流生成请求"""
+        for index in range(count):
+            yield self.request(request_types[index % len(request_types)], index)
+
+
+def generate_requests(count: int, shape: Optional[PayloadShape] = None,
+                      request_types: Sequence[str] = REQUEST_TYPES, seed: int = 42) -> List[Dict[str, Any]]:
+    """生成请求列表"""
+    return list(PayloadGenerator(shape, seed).requests(count, request_types))